@@ -0,0 +1,91 @@
+from collections import namedtuple
+
+# ========== РЕЕСТР ДОСТИЖЕНИЙ ==========
+# У достижения постоянный id, а бит в маске игрока — его позиция в реестре.
+# Порядок — формат на диске: новые достижения добавлять только в конец.
+# title и condition — строка на экране достижений; без title достижение
+# на экране не показывается (выдаётся только событием).
+Achievement = namedtuple("Achievement", ["id", "bit", "name", "title", "condition"])
+
+_REGISTRY = (
+    ("golden_employee", "Золотой сотрудник", None, None),
+    ("true_friend", "Настоящий друг", "🤝 Настоящий друг", "Получить помощь друга"),
+    ("super_parent", "Суперродитель", "👨‍👩‍👧‍👦 Суперродитель", "Семья 8+ очков"),
+    ("speed_record", "Скоростной рекорд", "⚡ Скоростной рекорд", "Успеть на пару до 18:00"),
+    ("perfect_balance", "Идеальный баланс", "🎯 Идеальный баланс", "Получить 5/5 целей за день"),
+    ("careerist", "Карьерист", "💼 Карьерист", "Карьера 8+ очков"),
+    ("energizer", "Энерджайзер", "⚡ Энерджайзер", "Энергия 8+ очков"),
+    ("handyman", "Мастер на все руки", "🔧 Мастер на все руки", "Навыки 8+ очков"),
+    ("champion", "Абсолютный чемпион", "🚀 Абсолютный чемпион", "Все показатели 8+ одновременно"),
+    ("perfect_partner", "Идеальный партнер", "❤️ Идеальный партнер", "Не обижать партнера 3 дня подряд"),
+    ("innovator", "Инноватор", "💡 Инноватор", "Открыть 3+ лайфхака"),
+    ("time_manager", "Тайм-менеджер", "🕰️ Тайм-менеджер", "Ни разу не опоздать за 5 дней"),
+    ("financier", "Финансист", "💰 Финансист", "Нанимать помощника 3 дня подряд"),
+)
+
+ACHIEVEMENTS = tuple(
+    Achievement(achievement_id, 1 << position, name, title, condition)
+    for position, (achievement_id, name, title, condition) in enumerate(_REGISTRY)
+)
+BY_ID = {a.id: a for a in ACHIEVEMENTS}
+
+# Порядок строк на экране достижений
+DISPLAY_ORDER = tuple(BY_ID[i] for i in (
+    "perfect_balance", "speed_record", "careerist", "super_parent", "perfect_partner", "handyman",
+    "innovator", "true_friend", "time_manager", "energizer", "financier", "champion",
+))
+DISPLAY_MASK = sum(a.bit for a in DISPLAY_ORDER)
+
+def count(mask):
+    return mask.bit_count()
+
+def unlocked(mask):
+    return [a for a in ACHIEVEMENTS if mask & a.bit]
+
+# ========== ПРАВИЛА ВЫДАЧИ ==========
+# watch — факты, при изменении которых правило стоит проверить;
+# check(state, day) — условие, day — итоги дня или None вне итогов.
+Rule = namedtuple("Rule", ["achievement", "watch", "check"])
+
+class RuleSet:
+    """Правила, разложенные по фактам, от которых они зависят.
+
+    unlock(state, facts) проверяет только правила, следящие за этими фактами,
+    и только для ещё не полученных достижений — полученные отсекаются одной
+    операцией над маской.
+    """
+
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        self._by_fact = {}
+        for rule in self.rules:
+            if rule.achievement not in BY_ID:
+                raise ValueError(f"Правило для неизвестного достижения {rule.achievement!r}")
+            for fact in rule.watch:
+                self._by_fact.setdefault(fact, []).append(rule)
+        self._plans = {}
+
+    def _plan(self, facts):
+        # Набор фактов у каждой точки вызова постоянный — план собирается один раз
+        plan = self._plans.get(facts)
+        if plan is None:
+            seen, plan = set(), []
+            for fact in facts:
+                for rule in self._by_fact.get(fact, ()):
+                    if id(rule) not in seen:
+                        seen.add(id(rule))
+                        plan.append((BY_ID[rule.achievement], rule.check))
+            plan = self._plans[facts] = (tuple(plan), sum({a.bit for a, _ in plan}))
+        return plan
+
+    def unlock(self, state, facts, day=None):
+        """Выдаёт заработанные достижения; возвращает список новых"""
+        plan, bits = self._plan(facts)
+        if not bits & ~state.achievements:
+            return []
+        new = []
+        for achievement, check in plan:
+            if not state.achievements & achievement.bit and check(state, day):
+                state.achievements |= achievement.bit
+                new.append(achievement)
+        return new
@@ -0,0 +1,207 @@
+"""Потоковая аналитика партий: выбор игроков по типам дня, воронка сцен, опоздания.
+
+Обработчики кладут короткие записи в ограниченную очередь и не ждут ничего:
+если очередь полна, запись отбрасывается и считается. Фоновая задача сводит
+записи в счётчики и раз в flush_interval дописывает приращения за окно в CSV
+(файлы ротируются по размеру, старые удаляются).
+
+Сводка по накопленным файлам:
+
+    python analytics.py analytics/
+"""
+import os
+import csv
+import sys
+import time
+import asyncio
+import logging
+import argparse
+from collections import Counter
+
+# Запись — кортеж (вид, тип дня, имя); он же ключ счётчика
+CHOICE = "choice"     # имя — ход игрока
+SCENE = "scene"       # имя — сцена, до которой дошёл игрок (этап воронки)
+DAY_END = "day_end"   # имя — "late" или "on_time"
+
+# Этапы воронки дня по порядку: начало дня, обязательные сцены сценария, итоги.
+# Необязательные сцены (work_decision проходят не все) в воронку не входят —
+# они видны в выборе ходов
+DAY_START = "day_start"
+FUNNEL = (DAY_START, "work", "family", "partner", "transport", "final")
+
+CSV_HEADER = ("window_start", "window_end", "kind", "day_type", "name", "count")
+
+# ========== СБОР ==========
+class Analytics:
+    enabled = True
+
+    def __init__(self, directory, queue_size=10000, flush_interval=60.0, rotate_bytes=16 * 2**20, keep_files=48):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.keep_files = keep_files
+        self._queue = asyncio.Queue(queue_size)
+        self._window = Counter()
+        self._window_start = time.time()
+        self._path = None
+        self._files = 0
+        self._tasks = []
+
+        self.totals = Counter()
+        self.accepted = 0
+        self.dropped = 0
+        self.rows_written = 0
+
+    def emit(self, kind, day_type, name):
+        """С горячего пути: никогда не ждёт и не бросает исключений"""
+        try:
+            self._queue.put_nowait((kind, day_type, name))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return
+        self.accepted += 1
+
+    @property
+    def queued(self):
+        return self._queue.qsize()
+
+    async def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._tasks = [asyncio.create_task(self._aggregate()), asyncio.create_task(self._flush_loop())]
+
+    async def _aggregate(self):
+        queue = self._queue
+        while True:
+            record = await queue.get()
+            # Окно берём после await: flush мог его подменить, пока мы ждали
+            window = self._window
+            window[record] += 1
+            # Всё, что накопилось, — без лишних пробуждений
+            while not queue.empty():
+                window[queue.get_nowait()] += 1
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Ошибка записи аналитики: {e}")
+
+    async def flush(self):
+        # Дочитываем очередь здесь же, чтобы окно не разорвалось посередине
+        while not self._queue.empty():
+            self._window[self._queue.get_nowait()] += 1
+        window, self._window = self._window, Counter()
+        start, end = self._window_start, time.time()
+        self._window_start = end
+        if not window:
+            return
+        rows = [(int(start), int(end), kind, day_type, name, count) for (kind, day_type, name), count in window.items()]
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, rows)
+        except Exception:
+            # Окно возвращается и уйдёт следующей записью вместе с новым: счётчики
+            # складываются, а ключей в окне не больше, чем ходов и сцен сценария
+            self._window.update(window)
+            self._window_start = start
+            raise
+        self.totals.update(window)
+        self.rows_written += len(rows)
+
+    def _write(self, rows):
+        if self._path is None or os.path.getsize(self._path) >= self.rotate_bytes:
+            self._rotate()
+        new = not os.path.exists(self._path)
+        with open(self._path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if new:
+                writer.writerow(CSV_HEADER)
+            writer.writerows(rows)
+
+    def _rotate(self):
+        # Номер файла — на случай нескольких ротаций за одну секунду
+        self._files += 1
+        self._path = os.path.join(self.directory, f"analytics-{time.strftime('%Y%m%d-%H%M%S')}-{self._files:04d}.csv")
+        files = sorted(f for f in os.listdir(self.directory) if f.startswith("analytics-") and f.endswith(".csv"))
+        for name in files[:max(0, len(files) - self.keep_files + 1)]:
+            os.remove(os.path.join(self.directory, name))
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        await self.flush()
+
+
+class NullAnalytics:
+    """Аналитика выключена: emit — пустой вызов"""
+
+    enabled = False
+    accepted = dropped = queued = 0
+
+    def emit(self, kind, day_type, name):
+        pass
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+NULL_ANALYTICS = NullAnalytics()
+
+# ========== СВОДКА ==========
+def load_totals(directory):
+    """Сумма по всем файлам каталога, включая подкаталоги шардов (shards.py)"""
+    totals = Counter()
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if not (name.startswith("analytics-") and name.endswith(".csv")):
+                continue
+            with open(os.path.join(root, name), newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    totals[(row["kind"], row["day_type"], row["name"])] += int(row["count"])
+    return totals
+
+def report(totals):
+    """Текстовая сводка: выбор по типам дня, воронка с отвалом, доля опозданий"""
+    lines = []
+    day_types = sorted({day_type for _, day_type, _ in totals})
+    for day_type in day_types:
+        lines.append(f"\n=== {day_type} ===")
+        choices = sorted(((name, n) for (kind, d, name), n in totals.items() if kind == CHOICE and d == day_type),
+                         key=lambda item: -item[1])
+        if choices:
+            lines.append("Выбор:")
+            lines.extend(f"  {name:<22} {n:>9}" for name, n in choices)
+        reached = [totals[(SCENE, day_type, stage)] for stage in FUNNEL]
+        if reached[0]:
+            lines.append("Воронка:")
+            for i, (stage, n) in enumerate(zip(FUNNEL, reached)):
+                lost = reached[i - 1] - n if i else 0
+                note = f"  ушли {lost} ({lost / reached[i - 1]:.1%})" if i and reached[i - 1] else ""
+                lines.append(f"  {stage:<14} {n:>9}{note}")
+        late, on_time = totals[(DAY_END, day_type, "late")], totals[(DAY_END, day_type, "on_time")]
+        if late + on_time:
+            lines.append(f"Опоздания: {late} из {late + on_time} ({late / (late + on_time):.1%})")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", default=os.environ.get("ANALYTICS_DIR", "analytics"))
+    args = parser.parse_args()
+    totals = load_totals(args.directory)
+    if not totals:
+        print(f"В {args.directory} нет данных аналитики")
+        sys.exit(1)
+    print(report(totals))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Сравнение сборки сцен «на лету» с готовыми клавиатурами и шаблонами из render.py.
+
+Запуск: python benchmarks/bench_render.py
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+import render
+import achievements
+from content import load_scenario
+from engine import time_to_str
+from game_state import GameState
+
+
+# ========== ПРЕЖНЯЯ СБОРКА СЦЕН ==========
+def legacy_work_scene(state):
+    work_messages = [
+        f"💼 РАБОТА\n\n{state.player_name}, начальник ставит задачу:\n«Нужен детальный отчёт по кварталу. Без этого не получим финансирование!»",
+        f"💼 РАБОТА\n\n{state.player_name}, срочное задание:\n«Клиент ждёт отчёт до конца дня. От этого зависит наш крупный контракт.»"
+    ]
+    text = (
+        f"🕒 День {state.day} | {time_to_str(state)}\n\n"
+        f"{work_messages[0]}\n\n"
+        "Твои действия?"
+    )
+    keyboard = [
+        [InlineKeyboardButton("📊 Качественный отчёт (2 часа)", callback_data="work_quality")],
+        [InlineKeyboardButton("⚡ Быстрый отчёт (1 час)", callback_data="work_fast")],
+        [InlineKeyboardButton("🚶 Передать коллеге (30 минут)", callback_data="work_skip")]
+    ]
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+def legacy_statistics(state):
+    text = (
+        f"📊 ДЕТАЛЬНАЯ СТАТИСТИКА ДНЯ {state.day}\n\n"
+        f"💼 Карьера: {state.career}/10 - {'Отлично' if state.career >= 7 else 'Хорошо' if state.career >= 4 else 'Проблемы'}\n"
+        f"👨‍👩‍👧‍👦 Семья: {state.family}/10 - {'Счастлива' if state.family >= 7 else 'Довольна' if state.family >= 4 else 'Обижена'}\n"
+        f"⚡ Энергия: {state.energy}/10 - {'Полон сил' if state.energy >= 7 else 'Нормально' if state.energy >= 4 else 'Устал'}\n"
+        f"🔧 Навыки: {state.skills}/10 - {'Мастер' if state.skills >= 7 else 'Развивается' if state.skills >= 4 else 'Новичок'}\n\n"
+        f"⭐ ОБЩИЙ СЧЁТ: {state.total_score}\n"
+        f"📅 ДНЕЙ ЗАВЕРШЕНО: {state.days_completed}\n"
+        f"🏆 ДОСТИЖЕНИЙ: {achievements.count(state.achievements)}\n\n"
+        "Стремись к балансу во всех сферах! 🎯"
+    )
+    keyboard = [
+        [InlineKeyboardButton("🏆 Мои достижения", callback_data="show_achievements")],
+        [InlineKeyboardButton("📤 Поделиться результатом", callback_data="share_progress")],
+        [InlineKeyboardButton("🔄 Следующий день", callback_data="next_day")],
+        [InlineKeyboardButton("🔄 Начать заново", callback_data="restart")]
+    ]
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+def legacy_day_start(state):
+    day_descriptions = {
+        "normal": "📅 ОБЫЧНЫЙ ДЕНЬ\nСтандартные вызовы и задачи",
+        "career_crisis": "💥 КРИЗИС НА РАБОТЕ\nЗадачи сложнее, но больше карьерного опыта",
+        "family_crisis": "👨‍👩‍👧‍👦 СЕМЕЙНЫЙ КРИЗИС\nСемья требует больше внимания и заботы",
+        "lucky_day": "🍀 УДАЧНЫЙ ДЕНЬ\nВыше шанс позитивных событий и бонусов",
+        "energy_drain": "😫 ДЕНЬ УСТАЛОСТИ\nЭнергия тратится быстрее, нужна осторожность",
+        "skill_focus": "🔧 ДЕНЬ НАВЫКОВ\nОтличная возможность прокачать умения"
+    }
+    day_text = (
+        f"🎮 ГОНКА ДО УНИВЕРА: День {state.day} 🎮\n\n"
+        f"🌟 {day_descriptions[state.day_type]}\n\n"
+        f"🕒 Сейчас {time_to_str(state)}\n"
+        f"📚 Пары начинаются в 18:40\n\n"
+        f"⚡ Твои ресурсы:\n"
+        f"Энергия: {state.energy}/10\n"
+        f"Карьера: {state.career}/10\n"
+        f"Семья: {state.family}/10\n"
+        f"Навыки: {state.skills}/10\n\n"
+        "Готов к новым вызовам?"
+    )
+    keyboard = [[InlineKeyboardButton("🚀 Начать день!", callback_data="start_day")]]
+    return day_text, InlineKeyboardMarkup(keyboard)
+
+
+# ========== СБОРКА ЧЕРЕЗ RENDER ==========
+SCENARIO = load_scenario()
+WORK_TEXT = SCENARIO.scene_texts["work"][0]
+WORK_KEYBOARD = render.scene_keyboards(SCENARIO)["work"]
+
+
+def cached_work_scene(state):
+    text = WORK_TEXT.format(day=state.day, time=time_to_str(state), name=state.player_name)
+    return text, WORK_KEYBOARD
+
+
+def cached_statistics(state):
+    return render.statistics_text(state), render.STATISTICS_KEYBOARD
+
+
+def cached_day_start(state):
+    return render.day_start_text(state, time_to_str(state)), render.START_DAY_KEYBOARD
+
+
+def allocations(func, state, calls=1000):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    keep = [func(state) for _ in range(calls)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    size = sum(stat.size_diff for stat in stats) - sys.getsizeof(keep)
+    blocks = sum(stat.count_diff for stat in stats) - 1
+    return size / calls, blocks / calls
+
+
+def main():
+    state = GameState()
+    state.player_name = "Тест"
+    state.career, state.family, state.energy, state.skills = 6, 5, 4, 7
+    state.hours, state.minutes = 16, 45
+
+    cases = [
+        ("Сцена работы", legacy_work_scene, cached_work_scene),
+        ("Статистика", legacy_statistics, cached_statistics),
+        ("Начало дня", legacy_day_start, cached_day_start),
+    ]
+    number = 20_000
+    for label, legacy, cached in cases:
+        assert legacy(state)[0] == cached(state)[0], label
+        print(f"{label}:")
+        for name, func in (("на лету", legacy), ("render", cached)):
+            seconds = min(timeit.repeat(lambda: func(state), number=number, repeat=5))
+            size, blocks = allocations(func, state)
+            print(f"  {name:<10} {seconds / number * 1e6:7.2f} мкс  {size:7.0f} байт  {blocks:5.1f} объектов на вызов")
+
+
+if __name__ == "__main__":
+    main()
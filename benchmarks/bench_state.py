@@ -0,0 +1,108 @@
+"""Сравнение компактного GameState с прежним классом на __dict__.
+
+Запуск: python benchmarks/bench_state.py [число игроков]
+"""
+import os
+import sys
+import pickle
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game_state import GameState, EVENT_BITS
+from achievements import BY_ID
+
+
+class LegacyGameState:
+    """Прежнее представление состояния — для сравнения"""
+
+    def __init__(self):
+        self.career = 0
+        self.family = 0
+        self.energy = 8
+        self.skills = 0
+        self.hours = 15
+        self.minutes = 0
+        self.day = 1
+        self.total_score = 0
+        self.days_completed = 0
+        self.day_type = "normal"
+        self.achievements = []
+        self.special_events_seen = []
+        self.checked_subscription = False
+        self.current_scene = "start"
+        self.player_name = "Герой"
+        self.pending_scene = None
+
+
+def make_player(cls, i):
+    # Типичный игрок на третий день: пара достижений и несколько событий
+    state = cls()
+    state.career, state.family, state.energy, state.skills = 6, 5, 4, 7
+    state.hours, state.minutes = 17, 35
+    state.day, state.days_completed, state.total_score = 3, 2, 520
+    state.day_type = "family_crisis"
+    state.current_scene = "transport"
+    state.pending_scene = "final"
+    state.checked_subscription = True
+    state.player_name = f"Игрок{i}"
+    if cls is LegacyGameState:
+        state.achievements = ["Настоящий друг", "Скоростной рекорд"]
+    else:
+        state.achievements = BY_ID["true_friend"].bit | BY_ID["speed_record"].bit
+    seen = ["friend_help", "traffic_jam", "friend_help"]
+    if cls is LegacyGameState:
+        state.special_events_seen = seen
+    else:
+        state.events_seen = EVENT_BITS["friend_help"] | EVENT_BITS["traffic_jam"]
+    return state
+
+
+def bytes_per_player(cls, count):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    players = [make_player(cls, i) for i in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    # Вычитаем сам список и строки имён — они одинаковы для обоих классов
+    overhead = sys.getsizeof(players) + sum(sys.getsizeof(p.player_name) for p in players)
+    return (total - overhead) / count
+
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    print(f"  {label:<28} {seconds / number * 1e6:8.2f} мкс")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    legacy = make_player(LegacyGameState, 1)
+    compact = make_player(GameState, 1)
+
+    print(f"Память на игрока ({count} игроков):")
+    print(f"  {'прежний класс':<28} {bytes_per_player(LegacyGameState, count):8.0f} байт")
+    print(f"  {'__slots__':<28} {bytes_per_player(GameState, count):8.0f} байт")
+
+    legacy_pickle = pickle.dumps(legacy, pickle.HIGHEST_PROTOCOL)
+    compact_pickle = pickle.dumps(compact, pickle.HIGHEST_PROTOCOL)
+    packed = compact.to_bytes()
+    print("\nРазмер сериализованного состояния:")
+    print(f"  {'pickle прежнего класса':<28} {len(legacy_pickle):8d} байт")
+    print(f"  {'pickle __slots__':<28} {len(compact_pickle):8d} байт")
+    print(f"  {'to_bytes':<28} {len(packed):8d} байт")
+
+    number = 20_000
+    print("\nСериализация:")
+    bench("pickle прежнего класса", lambda: pickle.dumps(legacy, pickle.HIGHEST_PROTOCOL), number)
+    bench("pickle __slots__", lambda: pickle.dumps(compact, pickle.HIGHEST_PROTOCOL), number)
+    bench("to_bytes", compact.to_bytes, number)
+    print("\nДесериализация:")
+    bench("unpickle прежнего класса", lambda: pickle.loads(legacy_pickle), number)
+    bench("unpickle __slots__", lambda: pickle.loads(compact_pickle), number)
+    bench("from_bytes", lambda: GameState.from_bytes(packed), number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Локальная замена Telegram Bot API для нагрузочных стендов.
+
+FakeTelegram отвечает на методы, которыми пользуется игра, с настраиваемой
+задержкой, считает вызовы по методам и запоминает последние кнопки в каждом
+чате — по ним симулированные игроки выбирают следующий ход. С keep_log
+он ещё хранит все вызовы по порядку (для сверки прогонов в replay.py). Подключить его
+к боту можно двумя способами:
+
+- FakeBotApi — HTTP-сервер; бот направляется сюда через
+  BOT_API_BASE_URL=http://127.0.0.1:<порт>/bot;
+- FakeRequest — транспорт PTB внутри процесса, без сети и httpx.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import itertools
+from collections import Counter
+from urllib.parse import parse_qsl
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.request import BaseRequest
+
+from webhook import HttpServer
+
+
+def _decode(value):
+    # PTB шлёт form-urlencoded: сложные значения закодированы в JSON, строки — как есть
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+class FakeTelegram:
+    def __init__(self, latency=0.0, latencies=None, keep_log=False):
+        self.latency = latency
+        self.latencies = latencies or {}
+        self.calls = Counter()
+        self.log = [] if keep_log else None   # [(метод, параметры), ...]
+        self.buttons = {}          # chat_id -> (message_id, [callback_data, ...])
+        self._changed = {}         # chat_id -> asyncio.Event, выставляется при новых кнопках
+        self._message_ids = itertools.count(1)
+
+    def reset(self):
+        self.calls.clear()
+        self.buttons.clear()
+
+    async def wait_buttons(self, chat_id, timeout=10.0):
+        """Ждёт, пока бот пришлёт в чат новые кнопки, и возвращает (message_id, callback_data)"""
+        event = self._changed.setdefault(chat_id, asyncio.Event())
+        await asyncio.wait_for(event.wait(), timeout)
+        event.clear()
+        return self.buttons[chat_id]
+
+    async def call(self, api_method, data):
+        self.calls[api_method] += 1
+        if self.log is not None:
+            self.log.append((api_method, data))
+        delay = self.latencies.get(api_method, self.latency)
+        if delay:
+            await asyncio.sleep(delay)
+        return self._result(api_method, data)
+
+    def _result(self, api_method, data):
+        if api_method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Гонка", "username": "SurvivalStudentGameBot"}
+        if api_method == "getChatMember":
+            return {
+                "status": "member",
+                "user": {"id": int(data["user_id"]), "is_bot": False, "first_name": "Игрок"},
+            }
+        if api_method in ("sendMessage", "editMessageText", "editMessageReplyMarkup", "sendPhoto"):
+            chat_id = int(data["chat_id"])
+            message_id = int(data["message_id"]) if "message_id" in data else next(self._message_ids)
+            self._remember_buttons(chat_id, message_id, data.get("reply_markup"))
+            message = {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "Гонка"},
+            }
+            if "text" in data:
+                message["text"] = str(data["text"])
+            if api_method == "sendPhoto":
+                message["photo"] = [{"file_id": f"photo{message_id}", "file_unique_id": f"u{message_id}",
+                                     "width": 800, "height": 480}]
+            return message
+        return True
+
+    def _remember_buttons(self, chat_id, message_id, markup):
+        if not isinstance(markup, dict):
+            return
+        data = [
+            button["callback_data"]
+            for row in markup.get("inline_keyboard", [])
+            for button in row
+            if "callback_data" in button
+        ]
+        if data:
+            self.buttons[chat_id] = (message_id, data)
+            self._changed.setdefault(chat_id, asyncio.Event()).set()
+
+
+class FakeBotApi(FakeTelegram):
+    """FakeTelegram за HTTP-сервером — для бота, который ходит в сеть"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, latencies=None):
+        super().__init__(latency, latencies)
+        self.server = HttpServer(self._route, host, port)
+
+    @property
+    def base_url(self):
+        return f"http://{self.server.host}:{self.server.port}/bot"
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop()
+
+    async def _route(self, method, target, headers, body):
+        api_method = target.rsplit("/", 1)[-1]
+        if headers.get("content-type", "").startswith("application/json"):
+            data = json.loads(body or b"{}")
+        else:
+            data = {key: _decode(value) for key, value in parse_qsl(body.decode("utf-8"))}
+        result = await self.call(api_method, data)
+        return 200, "application/json", json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+
+class FakeRequest(BaseRequest):
+    """Транспорт PTB, который отвечает из FakeTelegram прямо в процессе.
+
+    Запросы проходят через весь ExtBot и rate limiter, но без сокетов —
+    стенд меряет сам бот, а не httpx.
+    """
+
+    def __init__(self, telegram):
+        self.telegram = telegram
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        data = request_data.parameters if request_data is not None else {}
+        result = await self.telegram.call(api_method, data)
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
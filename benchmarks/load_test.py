@@ -0,0 +1,309 @@
+"""Нагрузочный тест обработчиков бота с заглушкой Bot API внутри процесса.
+
+Тысячи симулированных игроков проходят многодневные кампании: /start,
+проверка подписки, ходы дня, итоги, следующий день. Обновления подаются
+прямо в Application.process_update, запросы бота уходят через весь ExtBot
+и Outbox в FakeRequest — сеть и httpx не участвуют, поэтому меряется сам
+бот и задержка, которую задаёт заглушка.
+
+Отчёт: пропускная способность, p50/p95/p99 задержки на нажатие (в целом и
+по действиям), вызовы Bot API на игровой день и пиковая память. С --output
+результаты сохраняются в JSON, --baseline сравнивает с прошлым прогоном.
+
+    python benchmarks/load_test.py --players 2000 --days 3 --output results.json
+    python benchmarks/load_test.py --players 2000 --days 3 --api-latency 0.05 --baseline results.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import platform
+import resource
+import itertools
+import subprocess
+import tracemalloc
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import FakeTelegram, FakeRequest
+from render import unpack_callback
+
+MENU_ACTIONS = {"restart", "share_progress", "show_stats", "show_achievements", "show_top", "hint"}
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def latency_summary(values):
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(max(values, default=0.0) * 1000, 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# ========== ИГРОК ==========
+class Player:
+    _update_ids = itertools.count(1)
+
+    def __init__(self, user_id, telegram, rng):
+        self.user_id = user_id
+        self.telegram = telegram
+        self.rng = rng
+        self.user = {"id": user_id, "is_bot": False, "first_name": f"Игрок{user_id}"}
+        self.chat = {"id": user_id, "type": "private"}
+        self.version = int(time.time())
+        self.days = 0
+
+    def start_update(self):
+        update_id = next(self._update_ids)
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id, "date": int(time.time()),
+                "chat": self.chat, "from": self.user, "text": "/start",
+                "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+            },
+        }
+
+    def callback_update(self, message_id, data):
+        update_id = next(self._update_ids)
+        self.version += 1
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id), "from": self.user, "chat_instance": str(self.user_id), "data": data,
+                "message": {
+                    "message_id": message_id, "date": int(time.time()), "edit_date": self.version,
+                    "chat": self.chat, "from": {"id": 1, "is_bot": True, "first_name": "Гонка"}, "text": "…",
+                },
+            },
+        }
+
+    def choose(self, buttons, days):
+        if "next_day" in buttons:
+            # Экран итогов: день пройден
+            self.days += 1
+            return "next_day" if self.days < days else None
+        moves = [b for b in buttons if b not in MENU_ACTIONS]
+        return self.rng.choice(moves or buttons)
+
+    async def play(self, application, days, latencies, think_time=0.0, max_clicks=500):
+        from telegram import Update
+
+        update = Update.de_json(self.start_update(), application.bot)
+        started = time.perf_counter()
+        await application.process_update(update)
+        latencies["/start"].append(time.perf_counter() - started)
+
+        for _ in range(max_clicks):
+            # Пауза между нажатиями: даже нулевая отдаёт цикл другим игрокам,
+            # иначе при мгновенной заглушке один игрок проходит всю кампанию подряд
+            await asyncio.sleep(think_time)
+            message_id, buttons = self.telegram.buttons[self.user_id]
+            # В callback_data — метка хода; игрок выбирает по действию, жмёт кнопку как есть
+            actions = {unpack_callback(data)[1]: data for data in buttons}
+            action = self.choose(list(actions), days)
+            if action is None:
+                return
+            update = Update.de_json(self.callback_update(message_id, actions[action]), application.bot)
+            started = time.perf_counter()
+            await application.process_update(update)
+            latencies[action].append(time.perf_counter() - started)
+        raise RuntimeError(f"Игрок {self.user_id} не закончил {days} дн. за {max_clicks} нажатий")
+
+# ========== ПРОГОН ==========
+async def run(args):
+    os.environ.update({
+        "BOT_TOKEN": "123456:LOADTEST",
+        "BOT_MODE": "webhook",
+        "STATE_BACKEND": args.state_backend,
+        "STATE_DB_PATH": args.state_db,
+        "JOURNAL_DIR": args.journal_dir,
+    })
+    if args.analytics:
+        os.environ.update({"ANALYTICS_ENABLED": "1", "ANALYTICS_DIR": args.analytics_dir})
+    if not args.telegram_limits:
+        # Лимиты Telegram растянули бы прогон на часы — меряем сам бот
+        os.environ.update({
+            "OUTBOX_GLOBAL_RATE": "1000000", "OUTBOX_CHAT_RATE": "1000000", "OUTBOX_CHAT_BURST": "1000000",
+        })
+    random.seed(args.seed)
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    import bot
+    logging.getLogger("telegram.ext.Application").setLevel(logging.CRITICAL)
+
+    latencies = dict((method, float(value)) for method, value in
+                     (item.split("=", 1) for item in args.method_latency))
+    telegram = FakeTelegram(latency=args.api_latency, latencies=latencies)
+    application = bot.build_application(webhook=True, request=FakeRequest(telegram))
+
+    rng = random.Random(args.seed)
+    players = [Player(100_000 + i, telegram, random.Random(rng.random())) for i in range(args.players)]
+    callback_latencies = defaultdict(list)
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def play(player):
+        async with gate:
+            await player.play(application, args.days, callback_latencies, args.think_time)
+
+    async with application:
+        await bot.post_init(application)
+        started = time.perf_counter()
+        await asyncio.gather(*(play(p) for p in players))
+        elapsed = time.perf_counter() - started
+        states = len(bot.state_store)
+        await bot.post_shutdown(application)
+        analytics_dropped = bot.analytics.dropped
+        cards = bot.card_cache
+
+    all_latencies = [value for values in callback_latencies.values() for value in values]
+    updates = len(all_latencies)
+    game_days = sum(p.days for p in players)
+    api_calls = sum(telegram.calls.values())
+    results = {
+        "elapsed_s": round(elapsed, 3),
+        "updates": updates,
+        "game_days": game_days,
+        "throughput_updates_per_s": round(updates / elapsed, 1),
+        "latency": latency_summary(all_latencies),
+        "latency_by_action": {action: latency_summary(values) for action, values in sorted(callback_latencies.items())},
+        "api_calls": api_calls,
+        "api_calls_per_game_day": round(api_calls / max(1, game_days), 3),
+        "api_calls_by_method": dict(sorted(telegram.calls.items())),
+        "states_in_memory": states,
+        "analytics_dropped": analytics_dropped,
+        "result_cards": {
+            "cached": cards.hits, "rendered": cards.rendered, "skipped": cards.skipped,
+        } if cards is not None else None,
+        # ru_maxrss в Linux — в килобайтах
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if args.tracemalloc:
+        results["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        tracemalloc.stop()
+    return {
+        "benchmark": "load_test",
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "timestamp": int(time.time()),
+        "params": {
+            "players": args.players, "days": args.days, "concurrency": args.concurrency,
+            "api_latency": args.api_latency, "method_latency": latencies, "think_time": args.think_time,
+            "seed": args.seed,
+            "state_backend": args.state_backend, "telegram_limits": args.telegram_limits,
+            "analytics": args.analytics,
+        },
+        "results": results,
+    }
+
+# ========== ОТЧЁТ ==========
+COMPARED = (
+    ("throughput_updates_per_s", "Пропускная способность, обн/с"),
+    ("latency.p50_ms", "p50, мс"),
+    ("latency.p95_ms", "p95, мс"),
+    ("latency.p99_ms", "p99, мс"),
+    ("api_calls_per_game_day", "Вызовов API на игровой день"),
+    ("peak_rss_mb", "Пиковая память, МБ"),
+)
+
+
+def _metric(results, path):
+    value = results
+    for part in path.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def print_report(report, baseline=None):
+    params, results = report["params"], report["results"]
+    print(f"Игроков: {params['players']} × {params['days']} дн., одновременно {params['concurrency']}, "
+          f"задержка API {params['api_latency'] * 1000:.0f} мс")
+    print(f"Обновлений: {results['updates']}, игровых дней: {results['game_days']}, время: {results['elapsed_s']} с")
+    print(f"Пропускная способность: {results['throughput_updates_per_s']} обновлений/с")
+    latency = results["latency"]
+    print(f"Задержка на нажатие: p50 {latency['p50_ms']} мс, p95 {latency['p95_ms']} мс, "
+          f"p99 {latency['p99_ms']} мс, максимум {latency['max_ms']} мс")
+    print("По действиям:")
+    for action, row in results["latency_by_action"].items():
+        print(f"  {action:<22} {row['count']:>7}  p50 {row['p50_ms']:>8} мс  p99 {row['p99_ms']:>8} мс")
+    print(f"Вызовов Bot API: {results['api_calls']} ({results['api_calls_per_game_day']} на игровой день): "
+          f"{results['api_calls_by_method']}")
+    cards = results.get("result_cards")
+    if cards:
+        print(f"Карточки результата: по file_id {cards['cached']}, нарисовано {cards['rendered']}, "
+              f"пропущено под нагрузкой {cards['skipped']}")
+    print(f"Пиковая память: {results['peak_rss_mb']} МБ RSS"
+          + (f", {results['peak_traced_mb']} МБ Python-объектов" if "peak_traced_mb" in results else ""))
+
+    if baseline is None:
+        return
+    print(f"\nСравнение с {baseline.get('revision') or 'базовым прогоном'}:")
+    if baseline.get("params") != params:
+        print("  (параметры прогонов различаются — сравнение приблизительное)")
+    for path, title in COMPARED:
+        old, new = _metric(baseline["results"], path), _metric(results, path)
+        if old is None or new is None:
+            continue
+        change = f"{(new - old) / old:+.1%}" if old else "—"
+        print(f"  {title:<30} {old:>10} → {new:<10} {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=3, help="игровых дней на игрока")
+    parser.add_argument("--concurrency", type=int, default=500, help="сколько игроков играют одновременно")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа заглушки, с")
+    parser.add_argument("--method-latency", action="append", default=[], metavar="МЕТОД=С",
+                        help="задержка для отдельного метода, например getChatMember=0.2")
+    parser.add_argument("--think-time", type=float, default=0.0, help="пауза игрока между нажатиями, с")
+    parser.add_argument("--state-backend", choices=("memory", "sqlite", "journal"), default="memory")
+    parser.add_argument("--state-db", default="load_test_states.db")
+    parser.add_argument("--journal-dir", default="load_test_journal")
+    parser.add_argument("--analytics", action="store_true", help="включить потоковую аналитику")
+    parser.add_argument("--analytics-dir", default="load_test_analytics")
+    parser.add_argument("--telegram-limits", action="store_true", help="оставить лимиты Outbox как в бою")
+    parser.add_argument("--tracemalloc", action="store_true", help="считать пик Python-объектов (медленнее)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""Воспроизведение записанного трафика (recorder.py) на заглушке Bot API.
+
+Обновления из записи подаются в Application.process_update по одному, в том
+порядке, в каком пришли, и без пауз — так быстро, как бот их обрабатывает.
+Случайность в игре идёт из личных потоков rng в состояниях игроков, поэтому
+одна и та же запись на одном и том же коде даёт одни и те же партии.
+
+Отчёт: пропускная способность и задержки на реальной смеси нажатий, плюс
+отпечатки итогов — состояний игроков и всего, что бот отправил в каждый чат.
+С --baseline сравниваются и скорость, и отпечатки: разные отпечатки на одной
+записи значат, что новая версия играет иначе (код выхода 1).
+
+    RECORD_PATH=updates.rec python bot.py            # запись в бою
+    python benchmarks/replay.py updates.rec --output before.json
+    python benchmarks/replay.py updates.rec --baseline before.json
+
+Запись начинается не с пустого хранилища: игроки, начавшие партию до неё,
+без --state-db получат «нет партии». С --state-db прогон стартует с копии
+базы состояний, снятой в момент начала записи.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import hashlib
+import logging
+import argparse
+import platform
+import resource
+import tempfile
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import FakeTelegram, FakeRequest
+from load_test import latency_summary, git_revision, _metric
+from recorder import read_updates
+
+# Вызовы, которые не зависят от хода игры: их порядок относительно сообщений
+# определяют фоновые задачи, а не игровая логика
+UNCOMPARED = {"getMe", "getChatMember"}
+
+
+def update_user(update):
+    for key in ("callback_query", "message"):
+        if key in update:
+            return update[key].get("from", update[key].get("chat", {})).get("id", 0)
+    return 0
+
+
+def update_label(update):
+    if "callback_query" in update:
+        return update["callback_query"].get("data") or "?"
+    text = update.get("message", {}).get("text", "")
+    return text.split()[0] if text.startswith("/") else "message"
+
+# ========== ОТПЕЧАТКИ ==========
+def chat_transcripts(log):
+    """Вызовы Bot API по чатам в порядке отправки; внутри чата порядок задаёт
+    блокировка игрока, поэтому он не зависит от планировщика"""
+    chats = defaultdict(list)
+    for method, data in log:
+        if method in UNCOMPARED:
+            continue
+        chats[str(data.get("chat_id", "—"))].append((method, data))
+    return chats
+
+
+def digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+def fingerprints(bot, users, log):
+    chats = chat_transcripts(log)
+    per_user = {}
+    for user_id in sorted(users):
+        state = bot.state_store.get(user_id)
+        dumped = bot.dump_state(state).hex() if state is not None else None
+        per_user[str(user_id)] = digest([dumped, chats.pop(str(user_id), [])])[:12]
+    # Вызовы вне чатов игроков (answerCallbackQuery без chat_id и т. п.)
+    per_user["—"] = digest(sorted(chats.items()))[:12]
+    return digest(sorted(per_user.items())), per_user
+
+# ========== ПРОГОН ==========
+async def run(args):
+    records = []
+    for timestamp, update in read_updates(args.path):
+        records.append((timestamp, update))
+        if args.limit and len(records) >= args.limit:
+            break
+    if not records:
+        raise SystemExit(f"В {args.path} нет обновлений")
+
+    workdir = tempfile.mkdtemp(prefix="replay-")
+    env = {
+        "BOT_TOKEN": "123456:REPLAY",
+        "BOT_MODE": "webhook",
+        "STATE_BACKEND": "memory",
+        "RECORD_PATH": "",
+        # Запись идёт быстрее, чем её нажимали: окно склейки повторных нажатий
+        # проглотило бы нажатия, между которыми в бою прошли секунды
+        "CLICK_DEDUP_TTL": str(args.dedup_ttl),
+        "OUTBOX_GLOBAL_RATE": "1000000", "OUTBOX_CHAT_RATE": "1000000", "OUTBOX_CHAT_BURST": "1000000",
+    }
+    if args.state_db:
+        # Работаем на копии: прогон меняет состояния
+        state_db = os.path.join(workdir, "states.db")
+        shutil.copyfile(args.state_db, state_db)
+        env.update({"STATE_BACKEND": "sqlite", "STATE_DB_PATH": state_db})
+    os.environ.update(env)
+
+    import bot
+    from telegram import Update
+    logging.getLogger("telegram.ext.Application").setLevel(logging.CRITICAL)
+
+    telegram = FakeTelegram(latency=args.api_latency, keep_log=True)
+    application = bot.build_application(webhook=True, request=FakeRequest(telegram))
+    # Дневной рейтинг считается по времени обновления в записи, а не по часам прогона
+    now = [records[0][0]]
+    if hasattr(bot.leaderboard, "_clock"):
+        bot.leaderboard._clock = lambda: now[0]
+
+    latencies = defaultdict(list)
+    users = set()
+    try:
+        async with application:
+            await bot.post_init(application)
+            started = time.perf_counter()
+            for timestamp, data in records:
+                now[0] = timestamp
+                users.add(update_user(data))
+                update = Update.de_json(data, application.bot)
+                begin = time.perf_counter()
+                await application.process_update(update)
+                latencies[update_label(data)].append(time.perf_counter() - begin)
+            elapsed = time.perf_counter() - started
+            total, per_user = fingerprints(bot, users - {0}, telegram.log)
+            await bot.post_shutdown(application)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    api_calls = sum(telegram.calls.values())
+    return {
+        "benchmark": "replay",
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "timestamp": int(time.time()),
+        "params": {
+            "recording": os.path.abspath(args.path), "updates": len(records), "limit": args.limit,
+            "state_db": args.state_db, "api_latency": args.api_latency, "dedup_ttl": args.dedup_ttl,
+        },
+        "results": {
+            "elapsed_s": round(elapsed, 3),
+            "updates": len(records),
+            "players": len(users - {0}),
+            "throughput_updates_per_s": round(len(records) / elapsed, 1),
+            "latency": latency_summary(all_latencies),
+            "latency_by_action": {label: latency_summary(values) for label, values in sorted(latencies.items())},
+            "api_calls": api_calls,
+            "api_calls_by_method": dict(sorted(telegram.calls.items())),
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+        "fingerprint": total,
+        "players": per_user,
+    }
+
+# ========== ОТЧЁТ ==========
+COMPARED = (
+    ("throughput_updates_per_s", "Пропускная способность, обн/с"),
+    ("latency.p50_ms", "p50, мс"),
+    ("latency.p95_ms", "p95, мс"),
+    ("latency.p99_ms", "p99, мс"),
+    ("api_calls", "Вызовов Bot API"),
+    ("peak_rss_mb", "Пиковая память, МБ"),
+)
+
+
+def print_report(report, baseline=None):
+    """Печатает отчёт; False — итоги расходятся с baseline"""
+    results = report["results"]
+    print(f"Обновлений: {results['updates']}, игроков: {results['players']}, время: {results['elapsed_s']} с")
+    print(f"Пропускная способность: {results['throughput_updates_per_s']} обновлений/с")
+    latency = results["latency"]
+    print(f"Задержка: p50 {latency['p50_ms']} мс, p95 {latency['p95_ms']} мс, "
+          f"p99 {latency['p99_ms']} мс, максимум {latency['max_ms']} мс")
+    print("По действиям:")
+    for label, row in results["latency_by_action"].items():
+        print(f"  {label:<22} {row['count']:>7}  p50 {row['p50_ms']:>8} мс  p99 {row['p99_ms']:>8} мс")
+    print(f"Вызовов Bot API: {results['api_calls']}: {results['api_calls_by_method']}")
+    print(f"Отпечаток итогов: {report['fingerprint']}")
+
+    if baseline is None:
+        return True
+    print(f"\nСравнение с {baseline.get('revision') or 'базовым прогоном'}:")
+    if baseline["params"]["updates"] != report["params"]["updates"]:
+        print("  (в прогонах разное число обновлений — сравнение приблизительное)")
+    for path, title in COMPARED:
+        old, new = _metric(baseline["results"], path), _metric(results, path)
+        if old is None or new is None:
+            continue
+        change = f"{(new - old) / old:+.1%}" if old else "—"
+        print(f"  {title:<30} {old:>10} → {new:<10} {change}")
+    if baseline["fingerprint"] == report["fingerprint"]:
+        print("Итоги совпадают")
+        return True
+    old, new = baseline.get("players", {}), report["players"]
+    differ = sorted(user for user in old.keys() | new.keys() if old.get(user) != new.get(user))
+    print(f"Итоги РАЗЛИЧАЮТСЯ у {len(differ)} игроков, например: {', '.join(differ[:10])}")
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="файл записи (RECORD_PATH)")
+    parser.add_argument("--limit", type=int, default=0, help="взять только первые N обновлений")
+    parser.add_argument("--state-db", help="база состояний SQLite на момент начала записи")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа заглушки, с")
+    parser.add_argument("--dedup-ttl", type=float, default=0.0, help="окно склейки повторных нажатий, с")
+    parser.add_argument("--output", help="сохранить результаты и отпечатки в JSON")
+    parser.add_argument("--baseline", help="JSON прошлого прогона на той же записи")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    same = print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в {args.output}")
+    if not same:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
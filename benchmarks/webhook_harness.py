@@ -0,0 +1,245 @@
+"""Нагрузочный стенд для режима вебхука без настоящего Telegram.
+
+Поднимает в одном процессе заглушку Bot API и бота в режиме вебхука,
+затем симулированные игроки шлют POST-запросы с синтетическими
+обновлениями: /start и нажатия кнопок, которые бот им показал.
+
+Запуск: python benchmarks/webhook_harness.py --players 200 --clicks 40
+
+С --shards N вместо бота в этом процессе запускается shards.py: диспетчер
+и N процессов-шардов, которые ходят в ту же заглушку Bot API по HTTP.
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import socket
+import signal
+import asyncio
+import argparse
+import itertools
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import FakeBotApi
+from render import unpack_callback
+
+MENU_ACTIONS = {"restart", "share_progress", "show_stats", "show_achievements", "show_top", "hint"}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+class WebhookClient:
+    """Одно keep-alive соединение к вебхуку"""
+
+    def __init__(self, port, path):
+        self.port = port
+        self.path = path
+        self.reader = None
+        self.writer = None
+
+    async def post(self, payload):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+        body = json.dumps(payload).encode("utf-8")
+        self.writer.write(
+            f"POST {self.path} HTTP/1.1\r\nHost: localhost\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+        )
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, value = line.decode("latin-1").split(":", 1)
+            if name.lower() == "content-length":
+                length = int(value)
+        await self.reader.readexactly(length)
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class Player:
+    _update_ids = itertools.count(1)
+
+    def __init__(self, user_id, client, api, rng):
+        self.user_id = user_id
+        self.client = client
+        self.api = api
+        self.rng = rng
+        self.user = {"id": user_id, "is_bot": False, "first_name": f"Игрок{user_id}"}
+        self.chat = {"id": user_id, "type": "private"}
+        self.version = int(time.time())
+        self.double_taps = 0
+
+    def start_update(self):
+        return {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._update_ids), "date": int(time.time()),
+                "chat": self.chat, "from": self.user, "text": "/start",
+                "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+            },
+        }
+
+    def callback_update(self, message_id, data):
+        update_id = next(self._update_ids)
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id), "from": self.user, "chat_instance": str(self.user_id), "data": data,
+                "message": {
+                    "message_id": message_id, "date": int(time.time()), "chat": self.chat,
+                    "from": {"id": 1, "is_bot": True, "first_name": "Гонка"}, "text": "…",
+                    # Каждая сцена — новая правка сообщения, как у настоящего Telegram
+                    "edit_date": self.version,
+                },
+            },
+        }
+
+    def choose(self, buttons):
+        """callback_data кнопки, которую нажать; решаем по действию без метки хода"""
+        actions = {unpack_callback(data)[1]: data for data in buttons}
+        if "next_day" in actions:
+            return actions["next_day"]
+        moves = [data for action, data in actions.items() if action not in MENU_ACTIONS]
+        return self.rng.choice(moves or buttons)
+
+    async def play(self, clicks, double_tap, post_latencies, click_latencies):
+        started = time.perf_counter()
+        await self.client.post(self.start_update())
+        message_id, buttons = await self.api.wait_buttons(self.user_id)
+        click_latencies.append(time.perf_counter() - started)
+        for _ in range(clicks):
+            started = time.perf_counter()
+            data = self.choose(buttons)
+            status = await self.client.post(self.callback_update(message_id, data))
+            post_latencies.append(time.perf_counter() - started)
+            if status != 200:
+                raise RuntimeError(f"Вебхук ответил {status}")
+            if self.rng.random() < double_tap:
+                # Второй тап по той же кнопке, пока сцена ещё не сменилась
+                self.double_taps += 1
+                await self.client.post(self.callback_update(message_id, data))
+            message_id, buttons = await self.api.wait_buttons(self.user_id)
+            self.version += 1
+            click_latencies.append(time.perf_counter() - started)
+
+
+async def run(args):
+    api = FakeBotApi(latency=args.api_latency)
+    await api.start()
+
+    webhook_port = free_port()
+    os.environ.update({
+        "BOT_TOKEN": "123456:HARNESS",
+        "BOT_MODE": "webhook",
+        "BOT_API_BASE_URL": api.base_url,
+        "WEBHOOK_PORT": str(webhook_port),
+        "WEBHOOK_PATH": "/telegram",
+        "CONCURRENT_UPDATES": str(args.concurrency),
+        # Локально лимиты Telegram не мешают — меряем сам бот
+        "OUTBOX_GLOBAL_RATE": "1000000",
+        "OUTBOX_CHAT_RATE": "1000000",
+        "OUTBOX_CHAT_BURST": "1000000",
+    })
+    if args.shards:
+        bot = None
+        os.environ.update({
+            "SHARDS": str(args.shards),
+            "SHARD_PORT_BASE": str(free_port()),
+            "LEADERBOARD_DB_PATH": args.leaderboard_db,
+        })
+        # Шарды — отдельные процессы: ждём, пока диспетчер поднимет их всех
+        dispatcher = subprocess.Popen([sys.executable, os.path.join(ROOT, "shards.py")])
+        ready_timeout = 600
+    else:
+        import bot
+        # Лог каждого HTTP-запроса httpx сам по себе съедает заметную долю CPU
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        logging.getLogger("telegram.ext.Application").setLevel(logging.WARNING)
+
+        application = bot.build_application(webhook=True)
+        stop = asyncio.Event()
+        server_task = asyncio.create_task(bot.run_webhook(application, stop))
+        ready_timeout = 100
+    for _ in range(ready_timeout):
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", webhook_port)
+            writer.close()
+            break
+        except OSError:
+            await asyncio.sleep(0.05)
+
+    rng = random.Random(args.seed)
+    clients = [WebhookClient(webhook_port, "/telegram") for _ in range(args.players)]
+    players = [Player(10_000 + i, clients[i], api, random.Random(rng.random())) for i in range(args.players)]
+    post_latencies, click_latencies = [], []
+
+    started = time.perf_counter()
+    await asyncio.gather(*(p.play(args.clicks, args.double_tap, post_latencies, click_latencies) for p in players))
+    elapsed = time.perf_counter() - started
+
+    for client in clients:
+        client.close()
+    if bot is None:
+        dispatcher.send_signal(signal.SIGTERM)
+        await asyncio.get_running_loop().run_in_executor(None, dispatcher.wait)
+    else:
+        stop.set()
+        await server_task
+    await api.stop()
+
+    updates = args.players * (args.clicks + 1)
+    double_taps = sum(p.double_taps for p in players)
+    print(f"Игроков: {args.players}, обновлений: {updates}, время: {elapsed:.2f} с")
+    print(f"Пропускная способность: {updates / elapsed:.0f} обновлений/с")
+    print(f"POST в вебхук: p50 {percentile(post_latencies, 50) * 1000:.1f} мс, "
+          f"p99 {percentile(post_latencies, 99) * 1000:.1f} мс")
+    print(f"Нажатие → новая сцена: p50 {percentile(click_latencies, 50) * 1000:.1f} мс, "
+          f"p95 {percentile(click_latencies, 95) * 1000:.1f} мс, "
+          f"p99 {percentile(click_latencies, 99) * 1000:.1f} мс, "
+          f"среднее {statistics.mean(click_latencies) * 1000:.1f} мс")
+    if double_taps and bot is not None:
+        print(f"Двойных тапов: {double_taps}, отброшено ботом: {bot.recent_clicks.dropped}")
+    calls = sum(api.calls.values())
+    print(f"Вызовов Bot API: {calls} ({calls / updates:.2f} на обновление): {dict(api.calls)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=100)
+    parser.add_argument("--clicks", type=int, default=30, help="нажатий на игрока после /start")
+    parser.add_argument("--concurrency", type=int, default=64, help="CONCURRENT_UPDATES бота")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка заглушки Bot API, с")
+    parser.add_argument("--double-tap", type=float, default=0.0, help="доля нажатий, продублированных вторым тапом")
+    parser.add_argument("--shards", type=int, default=0, help="запустить shards.py с N процессами-шардами")
+    parser.add_argument("--leaderboard-db", default="harness_leaderboard.db", help="база рейтинга диспетчера")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,34 @@
 import os
+import time
+import asyncio
 import logging
 import random
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
+import signal
+from collections import namedtuple
+from contextvars import ContextVar
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from telegram import Update
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, TypeHandler
+from storage import MemoryStateStore, SQLiteStateStore, JournalStateStore
+from game_state import GameState, dump_state, load_state, seed_stream, next_seed
+import render
+import achievements
+from outbox import Outbox, PRIORITY_ECHO
+from webhook import HttpServer, WebhookServer
+from metrics import Metrics, NULL_METRICS, monitor_loop_lag, log_snapshots, serve_metrics
+from userlocks import UserLocks, ClickDeduplicator, InFlight
+from solver import Solver, RULES_KEY as SOLVER_RULES_KEY
+from leaderboard import Leaderboard
+from shards import RemoteLeaderboard
+from content import DEFAULT_PATH as DEFAULT_CONTENT_PATH, ContentError, load_scenario
+from analytics import Analytics, NULL_ANALYTICS, CHOICE, SCENE, DAY_END, DAY_START
+from recorder import Recorder, NULL_RECORDER
+from cards import CardCache, available as cards_available
+from engine import (
+    time_to_str, apply_transition, roll_random_event,
+    generate_day_type, begin_next_day, calculate_total_score, finish_day,
+)
 
 # ========== НАСТРОЙКА ЛОГГИРОВАНИЯ ==========
 logging.basicConfig(
@@ -13,769 +39,1038 @@ logging.basicConfig(
 # ========== КОНФИГУРАЦИЯ ==========
 BOT_TOKEN = os.environ.get("BOT_TOKEN", "your_telegram_bot_token")
 CHANNEL_USERNAME = os.environ.get("CHANNEL_USERNAME", "@your_channel")
+SUBSCRIPTION_TTL = float(os.environ.get("SUBSCRIPTION_TTL", "600"))
+SUBSCRIPTION_NEGATIVE_TTL = float(os.environ.get("SUBSCRIPTION_NEGATIVE_TTL", "5"))
+SUBSCRIPTION_CACHE_SIZE = int(os.environ.get("SUBSCRIPTION_CACHE_SIZE", "100000"))
+STATE_BACKEND = os.environ.get("STATE_BACKEND", "memory")
+STATE_DB_PATH = os.environ.get("STATE_DB_PATH", "states.db")
+STATE_FLUSH_INTERVAL = float(os.environ.get("STATE_FLUSH_INTERVAL", "1.0"))
+STATE_MAX_ENTRIES = int(os.environ.get("STATE_MAX_ENTRIES", "50000"))
+STATE_IDLE_TIMEOUT = float(os.environ.get("STATE_IDLE_TIMEOUT", "1800"))
+JOURNAL_DIR = os.environ.get("JOURNAL_DIR", "journal")
+JOURNAL_COMMIT_INTERVAL = float(os.environ.get("JOURNAL_COMMIT_INTERVAL", "0.05"))
+JOURNAL_SNAPSHOT_INTERVAL = float(os.environ.get("JOURNAL_SNAPSHOT_INTERVAL", "600"))
+JOURNAL_SEGMENT_MB = float(os.environ.get("JOURNAL_SEGMENT_MB", "64"))
+JOURNAL_FSYNC = os.environ.get("JOURNAL_FSYNC", "1") == "1"
+TRANSITION_MODE = os.environ.get("TRANSITION_MODE", "edit")
+OUTBOX_GLOBAL_RATE = float(os.environ.get("OUTBOX_GLOBAL_RATE", "30"))
+OUTBOX_CHAT_RATE = float(os.environ.get("OUTBOX_CHAT_RATE", "1"))
+OUTBOX_CHAT_BURST = int(os.environ.get("OUTBOX_CHAT_BURST", "3"))
+OUTBOX_MAX_RETRIES = int(os.environ.get("OUTBOX_MAX_RETRIES", "3"))
+BOT_MODE = os.environ.get("BOT_MODE", "polling")
+BOT_API_BASE_URL = os.environ.get("BOT_API_BASE_URL", "")
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+CONCURRENT_UPDATES = int(os.environ.get("CONCURRENT_UPDATES", "64" if BOT_MODE == "webhook" else "1"))
+CLICK_DEDUP_TTL = float(os.environ.get("CLICK_DEDUP_TTL", "2.0"))
+SHUTDOWN_TIMEOUT = float(os.environ.get("SHUTDOWN_TIMEOUT", "10"))
+HINTS_ENABLED = os.environ.get("HINTS_ENABLED", "0") == "1"
+SOLVER_TABLE_PATH = os.environ.get("SOLVER_TABLE_PATH", "solver_table.bin")
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "0") == "1"
+METRICS_LISTEN = os.environ.get("METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+METRICS_LOG_INTERVAL = float(os.environ.get("METRICS_LOG_INTERVAL", "0"))
+CONTENT_PATH = os.environ.get("CONTENT_PATH", DEFAULT_CONTENT_PATH)
+CONTENT_CACHE_PATH = os.environ.get("CONTENT_CACHE_PATH", "scenario.cache")
+ADMIN_IDS = frozenset(int(x) for x in os.environ.get("ADMIN_IDS", "").split(",") if x.strip())
+LEADERBOARD_URL = os.environ.get("LEADERBOARD_URL", "")
+SHARD_INDEX = int(os.environ.get("SHARD_INDEX", "0"))
+SHARD_COUNT = int(os.environ.get("SHARD_COUNT", "1"))
+ANALYTICS_ENABLED = os.environ.get("ANALYTICS_ENABLED", "0") == "1"
+ANALYTICS_DIR = os.environ.get("ANALYTICS_DIR", "analytics")
+ANALYTICS_QUEUE_SIZE = int(os.environ.get("ANALYTICS_QUEUE_SIZE", "10000"))
+ANALYTICS_FLUSH_INTERVAL = float(os.environ.get("ANALYTICS_FLUSH_INTERVAL", "60"))
+ANALYTICS_ROTATE_MB = float(os.environ.get("ANALYTICS_ROTATE_MB", "16"))
+ANALYTICS_KEEP_FILES = int(os.environ.get("ANALYTICS_KEEP_FILES", "48"))
+RECORD_PATH = os.environ.get("RECORD_PATH", "")
+RECORD_FLUSH_INTERVAL = float(os.environ.get("RECORD_FLUSH_INTERVAL", "5"))
+RNG_SALT = int(os.environ.get("RNG_SALT", "0"))
+CARDS_ENABLED = os.environ.get("CARDS_ENABLED", "0") == "1"
+CARD_WORKERS = int(os.environ.get("CARD_WORKERS", "1"))
+CARD_CACHE_SIZE = int(os.environ.get("CARD_CACHE_SIZE", "10000"))
+CARD_MAX_PENDING = int(os.environ.get("CARD_MAX_PENDING", "32"))
+CARD_FONT_PATH = os.environ.get("CARD_FONT_PATH", "")
 
-# ========== СОСТОЯНИЯ ИГРЫ ==========
-class GameState:
-    def __init__(self):
-        # Основные метрики (0-10)
-        self.career = 0
-        self.family = 0 
-        self.energy = 8
-        self.skills = 0
-        
-        # Время и прогресс
-        self.hours = 15
-        self.minutes = 0
-        self.day = 1
-        self.total_score = 0
-        self.days_completed = 0
-        self.day_type = "normal"
-        
-        # Игровые механики
-        self.achievements = []
-        self.special_events_seen = []
-        
-        # Системные
-        self.checked_subscription = False
-        self.current_scene = "start"
-        self.player_name = "Герой"
-        self.pending_scene = None
+# ========== МЕТРИКИ ==========
+# Выключенные метрики — пустые вызовы, на горячем пути почти бесплатно
+metrics = Metrics() if METRICS_ENABLED else NULL_METRICS
+metrics.describe("callbacks_total", "counter", "Нажатия кнопок по действию")
+metrics.describe("callback_latency_seconds", "histogram", "Время обработки нажатия по действию")
+metrics.describe("callbacks_dropped_total", "counter", "Отброшенные повторные нажатия")
+metrics.describe("callbacks_stale_total", "counter", "Нажатия устаревших кнопок")
+metrics.describe("random_event_rolls_total", "counter", "Броски случайного события")
+metrics.describe("random_events_total", "counter", "Случившиеся случайные события")
+metrics.describe("content_reloads_total", "counter", "Перезагрузки сценария по результату")
+metrics.describe("hint_solves_total", "counter", "Подсказки, посчитанные поиском вне таблицы")
+
+# ========== АНАЛИТИКА ==========
+# Как и метрики: выключенная аналитика — пустой emit
+analytics = Analytics(
+    ANALYTICS_DIR,
+    queue_size=ANALYTICS_QUEUE_SIZE,
+    flush_interval=ANALYTICS_FLUSH_INTERVAL,
+    rotate_bytes=int(ANALYTICS_ROTATE_MB * 2**20),
+    keep_files=ANALYTICS_KEEP_FILES,
+) if ANALYTICS_ENABLED else NULL_ANALYTICS
+
+# Запись входящих обновлений для benchmarks/replay.py
+recorder = Recorder(RECORD_PATH, flush_interval=RECORD_FLUSH_INTERVAL) if RECORD_PATH else NULL_RECORDER
+
+# ========== КАРТОЧКИ РЕЗУЛЬТАТА ==========
+# Картинка итогов дня; без Pillow (pip install pillow) итоги остаются текстом
+if CARDS_ENABLED and not cards_available():
+    logging.warning("CARDS_ENABLED=1, но Pillow не установлен — карточки результата выключены")
+card_cache = CardCache(
+    max_size=CARD_CACHE_SIZE, workers=CARD_WORKERS, font_path=CARD_FONT_PATH or None,
+    max_pending=CARD_MAX_PENDING,
+) if CARDS_ENABLED and cards_available() else None
 
 # ========== ГЛОБАЛЬНОЕ ХРАНИЛИЩЕ ==========
-user_states = {}
-
-# ========== СИСТЕМА ВРЕМЕНИ ==========
-def add_time(state, hours=0, minutes=0):
-    """Добавляет время и возвращает обновленное состояние"""
-    total_minutes = state.hours * 60 + state.minutes + hours * 60 + minutes
-    state.hours = total_minutes // 60
-    state.minutes = total_minutes % 60
-    return state
+def create_state_store():
+    if STATE_BACKEND == "sqlite":
+        return SQLiteStateStore(
+            STATE_DB_PATH, dump_state, load_state,
+            flush_interval=STATE_FLUSH_INTERVAL,
+            max_entries=STATE_MAX_ENTRIES,
+            idle_timeout=STATE_IDLE_TIMEOUT,
+        )
+    if STATE_BACKEND == "journal":
+        return JournalStateStore(
+            JOURNAL_DIR, dump_state, load_state,
+            # replay_step объявлен ниже; восстановление идёт в post_init, когда модуль уже загружен
+            replay=lambda *record: replay_step(*record),
+            commit_interval=JOURNAL_COMMIT_INTERVAL,
+            snapshot_interval=JOURNAL_SNAPSHOT_INTERVAL,
+            segment_bytes=int(JOURNAL_SEGMENT_MB * 2**20),
+            fsync=JOURNAL_FSYNC,
+            max_entries=STATE_MAX_ENTRIES,
+            idle_timeout=STATE_IDLE_TIMEOUT,
+        )
+    # В памяти выгружать некуда: лимиты держат только sqlite и journal
+    if "STATE_MAX_ENTRIES" in os.environ or "STATE_IDLE_TIMEOUT" in os.environ:
+        logging.warning(
+            "STATE_MAX_ENTRIES и STATE_IDLE_TIMEOUT не действуют при STATE_BACKEND=memory — "
+            "все игроки остаются в памяти; для ограничения нужен sqlite или journal"
+        )
+    return MemoryStateStore()
+
+state_store = create_state_store()
 
-def time_to_str(state):
-    return f"{state.hours:02d}:{state.minutes:02d}"
+# Рейтинг сохраняется в той же базе и тем же сбросом, что и состояния.
+# В шардированном режиме (shards.py) он общий для всех процессов и живёт в диспетчере
+if LEADERBOARD_URL:
+    leaderboard = RemoteLeaderboard(LEADERBOARD_URL)
+else:
+    leaderboard = Leaderboard()
+    state_store.attach_table(leaderboard)
 
-def is_late(state):
-    return state.hours > 18 or (state.hours == 18 and state.minutes > 40)
+# При параллельной обработке обновления одного игрока всё равно идут по очереди
+user_locks = UserLocks()
+recent_clicks = ClickDeduplicator(ttl=CLICK_DEDUP_TTL)
+# Начатые обработчики: при остановке их дожидаются, по истечении срока — прерывают
+in_flight = InFlight()
 
 # ========== ПРОВЕРКА ПОДПИСКИ ==========
+class SubscriptionCache:
+    """Кэш подписки: положительные ответы живут долго, отрицательные — недолго,
+    параллельные запросы по одному user_id склеиваются в один вызов Bot API"""
+
+    def __init__(self, positive_ttl, negative_ttl, max_size):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries = {}   # user_id -> (подписан, момент истечения)
+        self._inflight = {}  # user_id -> asyncio.Task
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.api_calls = 0
+        self.errors = 0
+
+    def cached(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del self._entries[user_id]
+            return None
+        return entry[0]
+
+    async def get(self, user_id, bot):
+        is_member = self.cached(user_id)
+        if is_member is not None:
+            self.hits += 1
+            return is_member
+
+        task = self._inflight.get(user_id)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = self._start(user_id, bot)
+        return await asyncio.shield(task)
+
+    def prefetch(self, user_id, bot):
+        """Запускает проверку в фоне, если ответа нет в кэше и запрос ещё не идёт"""
+        if user_id in self._inflight or self.cached(user_id) is not None:
+            return
+        self._start(user_id, bot)
+
+    def _start(self, user_id, bot):
+        task = asyncio.create_task(self._fetch(user_id, bot))
+        self._inflight[user_id] = task
+        task.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return task
+
+    async def _fetch(self, user_id, bot):
+        self.api_calls += 1
+        try:
+            member = await bot.get_chat_member(chat_id=CHANNEL_USERNAME, user_id=user_id)
+        except Exception as e:
+            # Ошибки не кэшируем — следующее нажатие спросит Telegram снова
+            self.errors += 1
+            logging.error(f"Ошибка проверки подписки: {e}")
+            return False
+
+        is_member = member.status in ['member', 'administrator', 'creator']
+        ttl = self.positive_ttl if is_member else self.negative_ttl
+        self._store(user_id, is_member, time.monotonic() + ttl)
+        return is_member
+
+    def _store(self, user_id, is_member, expires_at):
+        self._entries.pop(user_id, None)
+        self._entries[user_id] = (is_member, expires_at)
+        if len(self._entries) > self.max_size:
+            now = time.monotonic()
+            for key in [k for k, (_, exp) in self._entries.items() if exp <= now]:
+                del self._entries[key]
+            # Если просроченных не нашлось — вытесняем самые старые записи
+            while len(self._entries) > self.max_size:
+                del self._entries[next(iter(self._entries))]
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "api_calls": self.api_calls,
+            "errors": self.errors,
+            "size": len(self._entries),
+        }
+
+subscription_cache = SubscriptionCache(SUBSCRIPTION_TTL, SUBSCRIPTION_NEGATIVE_TTL, SUBSCRIPTION_CACHE_SIZE)
+SUBSCRIBE_KEYBOARD = render.subscribe_keyboard(CHANNEL_USERNAME)
+
+# ========== ПОДСКАЗКИ ==========
+def create_solver():
+    """Таблица оптимальных ходов: с диска, а если её нет — считаем первый день"""
+    if not HINTS_ENABLED:
+        return None
+    solver = Solver()
+    if not solver.load(SOLVER_TABLE_PATH):
+        solver.precompute(days=1)
+        if SHARD_COUNT > 1:
+            # Общую таблицу пишет только диспетчер shards.py — шард считает свою в памяти
+            logging.warning(f"Таблица подсказок {SOLVER_TABLE_PATH} не загрузилась — посчитана заново, без сохранения")
+            return solver
+        try:
+            solver.save(SOLVER_TABLE_PATH)
+        except OSError as e:
+            logging.error(f"Не удалось сохранить таблицу подсказок: {e}")
+    return solver
+
+solver = create_solver()
+# Промахи таблицы подсказок решаются в одном отдельном потоке: поиск по
+# дереву — 10–15 мс чистого Python, цикл событий его не ждёт
+hint_executor = ThreadPoolExecutor(1, thread_name_prefix="hints") if solver is not None else None
+
+# ========== ИСХОДЯЩИЕ ЗАПРОСЫ ==========
+# Все вызовы Bot API идут через этот планировщик (он подключён как rate limiter)
+outbox = Outbox(
+    global_rate=OUTBOX_GLOBAL_RATE,
+    chat_rate=OUTBOX_CHAT_RATE,
+    chat_burst=OUTBOX_CHAT_BURST,
+    max_retries=OUTBOX_MAX_RETRIES,
+    metrics=metrics,
+)
+
 async def check_subscription(user_id, context: ContextTypes.DEFAULT_TYPE):
-    try:
-        member = await context.bot.get_chat_member(chat_id=CHANNEL_USERNAME, user_id=user_id)
-        return member.status in ['member', 'administrator', 'creator']
-    except Exception as e:
-        logging.error(f"Ошибка проверки подписки: {e}")
-        return False
+    return await subscription_cache.get(user_id, context.bot)
+
+# ========== ВЫВОД СЦЕН ==========
+# Режим "edit": выбор игрока и следующая сцена показываются одним редактированием
+# нажатого сообщения. Режим "transcript": как в чате — кнопки убираются, выбор
+# дублируется отдельным сообщением, сцена приходит новым сообщением.
+class ClickOutput:
+    """Что уже отправлено в ответ на текущее нажатие кнопки"""
+    __slots__ = ("choice", "edited")
+
+    def __init__(self):
+        self.choice = None
+        self.edited = False
+
+_click_output = ContextVar("click_output", default=None)
 
-# ========== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==========
 async def remove_buttons_and_show_choice(query, choice_text):
+    click = _click_output.get()
+    if TRANSITION_MODE == "edit" and click is not None and not click.edited:
+        # Эхо уйдёт вместе со следующей сценой
+        click.choice = choice_text
+        return
+    # Косметика: в очереди планировщика уступает место сценам других игроков
+    bot = query.get_bot()
+    chat_id = query.message.chat_id
     try:
-        await query.edit_message_reply_markup(reply_markup=None)
-        await query.message.reply_text(f"👤 {choice_text}")
+        await bot.edit_message_reply_markup(
+            chat_id=chat_id, message_id=query.message.message_id,
+            reply_markup=None, rate_limit_args=PRIORITY_ECHO,
+        )
+        await bot.send_message(chat_id=chat_id, text=f"👤 {choice_text}", rate_limit_args=PRIORITY_ECHO)
     except Exception as e:
         logging.error(f"Ошибка при удалении кнопок: {e}")
 
+async def send_scene(query, text, reply_markup=None):
+    """Показывает сцену в ответ на нажатие: правкой сообщения или новым сообщением.
+    Кнопки помечаются текущим номером хода игрока"""
+    state = state_store.get(query.from_user.id)
+    if state is not None:
+        reply_markup = render.stamp(reply_markup, state.seq)
+    click = _click_output.get()
+    if TRANSITION_MODE != "edit" or click is None or click.edited:
+        return await query.message.reply_text(text, reply_markup=reply_markup)
+
+    click.edited = True
+    if click.choice is not None:
+        text = f"👤 {click.choice}\n\n{text}"
+        click.choice = None
+    try:
+        return await query.edit_message_text(text, reply_markup=reply_markup)
+    except Exception as e:
+        logging.error(f"Ошибка при редактировании сообщения: {e}")
+        return await query.message.reply_text(text, reply_markup=reply_markup)
+
 async def restart_game(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
-    user_states[user_id] = GameState()
     await start(update, context)
 
-def calculate_total_score(state):
-    base_score = (state.career + state.family + state.energy + state.skills) * 10
-    day_bonus = state.days_completed * 50
-    achievement_bonus = len(state.achievements) * 30
-    
-    total = base_score + day_bonus + achievement_bonus
-    
-    # Бонусы за высокие показатели
-    if state.career >= 8: total += 50
-    if state.family >= 8: total += 50  
-    if state.energy >= 8: total += 50
-    if state.skills >= 8: total += 50
-        
-    return total
-
-def generate_day_type(state):
-    day_types = ["normal", "career_crisis", "family_crisis", "lucky_day", "energy_drain", "skill_focus"]
-    
-    if state.days_completed >= 3 and random.random() < 0.6:
-        return random.choice(["career_crisis", "family_crisis", "energy_drain"])
-    
-    return random.choice(day_types)
-
-def get_day_modifiers(day_type):
-    modifiers = {
-        "normal": {"time_mod": 1.0, "energy_mod": 1.0},
-        "career_crisis": {"time_mod": 1.2, "energy_mod": 0.8, "career_bonus": 1},
-        "family_crisis": {"time_mod": 1.3, "energy_mod": 0.7, "family_bonus": 1},
-        "lucky_day": {"time_mod": 0.8, "energy_mod": 1.2},
-        "energy_drain": {"time_mod": 1.1, "energy_mod": 0.6},
-        "skill_focus": {"time_mod": 1.0, "energy_mod": 1.1, "skill_bonus": 1}
-    }
-    return modifiers.get(day_type, modifiers["normal"])
-
 async def share_results_button(query, state):
-    share_text = f"Я·играю·в·Гонку·до·Универа!·День:{state.day}|Счет:{state.total_score}|Энергия:{state.energy}|Карьера:{state.career}|Семья:{state.family}|Навыки:{state.skills}|Достижений:{len(state.achievements)}|Присоединяйся!"
-    
-    share_url = f"https://t.me/share/url?url=https://t.me/SurvivalStudentGameBot&text={share_text}"
-    
-    keyboard = [
-        [InlineKeyboardButton("📤 Поделиться результатом", url=share_url)],
-        [InlineKeyboardButton("🔄 Следующий день", callback_data="next_day")],
-        [InlineKeyboardButton("🔄 Начать заново", callback_data="restart")]
-    ]
-    return InlineKeyboardMarkup(keyboard)
-
-# ========== СЛУЧАЙНЫЕ СОБЫТИЯ ==========
-async def trigger_random_event(query, state, force_chance=None):
-    chance = force_chance if force_chance is not None else 0.4
-    
-    if state.day_type == "lucky_day":
-        chance = 0.7
-    
-    if random.random() > chance:
-        return state, False
-    
-    events = [
-        {
-            "id": "bonus_award",
-            "text": "🎁 СРОЧНАЯ ПРЕМИЯ!\n\nТвой проект получил срочное финансирование! Начальник даёт отгул!",
-            "effects": {"minutes": -90, "career": 2, "energy": 1},
-            "achievement": "Золотой сотрудник"
-        },
-        {
-            "id": "friend_help", 
-            "text": "🤝 ПОМОЩЬ НА ДОРОГЕ!\n\nДруг встретил по пути и подвёз до универа!",
-            "effects": {"minutes": -40, "family": 1},
-            "achievement": "Настоящий друг"
-        },
-        {
-            "id": "traffic_jam",
-            "text": "🚗 ПРОБКА НА ДОРОГЕ!\n\nНеожиданная пробка задержала на полчаса!",
-            "effects": {"minutes": 30, "energy": -1},
-            "achievement": None
-        },
-        {
-            "id": "kids_amazing",
-            "text": "🏆 ДЕТИ ПОМОГАЮТ!\n\nДети сами сделали уроки и освободили время!",
-            "effects": {"minutes": -45, "family": 2, "energy": 1},
-            "achievement": "Суперродитель"
-        }
-    ]
-    
-    available_events = [e for e in events if e["id"] not in state.special_events_seen]
-    if not available_events:
-        available_events = events
-    
-    event = random.choice(available_events)
-    state.special_events_seen.append(event["id"])
-    
-    old_time = f"{state.hours:02d}:{state.minutes:02d}"
-    
-    # ПРИМЕНЯЕМ ЭФФЕКТЫ
-    if "minutes" in event["effects"]:
-        state = add_time(state, minutes=event["effects"]["minutes"])
-    if "career" in event["effects"]:
-        state.career = min(10, max(0, state.career + event["effects"]["career"]))
-    if "family" in event["effects"]:
-        state.family = min(10, max(0, state.family + event["effects"]["family"]))
-    if "energy" in event["effects"]:
-        state.energy = min(10, max(0, state.energy + event["effects"]["energy"]))
-    if "skills" in event["effects"]:
-        state.skills = min(10, max(0, state.skills + event["effects"]["skills"]))
-    
-    new_time = f"{state.hours:02d}:{state.minutes:02d}"
-    
-    text = f"🎲 СЛУЧАЙНОЕ СОБЫТИЕ!\n\n{event['text']}"
-    
-    # Показываем эффекты
-    effects_text = ""
-    if "minutes" in event["effects"]:
-        effects_text += f"⏰ Время: {old_time} → {new_time}\n"
-    if "career" in event["effects"] and event["effects"]["career"] != 0:
-        effects_text += f"💼 Карьера {event['effects']['career']:+d}\n"
-    if "family" in event["effects"] and event["effects"]["family"] != 0:
-        effects_text += f"👨‍👩‍👧‍👦 Семья {event['effects']['family']:+d}\n"
-    if "energy" in event["effects"] and event["effects"]["energy"] != 0:
-        effects_text += f"⚡ Энергия {event['effects']['energy']:+d}\n"
-    
-    if effects_text:
-        text += f"\nЭффекты:\n{effects_text}"
-    
-    if event["achievement"] and event["achievement"] not in state.achievements:
-        state.achievements.append(event["achievement"])
-        text += f"\n🏆 Получено достижение: {event['achievement']}"
-    
-    keyboard = [[InlineKeyboardButton("✨ Продолжить", callback_data="continue_after_event")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.message.reply_text(text, reply_markup=reply_markup)
-    return state, True
+    share_url = render.share_url(state, achievements.count(state.achievements))
+    return render.share_keyboard(share_url)
+
+def send_result_card(query, state):
+    """Карточка итогов отдельным сообщением: повтор тех же итогов уходит по file_id.
+
+    Рисование и загрузка идут фоновой задачей — замок игрока отпускается
+    сразу после текста сцены. Ключ снимается здесь, пока состояние под
+    замком: после него игрок может уже начать новую игру.
+    """
+    key = (
+        state.day, state.total_score, state.energy, state.career, state.family, state.skills,
+        achievements.count(state.achievements),
+    )
+
+    bot = query.get_bot()
+    chat_id = query.message.chat_id
+
+    async def send_photo(photo):
+        # Косметика, как и эхо выбора: сцены других игроков идут раньше
+        return await bot.send_photo(chat_id=chat_id, photo=photo, rate_limit_args=PRIORITY_ECHO)
+
+    async def send():
+        try:
+            await card_cache.send(key, send_photo)
+        except Exception as e:
+            logging.error(f"Ошибка отправки карточки результата: {e}")
+
+    in_flight.spawn(send)
+
+# ========== ШАГИ СОСТОЯНИЯ ==========
+# Всё, что нажатие меняет в состоянии, делает apply_step: синхронно, без
+# ввода-вывода и со своим rng. Поэтому ход записывается в журнал одной
+# строкой (игрок, действие, зерно rng), а при восстановлении повторяется
+# той же функцией с тем же результатом. Обработчики только показывают итог.
+# Зерно хода берётся из личного потока игрока (game_state.next_seed), так что
+# одна и та же последовательность нажатий всегда даёт одну и ту же игру.
+START_ACTION = "start"
+
+# event — EventOutcome, если ход прервало событие; иначе scene — сцена, которую
+# показать, и day_result — итоги дня, если эта сцена — final; variant — номер
+# варианта текста сцены
+StepResult = namedtuple("StepResult", ["event", "scene", "day_result", "variant"], defaults=(0,))
+
+def new_game(name, seed=0, seq=0):
+    """Новая партия; seed — зерно потока rng, 0 — засеять от user_id при первом ходе;
+    seq — номер хода, с которого продолжить, чтобы кнопки прошлой партии устарели"""
+    state = GameState()
+    state.player_name = name
+    state.seq = seq
+    if seed:
+        seed_stream(state, seed)
+    return state
+
+def begin_step(user_id, state):
+    """Новый номер хода и зерно хода из потока игрока. Незасеянный поток
+    (новая партия без зерна) засевается от user_id"""
+    state.seq = (state.seq + 1) % render.SEQ_MODULO
+    if not state.rng:
+        seed_stream(state, user_id ^ RNG_SALT)
+    return next_seed(state)
+
+def enter_scene(state, scene, scenario):
+    if scene == "final":
+        return StepResult(None, "final", finish_day(state))
+    if scene not in scenario.scene_texts:
+        # Сцены нет в перезагруженном сценарии — продолжаем с первой сцены дня
+        scene = scenario.transitions["start_day"].next_scene
+    state.current_scene = scene
+    return StepResult(None, scene, None)
+
+def apply_step(state, action, scenario, rng):
+    if action == "check_subscription":
+        state.checked_subscription = True
+        state.day_type = generate_day_type(state, rng)
+    elif action == "next_day":
+        begin_next_day(state)
+        state.day_type = generate_day_type(state, rng)
+    elif action == "show_stats":
+        state.total_score = calculate_total_score(state)
+    elif action == "continue_after_event":
+        return enter_scene(state, state.pending_scene, scenario)
+    else:
+        transition = scenario.transitions[action]
+        apply_transition(state, transition)
+        if transition.event_chance is not None:
+            outcome = roll_random_event(state, scenario.events, transition.event_chance, rng)
+            if outcome is not None:
+                return StepResult(outcome, None, None)
+        return enter_scene(state, transition.next_scene, scenario)
+    return None
+
+def play_step(user_id, state, action, scenario=None):
+    """Ход игрока: меняет состояние и отмечает ход в хранилище (журнале)"""
+    seed = begin_step(user_id, state)
+    scenario = scenario or active.scenario
+    day_type = state.day_type
+    rng = random.Random(seed)
+    result = apply_step(state, action, scenario, rng)
+    state_store.record(user_id, action, seed)
+    if result is not None and result.scene is not None:
+        # Вариант текста — из того же rng после ходов игры: на состояние он не
+        # влияет, поэтому при повторе из журнала его можно не тянуть
+        texts = scenario.scene_texts.get(result.scene, ())
+        if len(texts) > 1:
+            result = result._replace(variant=rng.randrange(len(texts)))
+    if analytics.enabled:
+        track_step(state, action, day_type, result, scenario)
+    return result
+
+def track_step(state, action, day_type, result, scenario):
+    """Записи аналитики о ходе: выбор, достигнутая сцена, итог дня"""
+    if action in scenario.transitions:
+        analytics.emit(CHOICE, day_type, action)
+    elif action in ("check_subscription", "next_day"):
+        analytics.emit(SCENE, state.day_type, DAY_START)
+    if result is None or result.scene is None:
+        return
+    analytics.emit(SCENE, state.day_type, result.scene)
+    if result.day_result is not None:
+        analytics.emit(DAY_END, state.day_type, "late" if result.day_result.late else "on_time")
+
+def replay_step(states, user_id, action, seed, payload):
+    """Повтор хода из журнала; False — ход не применить (нет игрока или хода в сценарии)"""
+    state = states.get(user_id)
+    if action == START_ACTION:
+        # Как в start: номер хода продолжает прошлую партию
+        if state is not None:
+            begin_step(user_id, state)
+        states[user_id] = new_game(payload.decode("utf-8"), seed, state.seq if state is not None else 0)
+        return True
+    if state is None:
+        return False
+    # Номер и поток продвигаются как в play_step; сам ход — по записанному зерну
+    begin_step(user_id, state)
+    try:
+        apply_step(state, action, active.scenario, random.Random(seed))
+    except KeyError:
+        return False
+    return True
+
+async def show_event(query, state, outcome, old_time, content):
+    metrics.inc("random_events_total", (("event", outcome.event.id),))
+    text = render.event_text(outcome, content.event_templates[outcome.event.id], old_time, time_to_str(state))
+    await send_scene(query, text, render.CONTINUE_KEYBOARD)
 
 # ========== ОСНОВНЫЕ СЦЕНЫ ИГРЫ ==========
+async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    with in_flight.track():
+        async with user_locks.hold(update.message.from_user.id):
+            await start(update, context)
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
     if update.message:
         user_id = update.message.from_user.id
-        message = update.message
     else:
-        query = update.callback_query
         user_id = query.from_user.id
-        message = query.message
-    
-    user_states[user_id] = GameState()
-    state = user_states[user_id]
     
     first_name = update.effective_user.first_name or "Герой"
-    state.player_name = first_name
-    
-    welcome_text = (
-        f"🎮 ГОНКА ДО УНИВЕРА: ИСКУССТВО ЖИЗНЕННОГО БАЛАНСА\n\n"
-        f"Привет, {first_name}! 👋\n\n"
-        "Ты — современный супергерой: студент вечернего отделения, работник, партнер и родитель троих детей!\n\n"
-        "ТВОЯ МИССИЯ:\n"
-        "🕒 Успеть на пару к 18:40\n"  
-        "👨‍👩‍👧‍👦 Сохранить семью счастливой\n"
-        "💼 Не потерять работу\n"
-        "⚡ Не выгореть от усталости\n\n"
-        "ОСОБЕННОСТИ:\n"
-        "👉 Случайные события и кризисы\n"
-        "👉 Система прокачки навыков\n"
-        "👉 Достижения и рейтинг\n"
-        "👉 Многодневная кампания\n\n"
-        f"📢 Для старта подпишись на канал автора:\n{CHANNEL_USERNAME}"
-    )
-    
-    keyboard = [
-        [InlineKeyboardButton("🔍 Проверить подписку", callback_data="check_subscription")],
-        [InlineKeyboardButton("📺 Перейти в канал", url=f"https://t.me/{CHANNEL_USERNAME[1:]}")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await message.reply_text(welcome_text, reply_markup=reply_markup)
+    # Новая партия продолжает поток прошлой, чтобы перезапуск не повторял игру,
+    # и её номер хода, чтобы кнопки прошлой партии устарели
+    previous = state_store.get(user_id)
+    seed = begin_step(user_id, previous) if previous is not None else 0
+    state = new_game(first_name, seed, previous.seq if previous is not None else 0)
+    state_store.put(user_id, state)
+    state_store.record(user_id, START_ACTION, seed, first_name.encode("utf-8"))
+    
+    # Проверяем подписку заранее, пока игрок читает приветствие
+    subscription_cache.prefetch(user_id, context.bot)
+    
+    welcome_text = render.WELCOME.format(name=first_name, channel=CHANNEL_USERNAME)
+    if update.message:
+        await update.message.reply_text(welcome_text, reply_markup=render.stamp(SUBSCRIBE_KEYBOARD, state.seq))
+    else:
+        await send_scene(query, welcome_text, SUBSCRIBE_KEYBOARD)
 
 async def start_day_message(query, state):
-    state.day_type = generate_day_type(state)
-    
-    day_descriptions = {
-        "normal": "📅 ОБЫЧНЫЙ ДЕНЬ\nСтандартные вызовы и задачи",
-        "career_crisis": "💥 КРИЗИС НА РАБОТЕ\nЗадачи сложнее, но больше карьерного опыта",  
-        "family_crisis": "👨‍👩‍👧‍👦 СЕМЕЙНЫЙ КРИЗИС\nСемья требует больше внимания и заботы",
-        "lucky_day": "🍀 УДАЧНЫЙ ДЕНЬ\nВыше шанс позитивных событий и бонусов",
-        "energy_drain": "😫 ДЕНЬ УСТАЛОСТИ\nЭнергия тратится быстрее, нужна осторожность",
-        "skill_focus": "🔧 ДЕНЬ НАВЫКОВ\nОтличная возможность прокачать умения"
-    }
-    
-    day_text = (
-        f"🎮 ГОНКА ДО УНИВЕРА: День {state.day} 🎮\n\n"
-        f"🌟 {day_descriptions[state.day_type]}\n\n"
-        f"🕒 Сейчас {time_to_str(state)}\n"
-        f"📚 Пары начинаются в 18:40\n\n"
-        f"⚡ Твои ресурсы:\n"
-        f"Энергия: {state.energy}/10\n"
-        f"Карьера: {state.career}/10\n"
-        f"Семья: {state.family}/10\n"
-        f"Навыки: {state.skills}/10\n\n"
-        "Готов к новым вызовам?"
-    )
-    
-    keyboard = [[InlineKeyboardButton("🚀 Начать день!", callback_data="start_day")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.message.reply_text(day_text, reply_markup=reply_markup)
+    day_text = render.day_start_text(state, time_to_str(state))
+    await send_scene(query, day_text, render.START_DAY_KEYBOARD)
 
 # ========== ИСПРАВЛЕННЫЙ ОБРАБОТЧИК CALLBACK ==========
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
-    
     user_id = query.from_user.id
-    current_state = user_states.get(user_id)
-    
-    if not current_state:
-        await query.edit_message_text("Игра не найдена. Начни заново: /start")
-        return
+    # В режиме edit одно сообщение переиспользуется под все сцены, поэтому
+    # сообщение различаем ещё и по версии: edit_date меняется с каждой правкой
+    message = query.message
+    message_key = (message.message_id, message.edit_date) if message else query.inline_message_id
+    seq, data = render.unpack_callback(query.data)
 
-    # ========== СИСТЕМНЫЕ КОМАНДЫ ==========
-    if query.data == "restart":
-        await remove_buttons_and_show_choice(query, "Начать заново 🔄")
-        await restart_game(update, context, user_id)
+    # Двойной тап: второе нажатие не трогает ни состояние, ни Bot API
+    if recent_clicks.is_duplicate(user_id, message_key, query.data):
+        metrics.inc("callbacks_dropped_total")
         return
 
-    elif query.data == "check_subscription":
-        if await check_subscription(user_id, context):
-            current_state.checked_subscription = True
-            await remove_buttons_and_show_choice(query, "Подписка проверена ✅")
-            await start_day_message(query, current_state)
-        else:
-            text = (
-                "❌ Вы еще не подписаны на канал\n\n"
-                "Подпишитесь на канал и нажмите кнопку проверки:\n"
-                f"{CHANNEL_USERNAME}"
-            )
-            keyboard = [
-                [InlineKeyboardButton("🔍 Проверить подписку", callback_data="check_subscription")],
-                [InlineKeyboardButton("📺 Перейти в канал", url=f"https://t.me/{CHANNEL_USERNAME[1:]}")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text(text, reply_markup=reply_markup)
-        return
+    started = time.perf_counter()
+    try:
+        with in_flight.track():
+            async with user_locks.hold(user_id):
+                await process_callback(update, context, query, user_id, data, seq)
+    finally:
+        # Метка — только известные действия, чтобы мусорные данные не плодили ряды
+        known = data in CALLBACK_LABELS or data in active.scenario.transitions
+        action = (("action", data if known else "other"),)
+        metrics.inc("callbacks_total", action)
+        metrics.observe("callback_latency_seconds", time.perf_counter() - started, action)
 
-    elif query.data == "start_day":
-        await remove_buttons_and_show_choice(query, "Начинаем день! 🚀")
-        await scene_work_start(query, current_state)
+async def process_callback(update, context, query, user_id, data, seq):
+    current_state = state_store.get(user_id)
+    if seq is not None and current_state is not None and seq != current_state.seq:
+        # Кнопка из сообщения до последнего хода: только гасим часики, ничего не меняя.
+        # Проверка под блокировкой игрока, поэтому второе быстрое нажатие на ту же
+        # клавиатуру видит уже сделанный первым ход
+        metrics.inc("callbacks_stale_total")
+        await query.answer(render.STALE_BUTTON)
         return
+    if data == "hint":
+        # Подсказка приходит всплывающим окном в ответе на нажатие — сообщение не меняется
+        await on_hint(query, current_state)
+        return
+    await query.answer()
 
-    elif query.data == "continue_after_event":
-        if current_state.pending_scene == "work_decision":
-            await scene_work_decision(query, current_state)
-        elif current_state.pending_scene == "family":
-            await scene_family_crisis(query, current_state)
-        elif current_state.pending_scene == "partner":
-            await scene_partner_dilemma(query, current_state)
-        elif current_state.pending_scene == "transport":
-            await scene_transport(query, current_state)
-        elif current_state.pending_scene == "final":
-            await final_scene(query, current_state)
-        else:
-            await scene_work_start(query, current_state)
+    if not current_state:
+        await query.edit_message_text("Игра не найдена. Начни заново: /start")
         return
 
+    click = ClickOutput()
+    token = _click_output.set(click)
+    try:
+        await dispatch_callback(update, context, query, user_id, current_state, data)
+        if click.choice is not None:
+            # Сцены после выбора не было — показываем эхо как раньше
+            _click_output.set(None)
+            await remove_buttons_and_show_choice(query, click.choice)
+    finally:
+        _click_output.reset(token)
+        state_store.mark_dirty(user_id)
+
+async def dispatch_callback(update, context, query, user_id, current_state, data):
+    handler, requires_subscription = CALLBACK_DISPATCH.get(data, (None, True))
+    transition = None
+    if handler is None:
+        # Игровой ход — из текущего сценария
+        transition = active.scenario.transitions.get(data)
+        if transition is not None:
+            requires_subscription = transition.requires_subscription
+
     # Проверка подписки для игровых действий
-    if not current_state.checked_subscription:
-        text = "⛔ Сначала подпишись на канал"
-        keyboard = [[InlineKeyboardButton("🔍 Проверить подписку", callback_data="check_subscription")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(text, reply_markup=reply_markup)
+    if requires_subscription and not current_state.checked_subscription:
+        await query.edit_message_text(
+            "⛔ Сначала подпишись на канал", reply_markup=render.stamp(render.GATE_KEYBOARD, current_state.seq),
+        )
         return
 
-    # ========== ОСНОВНАЯ ИГРОВАЯ ЛОГИКА ==========
-    
-    # РАБОТА - ИСПРАВЛЕННЫЕ БАЛЛЫ И ВРЕМЯ
-    if query.data == "work_quality":
-        await remove_buttons_and_show_choice(query, "Сделать качественный отчёт 📊")
-        modifiers = get_day_modifiers(current_state.day_type)
-        time_cost = 120  # Фиксированное время, без модификаторов для ясности
-        current_state = add_time(current_state, minutes=time_cost)
-        career_bonus = 3
-        current_state.career = min(10, current_state.career + career_bonus)
-        energy_cost = 2
-        current_state.energy = max(0, current_state.energy - energy_cost)
-        current_state.skills += 1
-        current_state.pending_scene = "work_decision"
-        current_state, event_happened = await trigger_random_event(query, current_state, force_chance=0.3)
-        if not event_happened:
-            await scene_work_decision(query, current_state)
-    
-    elif query.data == "work_fast":
-        await remove_buttons_and_show_choice(query, "Сделать быстрый отчёт ⚡")
-        time_cost = 60
-        current_state = add_time(current_state, minutes=time_cost)
-        career_bonus = 1
-        current_state.career = min(10, current_state.career + career_bonus)
-        energy_cost = 1
-        current_state.energy = max(0, current_state.energy - energy_cost)
-        current_state.pending_scene = "work_decision"
-        current_state, event_happened = await trigger_random_event(query, current_state, force_chance=0.3)
-        if not event_happened:
-            await scene_work_decision(query, current_state)
-    
-    elif query.data == "work_skip":
-        await remove_buttons_and_show_choice(query, "Передать коллеге 🚶")
-        time_cost = 30
-        current_state = add_time(current_state, minutes=time_cost)
-        current_state.career = max(0, current_state.career - 1)
-        energy_cost = 1
-        current_state.energy = max(0, current_state.energy - energy_cost)
-        current_state.pending_scene = "family"
-        current_state, event_happened = await trigger_random_event(query, current_state, force_chance=0.3)
-        if not event_happened:
-            await scene_family_crisis(query, current_state)
-    
-    # СЕМЬЯ - ИСПРАВЛЕННЫЕ БАЛЛЫ И ВРЕМЯ
-    elif query.data == "family_help":
-        await remove_buttons_and_show_choice(query, "Помочь всем детям 👨‍👩‍👧‍👦")
-        time_cost = 90
-        current_state = add_time(current_state, minutes=time_cost)
-        family_bonus = 3
-        current_state.family = min(10, current_state.family + family_bonus)
-        energy_cost = 2
-        current_state.energy = max(0, current_state.energy - energy_cost)
-        current_state.skills += 1
-        current_state.pending_scene = "partner"
-        current_state, event_happened = await trigger_random_event(query, current_state, force_chance=0.3)
-        if not event_happened:
-            await scene_partner_dilemma(query, current_state)
-    
-    elif query.data == "family_quick":
-        await remove_buttons_and_show_choice(query, "Быстрая помощь ⏱️")
-        time_cost = 45
-        current_state = add_time(current_state, minutes=time_cost)
-        family_bonus = 1
-        current_state.family = min(10, current_state.family + family_bonus)
-        energy_cost = 1
-        current_state.energy = max(0, current_state.energy - energy_cost)
-        current_state.pending_scene = "partner"
-        current_state, event_happened = await trigger_random_event(query, current_state, force_chance=0.3)
-        if not event_happened:
-            await scene_partner_dilemma(query, current_state)
-    
-    elif query.data == "family_money":
-        await remove_buttons_and_show_choice(query, "Нанять помощника 💰")
-        time_cost = 20
-        current_state = add_time(current_state, minutes=time_cost)
-        family_bonus = 2
-        current_state.family = min(10, current_state.family + family_bonus)
-        current_state.pending_scene = "partner"
-        current_state, event_happened = await trigger_random_event(query, current_state, force_chance=0.3)
-        if not event_happened:
-            await scene_partner_dilemma(query, current_state)
-    
-    # ПАРТНЕР - ИСПРАВЛЕННЫЕ БАЛЛЫ И ВРЕМЯ
-    elif query.data == "partner_help":
-        await remove_buttons_and_show_choice(query, "Помочь с родителями 🎁")
-        time_cost = 90
-        current_state = add_time(current_state, minutes=time_cost)
-        family_bonus = 2
-        current_state.family = min(10, current_state.family + family_bonus)
-        energy_cost = 1
-        current_state.energy = max(0, current_state.energy - energy_cost)
-        current_state.skills += 1
-        current_state.pending_scene = "transport"
-        current_state, event_happened = await trigger_random_event(query, current_state, force_chance=0.3)
-        if not event_happened:
-            await scene_transport(query, current_state)
-    
-    elif query.data == "partner_apologize":
-        await remove_buttons_and_show_choice(query, "Извиниться и пообещать 💐")
-        time_cost = 30
-        current_state = add_time(current_state, minutes=time_cost)
-        family_bonus = 1
-        current_state.family = min(10, current_state.family + family_bonus)
-        current_state.pending_scene = "transport"
-        current_state, event_happened = await trigger_random_event(query, current_state, force_chance=0.3)
-        if not event_happened:
-            await scene_transport(query, current_state)
-    
-    elif query.data == "partner_ignore":
-        await remove_buttons_and_show_choice(query, "Перенести на завтра ❌")
-        time_cost = 10
-        current_state = add_time(current_state, minutes=time_cost)
-        current_state.family = max(0, current_state.family - 2)
-        energy_cost = 1
-        current_state.energy = max(0, current_state.energy - energy_cost)
-        current_state.pending_scene = "transport"
-        current_state, event_happened = await trigger_random_event(query, current_state, force_chance=0.3)
-        if not event_happened:
-            await scene_transport(query, current_state)
-    
-    # ТРАНСПОРТ - ФИКСИРОВАННОЕ ВРЕМЯ
-    elif query.data == "transport_fix":
-        await remove_buttons_and_show_choice(query, "Починить машину 🔧")
-        time_cost = 60
-        current_state = add_time(current_state, minutes=time_cost)
-        current_state.skills += 2
-        current_state.pending_scene = "final"
-        current_state, event_happened = await trigger_random_event(query, current_state, force_chance=0.3)
-        if not event_happened:
-            await final_scene(query, current_state)
-    
-    elif query.data == "transport_taxi":
-        await remove_buttons_and_show_choice(query, "Вызвать такси 🚕")
-        time_cost = 25
-        current_state = add_time(current_state, minutes=time_cost)
-        current_state.skills += 1
-        current_state.pending_scene = "final"
-        current_state, event_happened = await trigger_random_event(query, current_state, force_chance=0.3)
-        if not event_happened:
-            await final_scene(query, current_state)
-    
-    elif query.data == "transport_bus":
-        await remove_buttons_and_show_choice(query, "Ехать на автобусе 🚌")
-        time_cost = 50
-        current_state = add_time(current_state, minutes=time_cost)
-        current_state.pending_scene = "final"
-        current_state, event_happened = await trigger_random_event(query, current_state, force_chance=0.3)
-        if not event_happened:
-            await final_scene(query, current_state)
-    
-    # СЛУШАЕМ ПРОБЛЕМУ СЕМЬИ
-    elif query.data == "listen_family":
-        await remove_buttons_and_show_choice(query, "Выслушал проблему семьи 👂")
-        await scene_family_crisis(query, current_state)
+    if transition is not None:
+        await run_transition(transition, update, context, query, user_id, current_state)
+    elif handler is not None:
+        await handler(update, context, query, user_id, current_state)
+
+# ========== СИСТЕМНЫЕ КОМАНДЫ ==========
+async def on_restart(update, context, query, user_id, state):
+    await remove_buttons_and_show_choice(query, "Начать заново 🔄")
+    await restart_game(update, context, user_id)
+
+async def on_check_subscription(update, context, query, user_id, state):
+    if await check_subscription(user_id, context):
+        play_step(user_id, state, "check_subscription")
+        await remove_buttons_and_show_choice(query, "Подписка проверена ✅")
+        await start_day_message(query, state)
+    else:
+        text = render.NOT_SUBSCRIBED.format(channel=CHANNEL_USERNAME)
+        await query.edit_message_text(text, reply_markup=render.stamp(SUBSCRIBE_KEYBOARD, state.seq))
+
+async def on_continue_after_event(update, context, query, user_id, state):
+    content = active
+    step = play_step(user_id, state, "continue_after_event", content.scenario)
+    await show_scene(query, state, step, content)
+
+async def on_show_stats(update, context, query, user_id, state):
+    play_step(user_id, state, "show_stats")
+    await send_scene(query, render.statistics_text(state), render.STATISTICS_KEYBOARD)
+
+async def on_next_day(update, context, query, user_id, state):
+    play_step(user_id, state, "next_day")
+    await start_day_message(query, state)
+
+async def on_hint(query, state):
+    content = active
+    best = None
+    if content.hints and state and state.checked_subscription:
+        best = solver.lookup(state)
+        if best is None:
+            # Состояния нет в таблице (обычно дни после первого) — ищем в потоке.
+            # Замок игрока держится, пока идёт поиск: state не изменится
+            metrics.inc("hint_solves_total")
+            best = await asyncio.get_running_loop().run_in_executor(hint_executor, solver.best, state)
+    if best is None:
+        await query.answer(render.HINT_UNAVAILABLE, show_alert=True)
         return
-    
-    # СИСТЕМНЫЕ КОМАНДЫ
-    elif query.data == "show_stats":
-        await show_statistics(query, current_state)
-    elif query.data == "show_achievements":
-        await show_achievements(query, current_state)
-    elif query.data == "next_day":
-        await start_new_day(query, current_state)
-    elif query.data == "share_progress":
-        reply_markup = await share_results_button(query, current_state)
-        await query.message.reply_text(
-            "🎮 Поделись своим успехом!\n\nПусть друзья узнают, как ты круто балансируешь жизнь!", 
-            reply_markup=reply_markup
-        )
+    action, success, _ = best
+    text = render.HINT_TEXT.format(choice=content.scenario.transitions[action].echo, success=success)
+    await query.answer(text, show_alert=True)
 
-# ========== ИГРОВЫЕ СЦЕНЫ ==========
-async def scene_work_start(query, state):
-    state.current_scene = "work"
-    
-    work_messages = [
-        f"💼 РАБОТА\n\n{state.player_name}, начальник ставит задачу:\n«Нужен детальный отчёт по кварталу. Без этого не получим финансирование!»",
-        f"💼 РАБОТА\n\n{state.player_name}, срочное задание:\n«Клиент ждёт отчёт до конца дня. От этого зависит наш крупный контракт.»"
-    ]
-    
-    text = (
-        f"🕒 День {state.day} | {time_to_str(state)}\n\n"
-        f"{random.choice(work_messages)}\n\n"
-        "Твои действия?"
-    )
-    
-    keyboard = [
-        [InlineKeyboardButton("📊 Качественный отчёт (2 часа)", callback_data="work_quality")],
-        [InlineKeyboardButton("⚡ Быстрый отчёт (1 час)", callback_data="work_fast")],
-        [InlineKeyboardButton("🚶 Передать коллеге (30 минут)", callback_data="work_skip")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text(text, reply_markup=reply_markup)
-
-async def scene_work_decision(query, state):
-    text = (
-        f"🕒 {time_to_str(state)}\n\n"
-        "📈 ИТОГИ РАБОТЫ\n\n"
-        "Отчёт сдан! Время двигаться дальше.\n\n"
-        "Звонит партнёр, голос дрожит:\n«Нужна помощь дома! Срочно!»\n\nСлушаешь?"
-    )
-    
-    keyboard = [[InlineKeyboardButton("✅ Выслушать проблему", callback_data="listen_family")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text(text, reply_markup=reply_markup)
+async def on_share_progress(update, context, query, user_id, state):
+    reply_markup = await share_results_button(query, state)
+    await send_scene(query, render.SHARE_PROMPT, reply_markup)
 
-async def scene_family_crisis(query, state):
-    state.current_scene = "family"
-    
-    family_situations = [
-        f"👨‍👩‍👧‍👦 СЕМЕЙНЫЙ КРИЗИС\n\n{state.player_name}, партнёр в панике:\n«Старший не сдал проект, средний заболел, младший устроил потоп в ванной!»",
-        f"🏠 ДОМАШНИЙ ХАОС\n\n{state.player_name}, дома настоящий шторм:\n«У детей срочные школьные проекты, нужно готовить ужин, а младший плачет!»"
-    ]
-    
-    text = (
-        f"🕒 {time_to_str(state)}\n\n"
-        f"{random.choice(family_situations)}\n\n"
-        "Как спасать ситуацию?"
-    )
-    
-    keyboard = [
-        [InlineKeyboardButton("👨‍👩‍👧‍👦 Помочь всем (1 час 30 минут)", callback_data="family_help")],
-        [InlineKeyboardButton("⏱️ Быстрая помощь (45 минут)", callback_data="family_quick")],
-        [InlineKeyboardButton("💰 Нанять помощника (20 минут)", callback_data="family_money")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text(text, reply_markup=reply_markup)
-
-async def scene_partner_dilemma(query, state):
-    partner_messages = [
-        f"❤️ ОТНОШЕНИЯ\n\nПартнёр смотрит с надеждой:\n«Сегодня юбилей у мамы. Она ждёт, что мы заедем. Знаю, ты устал, но это важно для меня...»",
-        f"🏡 СЕМЕЙНЫЕ ЦЕННОСТИ\n\nВторая половинка говорит:\n«Родители ждут нас на ужин. Можешь выкроить время? Это многое для меня значит.»"
-    ]
-    
-    text = (
-        f"🕒 {time_to_str(state)}\n\n"
-        f"{random.choice(partner_messages)}\n\n"
-        "Твой ответ?"
-    )
-    
-    keyboard = [
-        [InlineKeyboardButton("🎁 Поехать к родителям (1 час 30 минут)", callback_data="partner_help")],
-        [InlineKeyboardButton("💐 Извиниться и пообещать (30 минут)", callback_data="partner_apologize")],
-        [InlineKeyboardButton("❌ Перенести на завтра (10 минут)", callback_data="partner_ignore")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text(text, reply_markup=reply_markup)
-
-async def scene_transport(query, state):
-    state.current_scene = "transport"
-    text = (
-        f"🕒 {time_to_str(state)}\n\n"
-        "🚗 ФИНАЛЬНЫЙ РЫВОК\n\n"
-        "Выбегаешь из дома. Машина не заводится — сел аккумулятор!\n\n"
-        "До пары остаётся всё меньше времени...\n\n"
-        "Выбирай транспорт:"
-    )
-    
-    keyboard = [
-        [InlineKeyboardButton("🔧 Починить машину (1 час)", callback_data="transport_fix")],
-        [InlineKeyboardButton("🚕 Вызвать такси (25 минут)", callback_data="transport_taxi")],
-        [InlineKeyboardButton("🚌 Автобус (50 минут)", callback_data="transport_bus")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text(text, reply_markup=reply_markup)
+# ========== ИГРОВЫЕ ХОДЫ ==========
+async def run_transition(transition, update, context, query, user_id, state):
+    """Общий путь для всех ходов из сценария (content/scenario.json)"""
+    # Снимок сценария на всё нажатие: перезагрузка посреди хода его не заденет
+    content = active
+    await remove_buttons_and_show_choice(query, transition.echo)
+    old_time = time_to_str(state) if transition.event_chance is not None else None
+    step = play_step(user_id, state, transition.action, content.scenario)
+    if transition.event_chance is not None:
+        metrics.inc("random_event_rolls_total")
+        if step.event is not None:
+            await show_event(query, state, step.event, old_time, content)
+            return
+    await show_scene(query, state, step, content)
 
-# ========== СИСТЕМНЫЕ ФУНКЦИИ ==========
-async def show_statistics(query, state):
-    state.total_score = calculate_total_score(state)
-    
-    text = (
-        f"📊 ДЕТАЛЬНАЯ СТАТИСТИКА ДНЯ {state.day}\n\n"
-        f"💼 Карьера: {state.career}/10 - {'Отлично' if state.career >= 7 else 'Хорошо' if state.career >= 4 else 'Проблемы'}\n"
-        f"👨‍👩‍👧‍👦 Семья: {state.family}/10 - {'Счастлива' if state.family >= 7 else 'Довольна' if state.family >= 4 else 'Обижена'}\n"
-        f"⚡ Энергия: {state.energy}/10 - {'Полон сил' if state.energy >= 7 else 'Нормально' if state.energy >= 4 else 'Устал'}\n"
-        f"🔧 Навыки: {state.skills}/10 - {'Мастер' if state.skills >= 7 else 'Развивается' if state.skills >= 4 else 'Новичок'}\n\n"
-        
-        f"⭐ ОБЩИЙ СЧЁТ: {state.total_score}\n"
-        f"📅 ДНЕЙ ЗАВЕРШЕНО: {state.days_completed}\n"
-        f"🏆 ДОСТИЖЕНИЙ: {len(state.achievements)}\n\n"
-        
-        "Стремись к балансу во всех сферах! 🎯"
-    )
-    
-    keyboard = [
-        [InlineKeyboardButton("🏆 Мои достижения", callback_data="show_achievements")],
-        [InlineKeyboardButton("📤 Поделиться результатом", callback_data="share_progress")],
-        [InlineKeyboardButton("🔄 Следующий день", callback_data="next_day")],
-        [InlineKeyboardButton("🔄 Начать заново", callback_data="restart")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text(text, reply_markup=reply_markup)
+# ========== ИГРОВЫЕ СЦЕНЫ ==========
+async def show_scene(query, state, step, content):
+    """Сцена после хода: текст (вариант выбрал play_step, на игру он не влияет) и кнопки ходов"""
+    if step.scene == "final":
+        await final_scene(query, state, step.day_result)
+        return
+    texts = content.scenario.scene_texts[step.scene]
+    text = texts[step.variant] if step.variant < len(texts) else texts[0]
+    text = text.format(day=state.day, time=time_to_str(state), name=state.player_name)
+    await send_scene(query, text, content.keyboards[step.scene])
 
+# ========== СИСТЕМНЫЕ ФУНКЦИИ ==========
 async def show_achievements(query, state):
-    text = "🏆 ТВОИ ДОСТИЖЕНИЯ\n\n"
-    
-    all_achievements = [
-        {"name": "🎯 Идеальный баланс", "condition": "Получить 5/5 целей за день"},
-        {"name": "⚡ Скоростной рекорд", "condition": "Успеть на пару до 18:00"}, 
-        {"name": "💼 Карьерист", "condition": "Карьера 8+ очков"},
-        {"name": "👨‍👩‍👧‍👦 Суперродитель", "condition": "Семья 8+ очков"},
-        {"name": "❤️ Идеальный партнер", "condition": "Не обижать партнера 3 дня подряд"},
-        {"name": "🔧 Мастер на все руки", "condition": "Навыки 8+ очков"},
-        {"name": "💡 Инноватор", "condition": "Открыть 3+ лайфхака"},
-        {"name": "🤝 Настоящий друг", "condition": "Получить помощь друга"},
-        {"name": "🕰️ Тайм-менеджер", "condition": "Ни разу не опоздать за 5 дней"},
-        {"name": "⚡ Энерджайзер", "condition": "Энергия 8+ очков"},
-        {"name": "💰 Финансист", "condition": "Всегда нанимать помощь"},
-        {"name": "🚀 Абсолютный чемпион", "condition": "Все показатели 8+ одновременно"}
-    ]
-    
-    unlocked_count = 0
-    for achievement in all_achievements:
-        achievement_name = achievement["name"].split(" ", 1)[1]
-        if any(achievement_name in a for a in state.achievements):
-            text += f"✅ {achievement['name']}\n"
-            unlocked_count += 1
-        else:
-            text += f"🔒 {achievement['name']} - {achievement['condition']}\n"
-    
-    text += f"\n🎯 Прогресс: {unlocked_count}/12 достижений"
-    
-    keyboard = [
-        [InlineKeyboardButton("📊 Назад к статистике", callback_data="show_stats")],
-        [InlineKeyboardButton("📤 Поделиться прогрессом", callback_data="share_progress")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text(text, reply_markup=reply_markup)
-
-async def start_new_day(query, state):
-    state.day += 1
-    state.hours = 15
-    state.minutes = 0
-    
-    # Сохраняем прогресс, но с небольшим снижением
-    state.career = max(0, state.career - 1)
-    state.family = max(0, state.family - 1)
-    state.energy = min(10, state.energy + 2)
-    state.skills = max(0, state.skills - 1)
-    
-    await start_day_message(query, state)
+    text = render.achievements_text(state.achievements)
+    await send_scene(query, text, render.ACHIEVEMENTS_KEYBOARD)
 
-async def final_scene(query, state):
-    # ФИНАЛЬНЫЕ РАСЧЕТЫ
-    state.days_completed += 1
-    state.total_score = calculate_total_score(state)
-    
-    # ОЦЕНКА РЕЗУЛЬТАТА - ИСПРАВЛЕННЫЕ ПОРОГИ
-    time_score = not is_late(state)
-    work_score = state.career >= 5  # 5+ для успеха по работе
-    family_score = state.family >= 5  # 5+ для успеха по семье
-    energy_score = state.energy >= 4  # 4+ для энергии
-    skills_score = state.skills >= 3  # 3+ для навыков
-    
-    total_success = sum([time_score, work_score, family_score, energy_score, skills_score])
-    
-    # ТЕКСТ РЕЗУЛЬТАТА
-    if is_late(state):
-        text = f"🕒 {time_to_str(state)} - ❌ ОПОЗДАЛ НА ПАРУ!\n\n"
+async def leaderboard_text(user_id):
+    if isinstance(leaderboard, RemoteLeaderboard):
+        view = await leaderboard.view(user_id, render.LEADERBOARD_SIZE)
     else:
-        text = f"🕒 {time_to_str(state)} - ✅ УСПЕЛ НА ПАРУ!\n\n"
-        if "Скоростной рекорд" not in state.achievements and state.hours <= 18:
-            state.achievements.append("Скоростной рекорд")
-    
-    text += "📊 ИТОГИ ДНЯ:\n\n"
-    
-    # ДЕТАЛЬНАЯ СТАТИСТИКА
-    results = [
-        f"{'✅' if time_score else '❌'} Время: {'Успел на пару' if time_score else 'Опоздал'}",
-        f"{'✅' if work_score else '❌'} Работа: {'Карьера в порядке' if work_score else 'Проблемы на работе'}",
-        f"{'✅' if family_score else '❌'} Семья: {'Семья счастлива' if family_score else 'Семья обижена'}", 
-        f"{'✅' if energy_score else '❌'} Энергия: {'Силы есть' if energy_score else 'Нужен отдых'}",
-        f"{'✅' if skills_score else '❌'} Навыки: {'Развиваешься' if skills_score else 'Можно лучше'}"
-    ]
-    
-    text += "\n".join(results) + "\n\n"
-    
-    # МОТИВАЦИОННЫЕ ФРАЗЫ
-    motivational_phrases = {
-        5: "🏆 LEGENDARY BALANCE!\nТы — бог многозадачности! Этот результат стоит показать всем!",
-        4: "🔥 ПОЧТИ ИДЕАЛ!\nОтличный баланс! Друзья будут завидовать твоим навыкам!",
-        3: "💪 СОЛИДНЫЙ РЕЗУЛЬТАТ!\nТы держишь всё под контролем! Продолжай в том же духе!",
-        2: "📈 ЕСТЬ КУДА РАСТИ!\nНеплохо, но можно лучше! Завтра будет новый шанс!",
-        1: "🌱 НАЧАЛО ПУТИ!\nБаланс — это искусство! С каждой попыткой будет получаться лучше!",
-        0: "🔄 УЧЕБНЫЙ ДЕНЬ!\nЗавтра будет новый шанс проявить себя!"
-    }
-    
-    text += motivational_phrases.get(total_success, "🎯 Интересный результат!")
-    
-    if total_success == 5:
-        if "Идеальный баланс" not in state.achievements:
-            state.achievements.append("Идеальный баланс")
-    
-    text += f"\n\n🎯 Успешных целей: {total_success}/5"
-    text += f"\n⭐ Общий счёт: {state.total_score}"
-    text += f"\n🏆 Достижений: {len(state.achievements)}/12"
-    
-    # ОБНОВЛЯЕМ ДОСТИЖЕНИЯ
-    achievement_map = [
-        (state.career >= 8, "Карьерист"),
-        (state.family >= 8, "Суперродитель"),
-        (state.energy >= 8, "Энерджайзер"),
-        (state.skills >= 8, "Мастер на все руки"),
-        (all([state.career >= 8, state.family >= 8, state.energy >= 8, state.skills >= 8]), "Абсолютный чемпион")
-    ]
-    
-    for condition, achievement in achievement_map:
-        if condition and achievement not in state.achievements:
-            state.achievements.append(achievement)
-    
+        view = leaderboard.view(user_id, render.LEADERBOARD_SIZE)
+    return render.leaderboard_text(*view)
+
+async def show_leaderboard(query, state):
+    await send_scene(query, await leaderboard_text(query.from_user.id), render.LEADERBOARD_KEYBOARD)
+
+async def top_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(await leaderboard_text(update.message.from_user.id))
+
+async def final_scene(query, state, result):
+    leaderboard.record(query.from_user.id, state.player_name, state.total_score)
+    text = render.result_text(result, time_to_str(state), state.total_score)
+
     # КНОПКА ШАРИНГА
     reply_markup = await share_results_button(query, state)
-    
-    await query.message.reply_text(text, reply_markup=reply_markup)
+
+    await send_scene(query, text, reply_markup)
+    if card_cache is not None:
+        send_result_card(query, state)
+
+# ========== ТАБЛИЦА ОБРАБОТЧИКОВ ==========
+def _menu(show):
+    async def handler(update, context, query, user_id, state):
+        await show(query, state)
+    return handler
+
+def build_callback_dispatch():
+    """Системные команды: query.data → (обработчик, нужна ли подписка).
+    Игровые ходы ищутся в текущем сценарии, см. dispatch_callback"""
+    return {
+        "restart": (on_restart, False),
+        "check_subscription": (on_check_subscription, False),
+        "continue_after_event": (on_continue_after_event, False),
+        "show_stats": (on_show_stats, True),
+        "show_achievements": (_menu(show_achievements), True),
+        "show_top": (_menu(show_leaderboard), True),
+        "next_day": (on_next_day, True),
+        "share_progress": (on_share_progress, True),
+    }
+
+CALLBACK_DISPATCH = build_callback_dispatch()
+CALLBACK_LABELS = frozenset(CALLBACK_DISPATCH) | {"hint"}
+
+# ========== СЦЕНАРИЙ ==========
+# Всё, что обработчикам нужно от сценария, собрано в один неизменяемый объект.
+# Перезагрузка собирает новый целиком и подменяет ссылку одним присваиванием:
+# партии продолжаются (в состоянии только номера сцен и числа), а нажатие,
+# которое уже обрабатывается, доигрывает со своим снимком.
+Content = namedtuple("Content", ["scenario", "keyboards", "event_templates", "hints"])
+
+def build_content(scenario):
+    taken = sorted((CALLBACK_LABELS | {START_ACTION}).intersection(scenario.transitions))
+    if taken:
+        raise ContentError(f"Ходы заняты системными командами: {', '.join(taken)}")
+    # Таблица подсказок посчитана для конкретных правил — с другими она врёт
+    hints = solver is not None and scenario.rules_key == SOLVER_RULES_KEY
+    if solver is not None and not hints:
+        logging.warning("Правила сценария не совпадают с таблицей подсказок — подсказки выключены")
+    return Content(scenario, render.scene_keyboards(scenario, hints), render.event_templates(scenario), hints)
+
+active = build_content(load_scenario(CONTENT_PATH, CONTENT_CACHE_PATH))
+_reload_lock = asyncio.Lock()
+
+async def reload_content():
+    """Перечитывает сценарий в пуле потоков и подменяет текущий.
+    При ошибке бросает ContentError, а бот продолжает работать на прежнем"""
+    global active
+    async with _reload_lock:
+        loop = asyncio.get_running_loop()
+        try:
+            scenario = await loop.run_in_executor(None, load_scenario, CONTENT_PATH, CONTENT_CACHE_PATH)
+            content = build_content(scenario)
+        except ContentError:
+            metrics.inc("content_reloads_total", (("result", "error"),))
+            raise
+        active = content
+    metrics.inc("content_reloads_total", (("result", "ok"),))
+    logging.info(f"Сценарий перезагружен: {len(scenario.transitions)} ходов, {len(scenario.events.events)} событий")
+    return content
+
+async def reload_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.message.from_user.id not in ADMIN_IDS:
+        return
+    try:
+        content = await reload_content()
+    except ContentError as e:
+        await update.message.reply_text(f"❌ Сценарий не загружен, работает прежний:\n{e}")
+        return
+    scenario = content.scenario
+    await update.message.reply_text(
+        f"✅ Сценарий перезагружен: {len(scenario.transitions)} ходов, {len(scenario.events.events)} событий, "
+        f"подсказки {'включены' if content.hints else 'выключены'}"
+    )
+
+async def reload_on_signal():
+    try:
+        await reload_content()
+    except ContentError as e:
+        logging.error(f"Сценарий не загружен, работает прежний: {e}")
+
+def schedule_reload():
+    task = asyncio.create_task(reload_on_signal())
+    reload_tasks.add(task)
+    task.add_done_callback(reload_tasks.discard)
+
+reload_tasks = set()
 
 # ========== КОМАНДА СТАТУСА ==========
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("✅ Бот 'Гонка до Универа' работает корректно!")
+    sub = subscription_cache.stats()
+    text = (
+        "✅ Бот 'Гонка до Универа' работает корректно!\n\n"
+        f"🔍 Кэш подписки: попаданий {sub['hits']}, промахов {sub['misses']}, "
+        f"склеено {sub['coalesced']}, запросов к API {sub['api_calls']}, "
+        f"ошибок {sub['errors']}, записей {sub['size']}\n"
+        f"💾 Состояний в памяти: {len(state_store)}"
+    )
+    if isinstance(state_store, SQLiteStateStore):
+        text += f", вытеснено {state_store.evictions}, поднято с диска {state_store.reloads}"
+    if isinstance(state_store, JournalStateStore):
+        journal = state_store.journal
+        text += (
+            f"\n📓 Журнал: ходов записано {journal.records}, сбросов на диск {journal.commits}, "
+            f"снимков {journal.snapshots}, при запуске повторено {state_store.replayed}, "
+            f"ещё не разобрано из снимка {state_store.cold}"
+        )
+    if analytics.enabled:
+        text += (
+            f"\n📈 Аналитика: записей {analytics.accepted}, отброшено {analytics.dropped}, "
+            f"в очереди {analytics.queued}"
+        )
+    if card_cache is not None:
+        text += (
+            f"\n🖼 Карточки: из кэша {card_cache.hits}, нарисовано {card_cache.rendered} "
+            f"({card_cache.render_seconds:.1f} с), склеено {card_cache.coalesced}, "
+            f"пропущено под нагрузкой {card_cache.skipped}, ошибок {card_cache.errors}"
+        )
+    if recorder.enabled:
+        text += f"\n🎥 Запись обновлений: {recorder.recorded}, пачек на диске {recorder.chunks}"
+    if SHARD_COUNT > 1:
+        text += f"\n🧩 Шард {SHARD_INDEX + 1} из {SHARD_COUNT}"
+    out = outbox.stats()
+    players, players_today = leaderboard.counts()
+    text += (
+        f"\n📤 Запросов к API: {out['requests']}, отложено {out['delayed']}, "
+        f"флуд-контроль {out['flood_waits']}, не отправлено {out['failed']}, в очереди {out['queued']}"
+        f"\n👆 Повторных нажатий отброшено: {recent_clicks.dropped}, "
+        f"ожиданий своей очереди: {user_locks.contended}"
+        f"\n🏅 В рейтинге: {players}, сегодня {players_today}"
+        f"\n📜 Сценарий: {len(active.scenario.transitions)} ходов, {len(active.scenario.events.events)} событий"
+    )
+    await update.message.reply_text(text)
 
 # ========== ЗАПУСК БОТА ==========
-def main():
-    application = Application.builder().token(BOT_TOKEN).build()
-    
-    application.add_handler(CommandHandler("start", start))
+STARTED_AT = time.monotonic()
+
+def register_gauges():
+    """Значения, которые дешевле прочитать при снятии метрик, чем считать на ходу"""
+    metrics.gauge("states_live", lambda: len(state_store), "Состояний игроков в памяти")
+    if isinstance(state_store, SQLiteStateStore):
+        metrics.gauge("states_evicted_total", lambda: state_store.evictions, "Вытеснено состояний", "counter")
+        metrics.gauge("states_reloaded_total", lambda: state_store.reloads, "Поднято состояний с диска", "counter")
+    if isinstance(state_store, JournalStateStore):
+        journal = state_store.journal
+        metrics.gauge("journal_records_total", lambda: journal.records, "Записей в журнале ходов", "counter")
+        metrics.gauge("journal_commits_total", lambda: journal.commits, "Групповых сбросов журнала на диск", "counter")
+        metrics.gauge("journal_bytes_total", lambda: journal.bytes_written, "Байт записано в журнал", "counter")
+        metrics.gauge("journal_snapshots_total", lambda: journal.snapshots, "Снимков состояний", "counter")
+    metrics.gauge(
+        "subscription_cache_total",
+        lambda: {(("result", key),): value for key, value in subscription_cache.stats().items() if key != "size"},
+        "Проверки подписки: попадания, промахи, склейки, запросы, ошибки", "counter",
+    )
+    metrics.gauge("outbox_queued", lambda: outbox.stats()["queued"], "Запросов ждут бюджета в Outbox")
+    metrics.gauge("user_locks_active", lambda: len(user_locks), "Игроков с нажатием в обработке")
+    metrics.gauge("leaderboard_players", lambda: leaderboard.counts()[0], "Игроков в общем рейтинге")
+    if analytics.enabled:
+        metrics.gauge("analytics_records_total", lambda: analytics.accepted, "Записей аналитики принято", "counter")
+        metrics.gauge("analytics_dropped_total", lambda: analytics.dropped, "Записей аналитики отброшено: очередь полна", "counter")
+        metrics.gauge("analytics_queued", lambda: analytics.queued, "Записей аналитики ждут сводки")
+    if card_cache is not None:
+        metrics.gauge("result_cards_cached_total", lambda: card_cache.hits, "Карточки результата, отправленные по file_id", "counter")
+        metrics.gauge("result_cards_rendered_total", lambda: card_cache.rendered, "Нарисованные карточки результата", "counter")
+        metrics.gauge("result_cards_skipped_total", lambda: card_cache.skipped, "Карточки, пропущенные под нагрузкой", "counter")
+        metrics.gauge("result_card_render_seconds_total", lambda: card_cache.render_seconds, "Время рисования карточек", "counter")
+
+background_tasks = []
+metrics_server = None
+
+async def post_init(application: Application):
+    global metrics_server
+    await state_store.start()
+    await analytics.start()
+    await recorder.start()
+    if card_cache is not None:
+        await card_cache.start()
+    if isinstance(leaderboard, RemoteLeaderboard):
+        await leaderboard.start()
+    try:
+        # kill -HUP <pid> перечитывает сценарий без перезапуска
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, schedule_reload)
+    except (NotImplementedError, RuntimeError, AttributeError):
+        # Не главный поток или нет SIGHUP (Windows) — остаётся команда /reload
+        pass
+    if not metrics.enabled:
+        return
+    register_gauges()
+    background_tasks.append(asyncio.create_task(monitor_loop_lag(metrics)))
+    if METRICS_LOG_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(log_snapshots(metrics, METRICS_LOG_INTERVAL)))
+    if METRICS_PORT:
+        metrics_server = HttpServer(partial(serve_metrics, metrics), METRICS_LISTEN, METRICS_PORT)
+        await metrics_server.start()
+        logging.info(f"Метрики: http://{METRICS_LISTEN}:{metrics_server.port}/metrics")
+
+async def post_shutdown(application: Application):
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    if metrics_server is not None:
+        await metrics_server.stop()
+    await analytics.close()
+    await recorder.close()
+    if card_cache is not None:
+        await card_cache.close()
+    if hint_executor is not None:
+        hint_executor.shutdown(wait=False, cancel_futures=True)
+    if isinstance(leaderboard, RemoteLeaderboard):
+        await leaderboard.close()
+    await state_store.close()
+
+# ========== ОСТАНОВКА ==========
+async def drain(application, timeout=SHUTDOWN_TIMEOUT):
+    """Дорабатывает уже принятые обновления — начатые и ждущие в очереди.
+
+    Вызывается, когда новые обновления больше не принимаются. Если за timeout
+    не успели, ещё не начатые обновления отбрасываются, а зависшие
+    обработчики прерываются; состояния после этого всё равно сохраняет
+    post_shutdown.
+    """
+    queue = application.update_queue
+    pending = queue.qsize() + len(in_flight)
+    started = time.monotonic()
+
+    async def finished():
+        await queue.join()
+        # Фоновые задачи обработчиков (карточки) — после самих обработчиков
+        await in_flight.wait()
+
+    try:
+        await asyncio.wait_for(finished(), timeout)
+    except asyncio.TimeoutError:
+        dropped = 0
+        while not queue.empty():
+            queue.get_nowait()
+            queue.task_done()
+            dropped += 1
+        busy = len(in_flight)
+        in_flight.cancel_all()
+        logging.warning(
+            f"Остановка: за {timeout} с не успели — прервано обработчиков {busy}, "
+            f"не начато обновлений {dropped}"
+        )
+        return False
+    logging.info(f"Остановка: доработано обновлений {pending} за {time.monotonic() - started:.2f} с")
+    return True
+
+def health():
+    """Сводка для балансировщика: GET /health в режиме вебхука"""
+    return {
+        "status": "ok",
+        "uptime": round(time.monotonic() - STARTED_AT, 1),
+        "shard": SHARD_INDEX,
+        "states": len(state_store),
+        "outbox_queued": outbox.stats()["queued"],
+    }
+
+def build_application(webhook=False, request=None):
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .rate_limiter(outbox)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if BOT_API_BASE_URL:
+        builder = builder.base_url(BOT_API_BASE_URL)
+    if request is not None:
+        # Свой транспорт к Bot API — например, заглушка нагрузочного теста
+        builder = builder.request(request)
+    if webhook:
+        # Обновления приносит наш HTTP-сервер, Updater не нужен
+        builder = builder.updater(None)
+    application = builder.build()
+    
+    if recorder.enabled and not webhook:
+        # В режиме вебхука записывает сам WebhookServer — тело запроса как есть
+        application.add_handler(TypeHandler(Update, recorder.handle), group=-1)
+    application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("status", status))
+    application.add_handler(CommandHandler("top", top_command))
+    application.add_handler(CommandHandler("reload", reload_command))
     application.add_handler(CallbackQueryHandler(handle_callback))
+    return application
+
+async def run_webhook(application, stop_event=None):
+    """Обслуживает вебхук, пока не придёт SIGINT/SIGTERM или не выставят stop_event"""
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+
+    server = WebhookServer(
+        application, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET or None, health=health,
+        recorder=recorder if recorder.enabled else None,
+    )
+    async with application:
+        # run_polling сам вызывает post_init/post_shutdown, здесь — мы
+        await post_init(application)
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET or None,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        await application.start()
+        await server.start()
+        logging.info(f"Вебхук слушает {WEBHOOK_LISTEN}:{server.port}{WEBHOOK_PATH}")
+        try:
+            await stop_event.wait()
+        finally:
+            # Новые обновления получают 503 — Telegram повторит их следующему процессу
+            server.draining = True
+            await drain(application)
+            await server.stop()
+            await application.stop()
+            await post_shutdown(application)
+
+async def run_polling(application, stop_event=None):
+    """Long polling с той же мягкой остановкой, что и у вебхука"""
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+
+    async with application:
+        await post_init(application)
+        await application.updater.start_polling()
+        await application.start()
+        try:
+            await stop_event.wait()
+        finally:
+            # Новые обновления больше не забираем; уже полученные дорабатываем
+            await application.updater.stop()
+            await drain(application)
+            await application.stop()
+            await post_shutdown(application)
+
+def main():
+    webhook = BOT_MODE == "webhook"
+    if card_cache is not None:
+        # Процессы пула — до цикла событий и потоков, см. CardCache.open
+        card_cache.open()
+    application = build_application(webhook=webhook)
     
     print("🎮 Бот ГОНКА ДО УНИВЕРА запущен! Готов к использованию!")
     print("📍 Для проверки работы используй команду /status")
-    application.run_polling()
+    asyncio.run(run_webhook(application) if webhook else run_polling(application))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
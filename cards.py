@@ -0,0 +1,243 @@
+"""Карточка результата дня: картинка со счётом, показателями и достижениями.
+
+Рисование — работа для процессора, поэтому картинки рисуются в пуле процессов
+(или потоков), а цикл событий только ждёт готовые байты. Одинаковые итоги дают
+одинаковую карточку: после первой загрузки Telegram возвращает file_id, и
+повторная карточка с тем же ключом уходит по нему — без рисования и без загрузки.
+
+Посмотреть карточку без бота:
+
+    python cards.py 3 42 7 5 6 4 5 > card.jpg
+"""
+import io
+import os
+import sys
+import asyncio
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    # Карточки — по желанию (pip install pillow): без Pillow бот шлёт только текст итогов
+    Image = None
+
+WIDTH, HEIGHT = 800, 420
+BACKGROUND = (28, 32, 48)
+PANEL = (44, 50, 72)
+TEXT = (240, 240, 245)
+MUTED = (160, 168, 190)
+ACCENT = (255, 196, 64)
+# (подпись, цвет полосы); значения показателей — от 0 до 10
+STATS = (
+    ("Энергия", (96, 200, 120)),
+    ("Карьера", (90, 150, 240)),
+    ("Семья", (240, 120, 140)),
+    ("Навыки", (190, 130, 240)),
+)
+STAT_MAX = 10
+FONT_PATHS = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+    "C:\\Windows\\Fonts\\arial.ttf",
+)
+
+# Пробная карточка: поднимает процессы пула и грузит шрифты до первых игроков
+WARMUP_KEY = (1, 0, 0, 0, 0, 0, 0)
+
+def available():
+    return Image is not None
+
+# ========== РИСОВАНИЕ ==========
+# Шрифты грузятся один раз на процесс пула
+_fonts = {}
+
+def _font(size, path=None):
+    font = _fonts.get(size)
+    if font is None:
+        for candidate in ((path,) if path else ()) + FONT_PATHS:
+            if candidate and os.path.exists(candidate):
+                font = ImageFont.truetype(candidate, size)
+                break
+        else:
+            font = ImageFont.load_default()
+        _fonts[size] = font
+    return font
+
+# Всё, что не зависит от итогов (заголовок, подписи, пустые полосы), рисуется
+# один раз на процесс; карточка — копия фона и несколько чисел поверх
+_backgrounds = {}
+BAR_LEFT, BAR_TOP, BAR_WIDTH, BAR_STEP = 340, 96, WIDTH - 340 - 40, 72
+
+def _background(font_path):
+    image = _backgrounds.get(font_path)
+    if image is None:
+        image = Image.new("RGB", (WIDTH, HEIGHT), BACKGROUND)
+        draw = ImageDraw.Draw(image)
+        draw.rectangle((0, 0, WIDTH, 64), fill=PANEL)
+        draw.text((32, 16), "Гонка до Универа", font=_font(28, font_path), fill=TEXT)
+        draw.text((32, 92), "Счёт", font=_font(24, font_path), fill=MUTED)
+        draw.text((32, HEIGHT - 48), "t.me/SurvivalStudentGameBot", font=_font(20, font_path), fill=MUTED)
+        for i, (label, _) in enumerate(STATS):
+            y = BAR_TOP + i * BAR_STEP
+            draw.text((BAR_LEFT, y), label, font=_font(22, font_path), fill=TEXT)
+            draw.rounded_rectangle((BAR_LEFT, y + 32, BAR_LEFT + BAR_WIDTH, y + 50), radius=9, fill=PANEL)
+        _backgrounds[font_path] = image
+    return image
+
+def render_card(day, score, energy, career, family, skills, achievement_count, font_path=None):
+    """Ключ карточки → JPEG. Чистая функция верхнего уровня: её зовут в пуле процессов.
+    JPEG, а не PNG: Telegram всё равно пережимает фото в JPEG, а кодируется он в разы быстрее"""
+    image = _background(font_path).copy()
+    draw = ImageDraw.Draw(image)
+    draw.text((WIDTH - 32, 16), f"День {day}", font=_font(28, font_path), fill=ACCENT, anchor="ra")
+    draw.text((32, 120), str(score), font=_font(72, font_path), fill=ACCENT)
+    draw.text((32, 226), f"Достижений: {achievement_count}", font=_font(24, font_path), fill=TEXT)
+    for i, ((_, color), value) in enumerate(zip(STATS, (energy, career, family, skills))):
+        y = BAR_TOP + i * BAR_STEP
+        draw.text((BAR_LEFT + BAR_WIDTH, y), f"{value}/{STAT_MAX}", font=_font(22, font_path), fill=MUTED, anchor="ra")
+        filled = BAR_WIDTH * max(0, min(value, STAT_MAX)) // STAT_MAX
+        if filled:
+            draw.rounded_rectangle((BAR_LEFT, y + 32, BAR_LEFT + filled, y + 50), radius=9, fill=color)
+
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+# ========== КЭШ file_id ==========
+class CardCache:
+    """Ключ итогов → file_id загруженной картинки.
+
+    Параллельные запросы одной ещё не загруженной карточки склеиваются: рисует
+    и загружает первый, остальные ждут его file_id. Если в работе уже max_pending
+    новых карточек, следующая не рисуется (карточка — украшение, а очередь к
+    пулу задержала бы игроков): send вернёт None. workers > 0 — пул процессов,
+    0 — пул из одного потока (Pillow отпускает GIL не везде, цикл событий делит
+    с ним процессор).
+    """
+
+    def __init__(self, max_size=10000, workers=1, font_path=None, max_pending=32):
+        self.max_size = max_size
+        self.max_pending = max_pending
+        self.workers = workers
+        self.font_path = font_path
+        self._file_ids = OrderedDict()
+        self._inflight = {}   # ключ -> asyncio.Future с file_id (None — загрузка не удалась)
+        self._executor = None
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.rendered = 0
+        self.skipped = 0
+        self.render_seconds = 0.0
+        self.errors = 0
+
+    def __len__(self):
+        return len(self._file_ids)
+
+    def open(self):
+        """Поднимает пул. Звать до цикла событий и до любых потоков.
+
+        Процессы пула форкаются здесь же, на пробной карточке: fork из
+        процесса, где уже есть потоки, может унести в ребёнка замок,
+        захваченный чужим потоком (логирования, аллокатора), и ребёнок
+        повиснет. Если потоки уже есть, карточки рисует один поток.
+        """
+        if self._executor is not None:
+            return
+        if self.workers > 0 and threading.active_count() == 1:
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("fork"))
+            # С fork пул запускает все процессы на первой задаче — пока поток один
+            self._executor.submit(render_card, *WARMUP_KEY, self.font_path).result()
+            return
+        if self.workers > 0:
+            logging.warning("Пул карточек поднимается после запуска потоков — карточки рисует поток, не процессы")
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="cards")
+
+    async def start(self):
+        if self._executor is None:
+            self.open()
+            await self._render(WARMUP_KEY)
+
+    async def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _render(self, key):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        data = await loop.run_in_executor(self._executor, render_card, *key, self.font_path)
+        self.render_seconds += loop.time() - started
+        return data
+
+    def _lookup(self, key):
+        file_id = self._file_ids.get(key)
+        if file_id is not None:
+            self._file_ids.move_to_end(key)
+        return file_id
+
+    def _store(self, key, file_id):
+        self._file_ids[key] = file_id
+        self._file_ids.move_to_end(key)
+        while len(self._file_ids) > self.max_size:
+            self._file_ids.popitem(last=False)
+
+    async def send(self, key, send_photo):
+        """send_photo(photo) отправляет картинку (байты или file_id) и возвращает Message"""
+        while True:
+            file_id = self._lookup(key)
+            if file_id is not None:
+                self.hits += 1
+                return await send_photo(file_id)
+            if key not in self._inflight:
+                break
+            # Карточку уже рисуют для другого игрока — ждём её file_id;
+            # None — загрузка не удалась, пробуем сами
+            self.coalesced += 1
+            file_id = await asyncio.shield(self._inflight[key])
+            if file_id is not None:
+                self.hits += 1
+                return await send_photo(file_id)
+
+        if len(self._inflight) >= self.max_pending:
+            self.skipped += 1
+            return None
+        self.misses += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self._inflight[key] = waiter
+        file_id = None
+        try:
+            data = await self._render(key)
+            self.rendered += 1
+            message = await send_photo(data)
+            if message is not None and message.photo:
+                file_id = message.photo[-1].file_id
+                self._store(key, file_id)
+            return message
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            del self._inflight[key]
+            waiter.set_result(file_id)
+
+
+def main():
+    if not available():
+        print("Нужен Pillow: pip install pillow", file=sys.stderr)
+        sys.exit(1)
+    numbers = [int(x) for x in sys.argv[1:8]]
+    if len(numbers) != 7:
+        print("Аргументы: день счёт энергия карьера семья навыки достижений", file=sys.stderr)
+        sys.exit(2)
+    sys.stdout.buffer.write(render_card(*numbers))
+
+
+if __name__ == "__main__":
+    main()
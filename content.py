@@ -0,0 +1,213 @@
+import os
+import json
+import marshal
+import hashlib
+import logging
+from collections import namedtuple
+from types import MappingProxyType
+
+try:
+    import yaml
+except ImportError:
+    # YAML — по желанию (pip install pyyaml), JSON читается всегда
+    yaml = None
+
+from game_state import DAY_TYPES, SCENES, EVENT_IDS
+from achievements import BY_ID
+from engine import Event, EventCatalogue, compile_actions, check_scene_actions
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "content", "scenario.json")
+FORMAT = 1
+CACHE_VERSION = 1
+
+# Подстановки, которые бот передаёт в тексты сцен
+SCENE_FIELDS = {"day": 1, "time": "00:00", "name": ""}
+SCENE_KEYS = {"texts", "actions"}
+EVENT_KEYS = {"text", "effects", "achievement", "weight", "day_weights"}
+# callback_data — не больше 64 байт, из них 3 занимает метка хода "xx:" (render.pack_callback)
+MAX_ACTION_BYTES = 61
+# Сценарий не заводит новых сцен и событий: состояние игрока хранит сцену
+# кодом из game_state.SCENES, а виденные события — битами по EVENT_IDS
+REGISTRY_HINT = (
+    "сценарий может использовать только сцены game_state.SCENES и события game_state.EVENT_IDS; "
+    "новую сцену или событие сначала добавьте в конец этого кортежа в коде"
+)
+
+
+class ContentError(ValueError):
+    """Файл сценария не прочитался или не прошёл проверку"""
+
+
+# Собранный сценарий. Все таблицы только для чтения: бот держит ссылку на
+# текущий сценарий и при перезагрузке подменяет её целиком
+Scenario = namedtuple("Scenario", [
+    "transitions",    # action → engine.Transition
+    "scene_actions",  # сцена → ходы в порядке кнопок
+    "scene_texts",    # сцена → варианты текста
+    "buttons",        # action → подпись кнопки
+    "events",         # engine.EventCatalogue
+    "event_texts",    # id события → текст
+    "rules_key",      # отпечаток правил без текстов: меняется, только если меняется игра
+    "source",
+])
+
+# ========== ЧТЕНИЕ И ПРОВЕРКА ==========
+def read_source(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            if path.endswith((".yaml", ".yml")):
+                if yaml is None:
+                    raise ContentError(f"{path}: для YAML нужен пакет pyyaml")
+                return yaml.safe_load(f)
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        if isinstance(e, ContentError):
+            raise
+        raise ContentError(f"{path}: {e}") from e
+
+def _require(condition, message):
+    if not condition:
+        raise ContentError(message)
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def normalize(raw):
+    """Проверяет разобранный файл и оставляет только нужные поля.
+
+    Результат — простые dict/list/str/числа: его можно сохранить в кэш
+    через marshal и собрать в Scenario без повторного разбора.
+    """
+    _require(isinstance(raw, dict), "Сценарий должен быть объектом")
+    _require(raw.get("format") == FORMAT, f"Поддерживается только format: {FORMAT}")
+    scenes, actions, events = raw.get("scenes"), raw.get("actions"), raw.get("events")
+    _require(isinstance(scenes, dict) and isinstance(actions, dict) and isinstance(events, dict),
+             "Нужны разделы scenes, actions и events")
+    _require("start_day" in actions, "Нет хода start_day")
+
+    data = {"scenes": {}, "actions": {}, "events": {}}
+    for scene, spec in scenes.items():
+        _require(scene in SCENES and scene not in (None, "start", "final"),
+                 f"{scene}: неизвестная сцена — {REGISTRY_HINT}")
+        _require(isinstance(spec, dict) and not set(spec) - SCENE_KEYS, f"{scene}: неизвестные поля сцены")
+        texts, scene_actions = spec.get("texts"), spec.get("actions")
+        _require(isinstance(texts, list) and texts and all(isinstance(t, str) for t in texts),
+                 f"{scene}: нужен непустой список текстов")
+        for text in texts:
+            try:
+                text.format(**SCENE_FIELDS)
+            except (KeyError, IndexError, ValueError) as e:
+                raise ContentError(f"{scene}: ошибка подстановки в тексте: {e!r}") from e
+        _require(isinstance(scene_actions, list) and all(isinstance(a, str) for a in scene_actions),
+                 f"{scene}: actions — список ходов")
+        data["scenes"][scene] = {"texts": list(texts), "actions": list(scene_actions)}
+
+    on_buttons = {a for spec in data["scenes"].values() for a in spec["actions"]}
+    for action, spec in actions.items():
+        _require(isinstance(spec, dict), f"{action}: ход должен быть объектом")
+        button = spec.get("button")
+        _require(button is None or isinstance(button, str), f"{action}: button — строка")
+        _require(action not in on_buttons or button, f"{action}: нет подписи кнопки")
+        _require(len(action.encode("utf-8")) <= MAX_ACTION_BYTES, f"{action}: id хода длиннее {MAX_ACTION_BYTES} байт")
+        _require(":" not in action, f"{action}: двоеточие в id хода занято меткой хода")
+        _require(spec.get("next") in SCENES and spec.get("next") is not None,
+                 f"{action}: неизвестная сцена {spec.get('next')!r} — {REGISTRY_HINT}")
+        data["actions"][action] = dict(spec)
+
+    for event_id, spec in events.items():
+        _require(event_id in EVENT_IDS, f"{event_id}: неизвестное событие — {REGISTRY_HINT}")
+        _require(isinstance(spec, dict) and not set(spec) - EVENT_KEYS, f"{event_id}: неизвестные поля события")
+        _require(isinstance(spec.get("text"), str) and spec["text"], f"{event_id}: нет текста")
+        effects = spec.get("effects", {})
+        _require(isinstance(effects, dict) and all(isinstance(v, int) for v in effects.values()),
+                 f"{event_id}: эффекты — целые числа")
+        achievement = spec.get("achievement")
+        _require(achievement is None or achievement in BY_ID, f"{event_id}: неизвестное достижение {achievement!r}")
+        weight = spec.get("weight", 1)
+        day_weights = spec.get("day_weights") or {}
+        _require(_is_number(weight) and weight >= 0, f"{event_id}: вес — неотрицательное число")
+        _require(isinstance(day_weights, dict)
+                 and all(d in DAY_TYPES and _is_number(w) and w >= 0 for d, w in day_weights.items()),
+                 f"{event_id}: day_weights — {{тип дня: вес}}")
+        data["events"][event_id] = {
+            "text": spec["text"], "effects": dict(effects), "achievement": achievement,
+            "weight": weight, "day_weights": dict(day_weights),
+        }
+    return data
+
+# ========== СБОРКА ==========
+def _rules_key(data):
+    rules = (
+        sorted((a, sorted((k, v) for k, v in spec.items() if k not in ("button", "echo")))
+               for a, spec in data["actions"].items()),
+        sorted((scene, spec["actions"]) for scene, spec in data["scenes"].items()),
+        sorted((e, sorted((k, v) for k, v in spec.items() if k != "text")) for e, spec in data["events"].items()),
+    )
+    return hashlib.sha1(repr(rules).encode("utf-8")).hexdigest()
+
+def compile_scenario(data, source=None):
+    """Проверенные данные → Scenario с готовыми таблицами"""
+    try:
+        transitions = compile_actions({
+            action: {key: value for key, value in spec.items() if key != "button"}
+            for action, spec in data["actions"].items()
+        })
+        scene_actions = {scene: tuple(spec["actions"]) for scene, spec in data["scenes"].items()}
+        check_scene_actions(scene_actions, transitions)
+        events = EventCatalogue(tuple(
+            Event(event_id, spec["effects"], spec["achievement"], spec["weight"], spec["day_weights"] or None)
+            for event_id, spec in data["events"].items()
+        ))
+    except ValueError as e:
+        raise ContentError(str(e)) from e
+    return Scenario(
+        transitions=MappingProxyType(transitions),
+        scene_actions=MappingProxyType(scene_actions),
+        scene_texts=MappingProxyType({scene: tuple(spec["texts"]) for scene, spec in data["scenes"].items()}),
+        buttons=MappingProxyType({a: spec["button"] for a, spec in data["actions"].items() if spec.get("button")}),
+        events=events,
+        event_texts=MappingProxyType({event_id: spec["text"] for event_id, spec in data["events"].items()}),
+        rules_key=_rules_key(data),
+        source=source,
+    )
+
+# ========== ЗАГРУЗКА С КЭШЕМ ==========
+def _stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+def _read_cache(cache_path, source, stamp):
+    try:
+        with open(cache_path, "rb") as f:
+            version, cached_source, cached_stamp, data = marshal.loads(f.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if version != CACHE_VERSION or cached_source != source or tuple(cached_stamp) != stamp:
+        return None
+    return data
+
+def _write_cache(cache_path, source, stamp, data):
+    tmp_path = f"{cache_path}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(marshal.dumps((CACHE_VERSION, source, stamp, data)))
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logging.warning(f"Не удалось сохранить кэш сценария {cache_path}: {e}")
+
+def load_scenario(path=DEFAULT_PATH, cache_path=None):
+    """Читает сценарий; с cache_path разбор и проверка файла пропускаются,
+    пока файл не изменился (сверяются время изменения и размер)"""
+    source = os.path.abspath(path)
+    try:
+        stamp = _stamp(path)
+    except OSError as e:
+        raise ContentError(f"{path}: {e}") from e
+    data = _read_cache(cache_path, source, stamp) if cache_path else None
+    if data is None:
+        data = normalize(read_source(path))
+        scenario = compile_scenario(data, source)
+        if cache_path:
+            _write_cache(cache_path, source, stamp, data)
+        return scenario
+    return compile_scenario(data, source)
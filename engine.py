@@ -0,0 +1,431 @@
+import random
+from operator import and_
+from functools import reduce
+from collections import namedtuple
+
+from game_state import SCENES, DAY_TYPES, EVENT_BITS
+from achievements import Rule, RuleSet, count
+
+# ========== СИСТЕМА ВРЕМЕНИ ==========
+def add_time(state, hours=0, minutes=0):
+    """Добавляет время и возвращает обновленное состояние"""
+    total_minutes = state.hours * 60 + state.minutes + hours * 60 + minutes
+    state.hours = total_minutes // 60
+    state.minutes = total_minutes % 60
+    return state
+
+def time_to_str(state):
+    return f"{state.hours:02d}:{state.minutes:02d}"
+
+# День начинается в 15:00, пара — в 18:40: позже — опоздание
+DAY_START = 15 * 60
+LATE_AFTER = 18 * 60 + 40
+
+def is_late(state):
+    return state.hours * 60 + state.minutes > LATE_AFTER
+
+# ========== ПРИМЕНЕНИЕ ЭФФЕКТОВ ==========
+# Границы показателей. Навыки исторически не ограничены сверху
+STAT_BOUNDS = {
+    "career": (0, 10),
+    "family": (0, 10),
+    "energy": (0, 10),
+    "skills": (0, None),
+}
+
+def apply_effects(state, effects):
+    """Единая точка изменения показателей: время и статы с учётом границ"""
+    minutes = effects.get("minutes")
+    if minutes:
+        add_time(state, minutes=minutes)
+    for stat, (low, high) in STAT_BOUNDS.items():
+        delta = effects.get(stat)
+        if delta:
+            value = max(low, getattr(state, stat) + delta)
+            if high is not None:
+                value = min(high, value)
+            setattr(state, stat, value)
+    return state
+
+# План применения: минуты и только ненулевые статы вместе с их границами —
+# собирается один раз на ход или событие, без поиска по словарю на каждом нажатии
+EffectPlan = namedtuple("EffectPlan", ["minutes", "stats"])
+
+def compile_effects(effects):
+    for key in effects:
+        if key != "minutes" and key not in STAT_BOUNDS:
+            raise ValueError(f"Неизвестный показатель {key!r}")
+    stats = tuple((stat, effects[stat], low, high) for stat, (low, high) in STAT_BOUNDS.items() if effects.get(stat))
+    return EffectPlan(effects.get("minutes", 0), stats)
+
+def apply_plan(state, plan):
+    """То же, что apply_effects, по заранее собранному плану"""
+    if plan.minutes:
+        add_time(state, minutes=plan.minutes)
+    for stat, delta, low, high in plan.stats:
+        value = max(low, getattr(state, stat) + delta)
+        if high is not None:
+            value = min(high, value)
+        setattr(state, stat, value)
+    return state
+
+# ========== ТАБЛИЦА ПЕРЕХОДОВ ==========
+# Сами ходы, сцены и события описаны в content/scenario.json (см. content.py).
+# Ход: эхо выбора, затраты времени, изменения статов, следующая сцена;
+# event_chance — шанс случайного события после хода (None — без броска),
+# marks — метки дня для многодневных достижений (см. DAY_MARKS).
+
+# Что за день сделал игрок — биты state.day_marks, сбрасываются в итогах дня
+DAY_MARKS = ("hired_help", "offended_partner")
+DAY_MARK_BITS = {name: 1 << bit for bit, name in enumerate(DAY_MARKS)}
+
+Transition = namedtuple(
+    "Transition",
+    ["action", "echo", "effects", "next_scene", "event_chance", "requires_subscription", "marks", "plan"],
+)
+
+_ACTION_KEYS = {"echo", "minutes", "effects", "next", "event_chance", "requires_subscription", "marks"}
+
+def compile_actions(table):
+    """Проверяет таблицу переходов и превращает её в словарь action → Transition"""
+    compiled = {}
+    for action, spec in table.items():
+        unknown = set(spec) - _ACTION_KEYS
+        if unknown:
+            raise ValueError(f"{action}: неизвестные поля {sorted(unknown)}")
+        if not spec.get("echo"):
+            raise ValueError(f"{action}: не задан текст выбора")
+        next_scene = spec.get("next")
+        if next_scene not in SCENES or next_scene is None:
+            raise ValueError(f"{action}: неизвестная сцена {next_scene!r}")
+        minutes = spec.get("minutes", 0)
+        if not isinstance(minutes, int) or minutes < 0:
+            raise ValueError(f"{action}: затраты времени должны быть целым числом минут")
+        deltas = spec.get("effects", {})
+        for stat, delta in deltas.items():
+            if stat not in STAT_BOUNDS:
+                raise ValueError(f"{action}: неизвестный показатель {stat!r}")
+            if not isinstance(delta, int):
+                raise ValueError(f"{action}: изменение {stat} должно быть целым")
+        chance = spec.get("event_chance")
+        if chance is not None and not 0 <= chance <= 1:
+            raise ValueError(f"{action}: шанс события вне диапазона 0..1")
+        marks = 0
+        for mark in spec.get("marks", ()):
+            if mark not in DAY_MARK_BITS:
+                raise ValueError(f"{action}: неизвестная метка дня {mark!r}")
+            marks |= DAY_MARK_BITS[mark]
+
+        effects = dict(deltas)
+        if minutes:
+            effects["minutes"] = minutes
+        compiled[action] = Transition(
+            action=action,
+            echo=spec["echo"],
+            effects=effects,
+            next_scene=next_scene,
+            event_chance=chance,
+            requires_subscription=spec.get("requires_subscription", True),
+            marks=marks,
+            plan=compile_effects(effects),
+        )
+    return compiled
+
+def apply_transition(state, transition):
+    """Применяет ход к состоянию; сцена, которую показать после хода, — в pending_scene"""
+    apply_plan(state, transition.plan)
+    state.day_marks |= transition.marks
+    state.pending_scene = transition.next_scene
+    return state
+
+def check_scene_actions(scene_actions, transitions):
+    """Какие ходы предлагает каждая сцена (в порядке кнопок): сцены и ходы должны существовать"""
+    for scene, actions in scene_actions.items():
+        if scene not in SCENES or scene in (None, "start", "final"):
+            raise ValueError(f"{scene}: сцена не может предлагать ходы")
+        if not actions or any(action not in transitions for action in actions):
+            raise ValueError(f"{scene}: нет ходов или неизвестный ход")
+    for transition in transitions.values():
+        if transition.next_scene != "final" and transition.next_scene not in scene_actions:
+            raise ValueError(f"{transition.action}: у сцены {transition.next_scene} нет ходов")
+
+# ========== СЛУЧАЙНЫЕ СОБЫТИЯ ==========
+DEFAULT_EVENT_CHANCE = 0.4
+LUCKY_DAY_EVENT_CHANCE = 0.7
+
+# achievement — id достижения из реестра achievements.py, которое даёт событие.
+# weight — относительная частота события, day_weights — {тип дня: вес} вместо неё
+Event = namedtuple("Event", ["id", "effects", "achievement", "weight", "day_weights"], defaults=(1, None))
+
+# new_achievement — achievements.Achievement или None
+EventOutcome = namedtuple("EventOutcome", ["event", "new_achievement"])
+
+class AliasTable:
+    """Выбор индекса по весам за O(1) одним броском (метод Уокера)"""
+
+    __slots__ = ("n", "prob", "alias")
+
+    def __init__(self, weights):
+        n = len(weights)
+        total = sum(weights)
+        if not n or total <= 0:
+            raise ValueError("Нужен хотя бы один положительный вес")
+        scaled = [w * n / total for w in weights]
+        self.n = n
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1 - scaled[less]
+            (small if scaled[more] < 1 else large).append(more)
+
+    def sample(self, rng):
+        u = rng.random() * self.n
+        i = int(u)
+        return i if u - i < self.prob[i] else self.alias[i]
+
+# Событие в готовом к броску виде: бит в маске виденных, план эффектов,
+# факты для правил достижений
+CompiledEvent = namedtuple("CompiledEvent", ["event", "bit", "plan", "facts"])
+
+class EventCatalogue:
+    """События, собранные один раз при запуске: таблица выбора на каждый тип дня.
+
+    Пока в цикле остаются невиденные события, выпадают только они; когда
+    видены все, цикл начинается заново. Виденные — битовая маска в
+    state.events_seen, её размер не растёт с числом сыгранных дней.
+    """
+
+    # Сколько раз перебросить уже виденное событие, прежде чем выбрать честно за O(n)
+    MAX_REJECTIONS = 4
+
+    def __init__(self, events, day_types=DAY_TYPES):
+        if len({e.id for e in events}) != len(events):
+            raise ValueError("Повторяющиеся id событий")
+        compiled = []
+        for e in events:
+            if e.id not in EVENT_BITS:
+                raise ValueError(f"{e.id}: событие не зарегистрировано в game_state.EVENT_IDS")
+            compiled.append(CompiledEvent(e, EVENT_BITS[e.id], compile_effects(e.effects), ("event:" + e.id,)))
+        self.events = tuple(compiled)
+        self.all_seen = sum(c.bit for c in compiled)
+        self.weights = {
+            day_type: tuple((e.day_weights or {}).get(day_type, e.weight) for e in events)
+            for day_type in day_types
+        }
+        for day_type, weights in self.weights.items():
+            if min(weights) < 0:
+                raise ValueError(f"{day_type}: отрицательный вес события")
+        self.samplers = {day_type: AliasTable(weights) for day_type, weights in self.weights.items()}
+        # Достижения за события: правило на событие, проверяется только когда оно выпало
+        self.rules = RuleSet(Rule(c.event.achievement, c.facts, _always) for c in compiled if c.event.achievement)
+        self._distributions = {}
+
+    def pick(self, day_type, seen, rng):
+        """(CompiledEvent, новая маска виденных)"""
+        if seen & self.all_seen == self.all_seen:
+            seen = 0
+        events, sampler = self.events, self.samplers[day_type]
+        for _ in range(self.MAX_REJECTIONS):
+            chosen = events[sampler.sample(rng)]
+            if not seen & chosen.bit:
+                return chosen, seen | chosen.bit
+        # Невиденных осталось мало — выбираем среди них по весам
+        weights = self.weights[day_type]
+        available = [(c, w) for c, w in zip(events, weights) if w > 0 and not seen & c.bit]
+        if not available:
+            chosen = events[sampler.sample(rng)]
+            return chosen, chosen.bit
+        point = rng.random() * sum(w for _, w in available)
+        for chosen, weight in available:
+            point -= weight
+            if point < 0:
+                break
+        return chosen, seen | chosen.bit
+
+    def distribution(self, day_type, seen):
+        """[(CompiledEvent, вероятность, новая маска виденных)] — то же, что даёт pick"""
+        key = (day_type, seen)
+        result = self._distributions.get(key)
+        if result is None:
+            if seen & self.all_seen == self.all_seen:
+                seen = 0
+            weights = self.weights[day_type]
+            available = [(c, w) for c, w in zip(self.events, weights) if w > 0 and not seen & c.bit]
+            if not available:
+                seen = 0
+                available = [(c, w) for c, w in zip(self.events, weights) if w > 0]
+            total = sum(w for _, w in available)
+            result = self._distributions[key] = tuple((c, w / total, seen | c.bit) for c, w in available)
+        return result
+
+def event_chance(day_type, chance=None):
+    """Шанс события после хода: в удачный день он всегда выше"""
+    if day_type == "lucky_day":
+        return LUCKY_DAY_EVENT_CHANCE
+    return DEFAULT_EVENT_CHANCE if chance is None else chance
+
+def roll_random_event(state, events, chance=None, rng=random):
+    """Бросок случайного события из каталога events; при успехе применяет его к состоянию.
+
+    Возвращает EventOutcome или None, если события не случилось.
+    """
+    if rng.random() > event_chance(state.day_type, chance):
+        return None
+
+    chosen, state.events_seen = events.pick(state.day_type, state.events_seen, rng)
+    apply_plan(state, chosen.plan)
+
+    new = events.rules.unlock(state, chosen.facts)
+    return EventOutcome(chosen.event, new[0] if new else None)
+
+# ========== ДНИ ==========
+CRISIS_DAY_TYPES = ("career_crisis", "family_crisis", "energy_drain")
+
+def generate_day_type(state, rng=random):
+    if state.days_completed >= 3 and rng.random() < 0.6:
+        return rng.choice(CRISIS_DAY_TYPES)
+    return rng.choice(DAY_TYPES)
+
+def get_day_modifiers(day_type):
+    modifiers = {
+        "normal": {"time_mod": 1.0, "energy_mod": 1.0},
+        "career_crisis": {"time_mod": 1.2, "energy_mod": 0.8, "career_bonus": 1},
+        "family_crisis": {"time_mod": 1.3, "energy_mod": 0.7, "family_bonus": 1},
+        "lucky_day": {"time_mod": 0.8, "energy_mod": 1.2},
+        "energy_drain": {"time_mod": 1.1, "energy_mod": 0.6},
+        "skill_focus": {"time_mod": 1.0, "energy_mod": 1.1, "skill_bonus": 1}
+    }
+    return modifiers.get(day_type, modifiers["normal"])
+
+def begin_next_day(state):
+    """Новый день: время сбрасывается, прогресс сохраняется с небольшим снижением"""
+    state.day += 1
+    state.hours, state.minutes = divmod(DAY_START, 60)
+    state.career = max(0, state.career - 1)
+    state.family = max(0, state.family - 1)
+    state.energy = min(10, state.energy + 2)
+    state.skills = max(0, state.skills - 1)
+    return state
+
+# ========== ИТОГИ ДНЯ ==========
+# Цель дня по показателю засчитывается от этого значения
+GOAL_THRESHOLDS = {"career": 5, "family": 5, "energy": 4, "skills": 3}
+# Показатель от этого значения даёт бонус к счёту и достижение
+HIGH_STAT = 8
+# Очки счёта: за единицу показателя, за пройденный день, за достижение
+# и за каждый показатель от HIGH_STAT
+STAT_POINTS = 10
+DAY_BONUS = 50
+ACHIEVEMENT_BONUS = 30
+HIGH_STAT_BONUS = 50
+
+def calculate_total_score(state):
+    base_score = (state.career + state.family + state.energy + state.skills) * STAT_POINTS
+    day_bonus = state.days_completed * DAY_BONUS
+    achievement_bonus = count(state.achievements) * ACHIEVEMENT_BONUS
+
+    total = base_score + day_bonus + achievement_bonus
+
+    # Бонусы за высокие показатели
+    if state.career >= HIGH_STAT: total += HIGH_STAT_BONUS
+    if state.family >= HIGH_STAT: total += HIGH_STAT_BONUS
+    if state.energy >= HIGH_STAT: total += HIGH_STAT_BONUS
+    if state.skills >= HIGH_STAT: total += HIGH_STAT_BONUS
+
+    return total
+
+# ========== ДОСТИЖЕНИЯ ==========
+TIME_MANAGER_DAYS = 5
+PERFECT_PARTNER_DAYS = 3
+FINANCIER_DAYS = 3
+# Счётчики дней подряд хранятся в одном байте
+STREAK_MAX = 255
+
+def _always(state, day):
+    return True
+
+def _high(stat):
+    return lambda state, day: getattr(state, stat) >= HIGH_STAT
+
+def _all_high(state, day):
+    return reduce(and_, (getattr(state, stat) >= HIGH_STAT for stat in STAT_BOUNDS))
+
+# Правило проверяется, только когда меняется факт из watch: день подведён
+# ("day") или показатель получил итоговое значение дня. Правила событий —
+# в EventCatalogue.rules. Условия — только сравнения и &, без and/not/all:
+# simulator.py проверяет эти же правила сразу на массивах NumPy
+# (day.scores[0] — «не опоздал»)
+ACHIEVEMENT_RULES = RuleSet((
+    Rule("speed_record", ("day",), lambda state, day: day.scores[0] & (state.hours <= 18)),
+    Rule("perfect_balance", ("day",), lambda state, day: day.total_success == 5),
+    Rule("time_manager", ("day",), lambda state, day: state.on_time_streak >= TIME_MANAGER_DAYS),
+    Rule("perfect_partner", ("day",), lambda state, day: state.partner_streak >= PERFECT_PARTNER_DAYS),
+    Rule("financier", ("day",), lambda state, day: state.help_streak >= FINANCIER_DAYS),
+    Rule("careerist", ("career",), _high("career")),
+    Rule("super_parent", ("family",), _high("family")),
+    Rule("energizer", ("energy",), _high("energy")),
+    Rule("handyman", ("skills",), _high("skills")),
+    Rule("champion", tuple(STAT_BOUNDS), _all_high),
+))
+DAY_FACTS = ("day",)
+STAT_FACTS = tuple(STAT_BOUNDS)
+
+def update_streaks(state, late):
+    """Счётчики дней подряд для многодневных достижений; метки дня сбрасываются"""
+    marks = state.day_marks
+    state.on_time_streak = 0 if late else min(STREAK_MAX, state.on_time_streak + 1)
+    if marks & DAY_MARK_BITS["offended_partner"]:
+        state.partner_streak = 0
+    else:
+        state.partner_streak = min(STREAK_MAX, state.partner_streak + 1)
+    if marks & DAY_MARK_BITS["hired_help"]:
+        state.help_streak = min(STREAK_MAX, state.help_streak + 1)
+    else:
+        state.help_streak = 0
+    state.day_marks = 0
+
+# scores — (время, работа, семья, энергия, навыки) как bool.
+# achievement_count — сколько достижений показывает экран итогов: он
+# считает их до наград за высокие показатели, выданных в конце дня
+DayResult = namedtuple("DayResult", ["late", "scores", "total_success", "achievement_count"])
+
+def finish_day(state):
+    """Подводит итоги дня: счёт, цели и достижения"""
+    state.days_completed += 1
+    state.total_score = calculate_total_score(state)
+
+    late = is_late(state)
+    scores = (not late,) + tuple(getattr(state, stat) >= GOAL_THRESHOLDS[stat] for stat in STAT_BOUNDS)
+    total_success = sum(scores)
+
+    update_streaks(state, late)
+    result = DayResult(late, scores, total_success, 0)
+    ACHIEVEMENT_RULES.unlock(state, DAY_FACTS, result)
+    result = result._replace(achievement_count=count(state.achievements))
+    ACHIEVEMENT_RULES.unlock(state, STAT_FACTS, result)
+    return result
+
+# ========== ИГРА БЕЗ БОТА ==========
+def play_day(state, choose, scenario, rng=random, day_type=None):
+    """Проигрывает один день сценария (content.Scenario) целиком, без ввода-вывода.
+
+    choose(state, scene, actions) возвращает выбранное действие. Броски rng
+    те же, что у бота, только бот берёт на каждый ход свой rng из потока
+    игрока и после бросков игры выбирает им ещё вариант текста сцены.
+    day_type — сыграть день заданного типа вместо случайного.
+    """
+    transitions, scene_actions = scenario.transitions, scenario.scene_actions
+    state.day_type = day_type or generate_day_type(state, rng)
+    scene = transitions["start_day"].next_scene
+    while scene != "final":
+        transition = transitions[choose(state, scene, scene_actions[scene])]
+        apply_transition(state, transition)
+        if transition.event_chance is not None:
+            roll_random_event(state, scenario.events, transition.event_chance, rng)
+        scene = transition.next_scene
+    return finish_day(state)
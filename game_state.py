@@ -0,0 +1,180 @@
+import struct
+
+# ========== КОДЫ СТРОКОВЫХ ПОЛЕЙ ==========
+# Порядок в кортежах — это формат на диске: новые значения добавлять только в конец
+DAY_TYPES = ("normal", "career_crisis", "family_crisis", "lucky_day", "energy_drain", "skill_focus")
+SCENES = (None, "start", "work", "work_decision", "family", "partner", "transport", "final")
+EVENT_IDS = ("bonus_award", "friend_help", "traffic_jam", "kids_amazing")
+
+DAY_TYPE_CODES = {name: code for code, name in enumerate(DAY_TYPES)}
+SCENE_CODES = {name: code for code, name in enumerate(SCENES)}
+EVENT_BITS = {name: 1 << bit for bit, name in enumerate(EVENT_IDS)}
+
+# ========== СОСТОЯНИЕ ИГРОКА ==========
+class GameState:
+    """Состояние одного игрока.
+
+    Без __dict__: строковые поля сцены и типа дня хранятся малыми кодами,
+    наружу отдаются те же строки, что и раньше.
+    """
+
+    __slots__ = (
+        "career", "family", "energy", "skills",
+        "hours", "minutes", "day", "total_score", "days_completed", "_day_type",
+        "achievements", "events_seen",
+        "on_time_streak", "partner_streak", "help_streak", "day_marks",
+        "checked_subscription", "_current_scene", "player_name", "_pending_scene",
+        "rng", "seq",
+    )
+
+    def __init__(self):
+        # Основные метрики (0-10)
+        self.career = 0
+        self.family = 0
+        self.energy = 8
+        self.skills = 0
+
+        # Время и прогресс
+        self.hours = 15
+        self.minutes = 0
+        self.day = 1
+        self.total_score = 0
+        self.days_completed = 0
+        self.day_type = "normal"
+
+        # Игровые механики: достижения — битовая маска по реестру achievements.py
+        self.achievements = 0
+        # Виденные в текущем цикле события — биты EVENT_BITS
+        self.events_seen = 0
+
+        # Счётчики многодневных достижений: дней подряд без опоздания,
+        # без обиды партнера, с нанятым помощником; метки текущего дня
+        self.on_time_streak = 0
+        self.partner_streak = 0
+        self.help_streak = 0
+        self.day_marks = 0
+
+        # Системные
+        self.checked_subscription = False
+        self.current_scene = "start"
+        self.player_name = "Герой"
+        self.pending_scene = None
+
+        # Позиция личного потока случайных чисел (см. next_seed); 0 — поток
+        # ещё не засеян, бот засевает его от user_id при первом ходе
+        self.rng = 0
+        # Номер хода по модулю 256: им помечаются кнопки, и нажатие кнопки,
+        # показанной до последнего хода, отклоняется (см. render.pack_callback)
+        self.seq = 0
+
+    @property
+    def day_type(self):
+        return DAY_TYPES[self._day_type]
+
+    @day_type.setter
+    def day_type(self, value):
+        self._day_type = DAY_TYPE_CODES[value]
+
+    @property
+    def current_scene(self):
+        return SCENES[self._current_scene]
+
+    @current_scene.setter
+    def current_scene(self, value):
+        self._current_scene = SCENE_CODES[value]
+
+    @property
+    def pending_scene(self):
+        return SCENES[self._pending_scene]
+
+    @pending_scene.setter
+    def pending_scene(self, value):
+        self._pending_scene = SCENE_CODES[value]
+
+    # ========== УПАКОВКА В БАЙТЫ ==========
+    # Заголовок фиксированной ширины + имя игрока в UTF-8 (до 255 байт).
+    # Первый байт — версия формата: при смене полей меняется сам заголовок
+    # и номер версии, а записи чужой версии не читаются
+    _HEADER = struct.Struct("<BhhhhBBIiIBBBBHBBBBBQBB")
+    _VERSION = 1
+
+    def to_bytes(self):
+        name = self.player_name.encode("utf-8")[:255]
+        # Обрезка могла разрезать многобайтовый символ — откатываемся до целого
+        name = name.decode("utf-8", "ignore").encode("utf-8")
+        return self._HEADER.pack(
+            self._VERSION,
+            self.career, self.family, self.energy, self.skills,
+            self.hours, self.minutes,
+            self.day, self.total_score, self.days_completed, self._day_type,
+            self.checked_subscription, self._current_scene, self._pending_scene,
+            self.achievements, self.events_seen,
+            self.on_time_streak, self.partner_streak, self.help_streak, self.day_marks,
+            self.rng, self.seq, len(name),
+        ) + name
+
+    @classmethod
+    def from_bytes(cls, data):
+        (version, career, family, energy, skills,
+         hours, minutes,
+         day, total_score, days_completed, day_type,
+         checked_subscription, current_scene, pending_scene,
+         achievements, events_seen,
+         on_time_streak, partner_streak, help_streak, day_marks,
+         rng, seq, name_len) = cls._HEADER.unpack_from(data)
+        if version != cls._VERSION:
+            raise ValueError(f"Неизвестная версия формата состояния: {version}")
+
+        state = cls.__new__(cls)
+        state.career = career
+        state.family = family
+        state.energy = energy
+        state.skills = skills
+        state.hours = hours
+        state.minutes = minutes
+        state.day = day
+        state.total_score = total_score
+        state.days_completed = days_completed
+        state._day_type = day_type
+        state.checked_subscription = bool(checked_subscription)
+        state._current_scene = current_scene
+        state._pending_scene = pending_scene
+        state.achievements = achievements
+        state.events_seen = events_seen
+        state.on_time_streak = on_time_streak
+        state.partner_streak = partner_streak
+        state.help_streak = help_streak
+        state.day_marks = day_marks
+        state.rng = rng
+        state.seq = seq
+        offset = cls._HEADER.size
+        state.player_name = bytes(data[offset:offset + name_len]).decode("utf-8")
+        return state
+
+# ========== ЛИЧНЫЙ ПОТОК СЛУЧАЙНЫХ ЧИСЕЛ ==========
+# Поток — splitmix64: позиция хранится в состоянии игрока, каждый ход берёт
+# из неё 32-битное зерно для своего random.Random. Одинаковая позиция даёт
+# одинаковую игру, поэтому партию можно воспроизвести по записи нажатий
+_GOLDEN = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+def _mix64(z):
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+def seed_stream(state, seed):
+    """Засевает поток игрока; позиция 0 зарезервирована за «не засеян»"""
+    state.rng = _mix64(seed & _MASK64) or _GOLDEN
+
+def next_seed(state):
+    """Следующее 32-битное зерно из потока игрока"""
+    state.rng = (state.rng + _GOLDEN) & _MASK64
+    return _mix64(state.rng) >> 32
+
+# ========== СЕРИАЛИЗАЦИЯ ДЛЯ ХРАНИЛИЩА ==========
+def dump_state(state):
+    return state.to_bytes()
+
+def load_state(data):
+    return GameState.from_bytes(data)
@@ -0,0 +1,421 @@
+import os
+import sys
+import mmap
+import zlib
+import struct
+import marshal
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left
+
+# ========== ФОРМАТ НА ДИСКЕ ==========
+# Каталог журнала: сегменты journal-<поколение>.log и снимки snapshot-<поколение>.bin.
+# Снимок поколения G — все состояния на момент, когда начался сегмент G.
+# Восстановление: последний целый снимок, затем сегменты от его поколения по порядку.
+#
+# Снимок: заголовок, индекс — user_id по возрастанию и смещения их байтов
+# (массивы uint64), таблицы (zlib+marshal) и байты состояний подряд. Индекс
+# и таблицы закрыты crc32; состояния читаются по одному, когда понадобятся.
+SEGMENT_MAGIC = b"SSGJ"
+SNAPSHOT_MAGIC = b"SSGS"
+VERSION = 1
+_FILE_HEADER = struct.Struct("<4sHQ")   # сигнатура, версия, поколение
+_FRAME = struct.Struct("<IIB")          # длина тела, crc32 тела, вид записи
+_ACTION = struct.Struct("<QdIB")        # user_id, время, зерно rng, длина имени действия
+_SNAPSHOT = struct.Struct("<QQI")       # число состояний, длина таблиц, crc32 индекса и таблиц
+_COPY_CHUNK = 1 << 20                   # нетронутые состояния старого снимка копируются кусками
+
+# Виды записей
+ACTION = 1   # ход игрока
+TABLE = 2    # изменённые строки таблицы, которая живёт рядом с состояниями (рейтинг)
+
+def encode_action(user_id, timestamp, seed, action, payload=b""):
+    """Тело записи хода; payload — данные хода, которых нет в состоянии (имя при старте)"""
+    action = action.encode("utf-8")
+    return _ACTION.pack(user_id, timestamp, seed, len(action)) + action + payload
+
+def decode_action(body):
+    """→ (user_id, время, зерно, действие, payload)"""
+    user_id, timestamp, seed, size = _ACTION.unpack_from(body)
+    start = _ACTION.size
+    return user_id, timestamp, seed, body[start:start + size].decode("utf-8"), body[start + size:]
+
+def encode_table(index, rows):
+    return bytes((index,)) + marshal.dumps(rows)
+
+def decode_table(body):
+    return body[0], marshal.loads(body[1:])
+
+def _read_header(data, magic, path):
+    if len(data) < _FILE_HEADER.size:
+        raise ValueError(f"{path}: файл обрезан")
+    file_magic, version, generation = _FILE_HEADER.unpack_from(data)
+    if file_magic != magic or version != VERSION:
+        raise ValueError(f"{path}: неизвестный формат")
+    return generation
+
+def read_frames(path):
+    """(вид, тело) по порядку. На оборванном или битом хвосте чтение
+    останавливается: такой хвост — запись, которую не успели сбросить на диск"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < _FILE_HEADER.size:
+        # Сегмент создан, но до падения в него ничего не успели записать
+        return
+    _read_header(data, SEGMENT_MAGIC, path)
+    pos = _FILE_HEADER.size
+    while pos < len(data):
+        if pos + _FRAME.size > len(data):
+            logging.warning(f"{path}: оборванная запись в конце журнала, позиция {pos}")
+            return
+        size, crc, kind = _FRAME.unpack_from(data, pos)
+        body = data[pos + _FRAME.size:pos + _FRAME.size + size]
+        if len(body) < size or zlib.crc32(body) != crc:
+            logging.warning(f"{path}: битая запись в журнале, позиция {pos} — дальше не читаем")
+            return
+        yield kind, body
+        pos += _FRAME.size + size
+
+def _uint64s(data=b""):
+    values = array("Q")
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+def _uint64_bytes(values):
+    if sys.byteorder == "big":
+        values = array("Q", values)
+        values.byteswap()
+    return values.tobytes()
+
+# ========== СНИМОК ==========
+class Snapshot:
+    """Снимок на диске, открытый для чтения по user_id.
+
+    Файл отображается в память (mmap); в памяти процесса — только индекс,
+    16 байт на игрока, и таблицы. Байты состояния читаются при первом
+    обращении к игроку: страницы поднимает ядро, prefetch() просит его
+    начать заранее.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data = self._map
+        self.generation = _read_header(data, SNAPSHOT_MAGIC, path)
+        if len(data) < _FILE_HEADER.size + _SNAPSHOT.size:
+            raise ValueError(f"{path}: файл обрезан")
+        count, tables_size, crc = _SNAPSHOT.unpack_from(data, _FILE_HEADER.size)
+        start = _FILE_HEADER.size + _SNAPSHOT.size
+        index_end = start + 16 * count + 8
+        self._start = index_end + tables_size
+        if self._start > len(data) or zlib.crc32(data[start:self._start]) != crc:
+            raise ValueError(f"{path}: битый индекс снимка")
+        self.ids = _uint64s(data[start:start + 8 * count])
+        self.offsets = _uint64s(data[start + 8 * count:index_end])
+        self.tables = marshal.loads(zlib.decompress(data[index_end:self._start]))
+        if self._start + self.offsets[-1] > len(data):
+            raise ValueError(f"{path}: файл обрезан")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get(self, user_id):
+        """Байты состояния игрока или None"""
+        i = bisect_left(self.ids, user_id)
+        if i == len(self.ids) or self.ids[i] != user_id:
+            return None
+        return self._map[self._start + self.offsets[i]:self._start + self.offsets[i + 1]]
+
+    def __contains__(self, user_id):
+        i = bisect_left(self.ids, user_id)
+        return i < len(self.ids) and self.ids[i] == user_id
+
+    def prefetch(self):
+        if hasattr(self._map, "madvise") and hasattr(mmap, "MADV_WILLNEED"):
+            self._map.madvise(mmap.MADV_WILLNEED)
+
+    def copy(self, f, begin, end):
+        """Дописывает в f байты состояний с begin по end (смещения индекса)"""
+        for pos in range(begin, end, _COPY_CHUNK):
+            f.write(self._map[self._start + pos:self._start + min(pos + _COPY_CHUNK, end)])
+
+    def close(self):
+        self._map.close()
+
+
+def _merge(base, states):
+    """Индекс нового снимка: старый снимок base, поверх — states (user_id -> байты).
+
+    → (ids, offsets, куски), кусок — bytes из states или [начало, конец]
+    в данных base; нетронутые состояния base, идущие подряд, — один кусок
+    """
+    fresh = sorted(states)
+    old_ids = base.ids if base is not None else ()
+    old_offsets = base.offsets if base is not None else ()
+    ids, offsets, pieces = array("Q"), array("Q", [0]), []
+    size = i = j = 0
+    run = None
+    while i < len(old_ids) or j < len(fresh):
+        if j < len(fresh) and (i == len(old_ids) or fresh[j] <= old_ids[i]):
+            user_id = fresh[j]
+            j += 1
+            if i < len(old_ids) and old_ids[i] == user_id:
+                i += 1
+            data = states[user_id]
+            pieces.append(data)
+            size += len(data)
+            run = None
+        else:
+            user_id = old_ids[i]
+            begin, end = old_offsets[i], old_offsets[i + 1]
+            i += 1
+            if run is not None and run[1] == begin:
+                run[1] = end
+            else:
+                run = [begin, end]
+                pieces.append(run)
+            size += end - begin
+        ids.append(user_id)
+        offsets.append(size)
+    return ids, offsets, pieces
+
+# ========== ЖУРНАЛ ==========
+class Journal:
+    """Журнал только на дописывание с групповой фиксацией.
+
+    append() лишь кладёт запись в буфер цикла событий; commit() пишет весь
+    накопленный буфер одним write и одним fsync в пуле потоков — цикл событий
+    никогда не ждёт диск, а цена fsync делится на все записи пачки.
+    rotate() начинает новый сегмент и пишет снимок на его начало; старые
+    сегменты и снимки после этого удаляются (компакция). Снимок не пишется
+    с нуля: в него копируются байты прошлого снимка (self.snapshot), поверх
+    — состояния, которые отдал snapshot().
+
+    Пачка, которую не удалось записать, возвращается в начало буфера и уйдёт
+    следующим сбросом: то, что из неё успело попасть в файл, срезается, иначе
+    повтор задвоил бы ходы. Если срезать не вышло, хвост сегмента под
+    подозрением (torn): сбросы в журнал останавливаются до снимка — он
+    покрывает и эту пачку.
+    """
+
+    def __init__(self, directory, fsync=True):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fsync = fsync
+        self.generation = 0
+        self.segment_size = 0
+        self._file = None
+        self._pending = []
+        self._lock = None
+        self.torn = False
+        self.snapshot = None    # последний снимок (Snapshot), открытый для чтения
+
+        self.records = 0
+        self.commits = 0
+        self.bytes_written = 0
+        self.snapshots = 0
+
+    def _path(self, prefix, generation):
+        extension = "log" if prefix == "journal" else "bin"
+        return os.path.join(self.directory, f"{prefix}-{generation:08d}.{extension}")
+
+    def _generations(self, prefix):
+        found = []
+        for name in os.listdir(self.directory):
+            stem, _, _ = name.partition(".")
+            head, _, number = stem.partition("-")
+            if head == prefix and number.isdigit() and not name.endswith(".tmp"):
+                found.append(int(number))
+        return sorted(found)
+
+    # ---------- Восстановление ----------
+    def recover(self):
+        """→ (снимок Snapshot или None, записи после него)
+
+        Берётся последний целый снимок; битый снимок пропускается в пользу
+        предыдущего — его сегменты удаляются только после записи следующего.
+        Из снимка читается только индекс и таблицы.
+        """
+        snapshot, base = None, None
+        for generation in reversed(self._generations("snapshot")):
+            path = self._path("snapshot", generation)
+            try:
+                snapshot = Snapshot(path)
+            except (OSError, ValueError, EOFError, zlib.error) as e:
+                logging.warning(f"Снимок {path} не читается, берём предыдущий: {e}")
+                continue
+            base = generation
+            break
+        self.snapshot = snapshot
+
+        segments = [g for g in self._generations("journal") if base is None or g >= base]
+        self.generation = max(segments + [base or 0])
+
+        def frames():
+            for generation in segments:
+                yield from read_frames(self._path("journal", generation))
+        return snapshot, frames()
+
+    # ---------- Запись ----------
+    def append(self, kind, body):
+        self._pending.append(_FRAME.pack(len(body), zlib.crc32(body), kind) + body)
+        self.records += 1
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def _lock_for_loop(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def commit(self):
+        """Сбрасывает буфер на диск; записи, добавленные во время fsync, уйдут следующей пачкой"""
+        async with self._lock_for_loop():
+            if not self._pending or self._file is None or self.torn:
+                return
+            frames, self._pending = self._pending, []
+            batch = b"".join(frames)
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._write, self._file, batch)
+            except Exception:
+                if not self.torn:
+                    self._pending[:0] = frames
+                raise
+            self.segment_size += len(batch)
+            self.bytes_written += len(batch)
+            self.commits += 1
+
+    def _write(self, f, data):
+        start = f.seek(0, os.SEEK_END)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[f.write(view):]
+            if self.fsync:
+                os.fsync(f.fileno())
+        except BaseException:
+            try:
+                f.truncate(start)
+            except Exception as e:
+                logging.error(f"Не удалось откатить недописанную пачку журнала: {e}")
+                self.torn = True
+            raise
+
+    def _open_segment(self, generation):
+        # Без буфера: недописанную пачку срезает truncate, а не дописывает flush
+        f = open(self._path("journal", generation), "ab", buffering=0)
+        if f.tell() == 0:
+            f.write(_FILE_HEADER.pack(SEGMENT_MAGIC, VERSION, generation))
+            f.flush()
+        return f
+
+    def resume(self):
+        """Продолжает последний сегмент, если он пуст — так бывает после чистой
+        остановки, которая закончилась снимком. True — продолжаем без нового
+        снимка; False — сегмент с записями или его нет, нужен rotate()"""
+        path = self._path("journal", self.generation)
+        try:
+            if os.path.getsize(path) != _FILE_HEADER.size:
+                return False
+        except OSError:
+            return False
+        self._file = self._open_segment(self.generation)
+        self.segment_size = 0
+        return True
+
+    async def rotate(self, snapshot):
+        """Новый сегмент со снимком на его начало, затем удаление старых файлов.
+
+        snapshot() вызывается синхронно в момент переключения: всё, что в нём
+        есть, записано в старые сегменты, всё, что после, — в новый. Он
+        возвращает (user_id -> байты состояния, строки таблиц); игроки, которых
+        там нет, переходят в новый снимок из прошлого как есть.
+        """
+        async with self._lock_for_loop():
+            old_file, frames, self._pending = self._file, self._pending, []
+            generation = self.generation + 1
+            data = snapshot()
+            self._file = self._open_segment(generation)
+            self.generation = generation
+            self.segment_size = 0
+            loop = asyncio.get_running_loop()
+
+            # Хвост старого сегмента; если он не записался, ходы из него есть в снимке
+            written = False
+            if old_file is not None:
+                try:
+                    if frames and not self.torn:
+                        batch = b"".join(frames)
+                        await loop.run_in_executor(None, self._write, old_file, batch)
+                        self.bytes_written += len(batch)
+                        written = True
+                except Exception as e:
+                    logging.error(f"Ошибка записи журнала, пачка уйдёт в снимок: {e}")
+                finally:
+                    old_file.close()
+
+            states, tables = data
+            try:
+                self.snapshot = await loop.run_in_executor(
+                    None, self._write_snapshot, generation, states, tables, self.snapshot,
+                )
+            except Exception:
+                # Без снимка ходы пачки нужны в журнале — в начале нового сегмента
+                if frames and not written and not self.torn:
+                    self._pending[:0] = frames
+                raise
+            self.torn = False
+            self.snapshots += 1
+
+    def _write_snapshot(self, generation, states, tables, base):
+        ids, offsets, pieces = _merge(base, states)
+        index = _uint64_bytes(ids) + _uint64_bytes(offsets) + zlib.compress(marshal.dumps(tables), 1)
+        path = self._path("snapshot", generation)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_FILE_HEADER.pack(SNAPSHOT_MAGIC, VERSION, generation))
+            f.write(_SNAPSHOT.pack(len(ids), len(index) - 16 * len(ids) - 8, zlib.crc32(index)))
+            f.write(index)
+            for piece in pieces:
+                if isinstance(piece, list):
+                    base.copy(f, *piece)
+                else:
+                    f.write(piece)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self._fsync_directory()
+        snapshot = Snapshot(path)
+        # Снимок на месте — всё, что старше, больше не нужно. Прошлый снимок
+        # ещё отображён в память: на POSIX удалённый файл читается до munmap
+        for prefix in ("journal", "snapshot"):
+            for old in self._generations(prefix):
+                if old < generation:
+                    try:
+                        os.remove(self._path(prefix, old))
+                    except OSError as e:
+                        logging.warning(f"Не удалось удалить {self._path(prefix, old)}, удалим при следующем снимке: {e}")
+        return snapshot
+
+    def _fsync_directory(self):
+        if not self.fsync or not hasattr(os, "O_DIRECTORY"):
+            return
+        fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
@@ -0,0 +1,158 @@
+import time
+from sortedcontainers import SortedList
+
+# Ключ индекса — одно целое: сначала больший счёт, при равенстве меньший user_id.
+# Целое занимает в памяти втрое меньше кортежа и сравнивается быстрее.
+USER_ID_BITS = 64
+USER_ID_MASK = (1 << USER_ID_BITS) - 1
+
+def _key(score, user_id):
+    return (-score << USER_ID_BITS) | user_id
+
+def _unkey(key):
+    return -(key >> USER_ID_BITS), key & USER_ID_MASK
+
+def current_day(now=None):
+    """Номер календарного дня по UTC — граница дневного рейтинга"""
+    return int((time.time() if now is None else now) // 86400)
+
+# ========== ОДНА ТАБЛИЦА РЕЙТИНГА ==========
+class Board:
+    """Лучший счёт каждого игрока и упорядоченный индекс по нему.
+
+    Обновление, место игрока и первые N — O(log n) без обхода всех игроков.
+    """
+
+    __slots__ = ("scores", "index")
+
+    def __init__(self, scores=None):
+        self.scores = dict(scores or ())   # user_id -> лучший счёт
+        # Ключи считаются прямо здесь, без вызова _key на строку: на миллионе игроков
+        # это заметная доля времени запуска
+        self.index = SortedList([(-score << USER_ID_BITS) | user_id for user_id, score in self.scores.items()])
+
+    def __len__(self):
+        return len(self.scores)
+
+    def submit(self, user_id, score):
+        """Учитывает счёт, если он лучше прежнего; True — если рейтинг изменился"""
+        old = self.scores.get(user_id)
+        if old is not None:
+            if score <= old:
+                return False
+            self.index.remove(_key(old, user_id))
+        self.scores[user_id] = score
+        self.index.add(_key(score, user_id))
+        return True
+
+    def top(self, n):
+        """[(user_id, счёт)] первых n мест"""
+        return [_unkey(key)[::-1] for key in self.index.islice(0, n)]
+
+    def rank(self, user_id):
+        """(место с единицы, счёт) или None, если игрока нет в рейтинге"""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return self.index.bisect_left(_key(score, user_id)) + 1, score
+
+# ========== ОБЩИЙ И ДНЕВНОЙ РЕЙТИНГ ==========
+class Leaderboard:
+    """Рейтинг за всё время и за текущие сутки (UTC).
+
+    Обновляется из final_scene, когда пересчитан счёт, и сохраняется вместе
+    с состояниями: хранилище подключает его как дополнительную таблицу
+    (StateStore.attach_table) и пишет изменённые строки при каждом сбросе.
+    """
+
+    schema = (
+        "CREATE TABLE IF NOT EXISTS leaderboard ("
+        "user_id INTEGER PRIMARY KEY, name TEXT NOT NULL, best INTEGER NOT NULL, "
+        "day INTEGER NOT NULL, day_best INTEGER NOT NULL)"
+    )
+    select = "SELECT user_id, name, best, day, day_best FROM leaderboard"
+    upsert = (
+        "INSERT INTO leaderboard (user_id, name, best, day, day_best) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT(user_id) DO UPDATE SET name = excluded.name, best = excluded.best, "
+        "day = excluded.day, day_best = excluded.day_best"
+    )
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self.day = current_day(clock())
+        self.all_time = Board()
+        self.today = Board()
+        self.names = {}
+        self._dirty = set()
+
+    def __len__(self):
+        return len(self.all_time)
+
+    def _roll(self):
+        day = current_day(self._clock())
+        if day != self.day:
+            self.day = day
+            self.today = Board()
+
+    def record(self, user_id, name, score):
+        """Счёт игрока после очередного дня"""
+        self._roll()
+        changed = self.all_time.submit(user_id, score)
+        changed = self.today.submit(user_id, score) or changed
+        if self.names.get(user_id) != name:
+            self.names[user_id] = name
+            changed = True
+        if changed:
+            self._dirty.add(user_id)
+
+    def top(self, n, daily=False):
+        """[(имя, счёт)] первых n мест общего или дневного рейтинга"""
+        self._roll()
+        board = self.today if daily else self.all_time
+        return [(self.names.get(user_id, "?"), score) for user_id, score in board.top(n)]
+
+    def standing(self, user_id, daily=False):
+        """(место, счёт, всего игроков) или None"""
+        self._roll()
+        board = self.today if daily else self.all_time
+        found = board.rank(user_id)
+        return None if found is None else found + (len(board),)
+
+    def view(self, user_id, n):
+        """Всё для экрана рейтинга: (топ, место игрока, топ дня, место за день)"""
+        return (
+            self.top(n), self.standing(user_id),
+            self.top(n, daily=True), self.standing(user_id, daily=True),
+        )
+
+    def counts(self):
+        """(игроков в общем рейтинге, сегодня)"""
+        self._roll()
+        return len(self.all_time), len(self.today)
+
+    # Протокол дополнительной таблицы для хранилища состояний
+    def load(self, rows):
+        best, today = {}, {}
+        for user_id, name, score, day, day_best in rows:
+            self.names[user_id] = name
+            best[user_id] = score
+            if day == self.day:
+                today[user_id] = day_best
+        self.all_time = Board(best)
+        self.today = Board(today)
+
+    def collect(self):
+        """Строки для записи: игроки, чей рейтинг изменился с прошлого сброса"""
+        dirty, self._dirty = self._dirty, set()
+        rows = []
+        for user_id in dirty:
+            day_best = self.today.scores.get(user_id)
+            rows.append((
+                user_id, self.names[user_id], self.all_time.scores[user_id],
+                self.day if day_best is not None else 0, day_best or 0,
+            ))
+        return rows
+
+    def requeue(self, rows):
+        """Запись не удалась — строки уйдут со следующим сбросом"""
+        self._dirty.update(row[0] for row in rows)
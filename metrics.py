@@ -0,0 +1,181 @@
+import json
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+
+# Границы корзин гистограмм задержек, в секундах
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# ========== ГИСТОГРАММА ==========
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # последняя корзина — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Оценка квантиля по корзинам: верхняя граница корзины, где он лежит"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+# ========== РЕЕСТР МЕТРИК ==========
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+class Metrics:
+    """Счётчики, гистограммы и снимаемые по запросу значения.
+
+    Метки — кортеж пар (имя, значение); на горячем пути только словарь
+    и сложение, формат Prometheus собирается при чтении.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self._meta = {}         # имя -> (тип, описание)
+        self._counters = {}     # (имя, метки) -> число
+        self._histograms = {}   # (имя, метки) -> Histogram
+        self._gauges = {}       # имя -> функция, возвращающая число или {метки: число}
+
+    def describe(self, name, kind, help_text):
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        key = (name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def gauge(self, name, read, help_text, kind="gauge"):
+        self.describe(name, kind, help_text)
+        self._gauges[name] = read
+
+    def _gauge_values(self):
+        for name, read in self._gauges.items():
+            value = read()
+            if isinstance(value, dict):
+                for labels, v in value.items():
+                    yield name, labels, v
+            else:
+                yield name, (), value
+
+    def render(self):
+        """Текст в формате Prometheus exposition 0.0.4"""
+        lines = []
+        by_name = {}
+        for (name, labels), value in self._counters.items():
+            by_name.setdefault(name, []).append(("counter", labels, value))
+        for (name, labels), histogram in self._histograms.items():
+            by_name.setdefault(name, []).append(("histogram", labels, histogram))
+        for name, labels, value in self._gauge_values():
+            by_name.setdefault(name, []).append(("gauge", labels, value))
+
+        for name in sorted(by_name):
+            samples = by_name[name]
+            kind, help_text = self._meta.get(name, (samples[0][0], ""))
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_kind, labels, value in sorted(samples, key=lambda s: s[1]):
+                if sample_kind != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(value.buckets + (float("inf"),), value.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {value.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Короткая сводка для лога: суммы счётчиков и p50/p95 гистограмм по именам"""
+        totals = {}
+        for (name, _), value in self._counters.items():
+            totals[name] = totals.get(name, 0) + value
+        merged = {}
+        for (name, _), histogram in self._histograms.items():
+            total = merged.get(name)
+            if total is None:
+                total = merged[name] = Histogram(histogram.buckets)
+            total.counts = [a + b for a, b in zip(total.counts, histogram.counts)]
+            total.count += histogram.count
+            total.sum += histogram.sum
+        for name, histogram in merged.items():
+            totals[name] = {
+                "count": histogram.count,
+                "p50_ms": round(histogram.quantile(0.5) * 1000, 1),
+                "p95_ms": round(histogram.quantile(0.95) * 1000, 1),
+            }
+        for name, labels, value in self._gauge_values():
+            totals[name + _format_labels(labels)] = value
+        return totals
+
+
+class NullMetrics:
+    """Метрики выключены: каждый вызов — пустая функция"""
+
+    enabled = False
+
+    def describe(self, name, kind, help_text):
+        pass
+
+    def inc(self, name, labels=(), value=1):
+        pass
+
+    def observe(self, name, value, labels=()):
+        pass
+
+    def gauge(self, name, read, help_text, kind="gauge"):
+        pass
+
+NULL_METRICS = NullMetrics()
+
+# ========== ФОНОВЫЕ ЗАДАЧИ ==========
+async def monitor_loop_lag(metrics, interval=0.5):
+    """Насколько позже заказанного просыпается цикл событий — признак блокировок"""
+    metrics.describe("event_loop_lag_seconds", "histogram", "Опоздание пробуждения цикла событий")
+    lag = 0.0
+    metrics.gauge("event_loop_lag_last_seconds", lambda: lag, "Последнее измеренное опоздание цикла событий")
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - started - interval)
+        metrics.observe("event_loop_lag_seconds", lag)
+
+async def log_snapshots(metrics, interval):
+    while True:
+        await asyncio.sleep(interval)
+        logging.info(f"Метрики: {json.dumps(metrics.snapshot(), ensure_ascii=False)}")
+
+async def serve_metrics(metrics, method, target, headers, body):
+    """Обработчик для webhook.HttpServer: GET /metrics"""
+    if target.split("?", 1)[0] != "/metrics":
+        return 404, "text/plain", b"not found"
+    if method != "GET":
+        return 405, "text/plain", b"method not allowed"
+    return 200, "text/plain; version=0.0.4; charset=utf-8", metrics.render().encode("utf-8")
@@ -0,0 +1,205 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import NULL_METRICS
+
+# ========== ПРИОРИТЕТЫ ==========
+# Чем меньше число, тем раньше запрос уходит, когда бюджет исчерпан
+PRIORITY_ANSWER = 0   # ответы на нажатия и служебные запросы
+PRIORITY_SCENE = 1    # сцены, которые ждёт игрок
+PRIORITY_ECHO = 2     # косметика: эхо выбора, снятие старых кнопок
+
+# Методы, которые создают или меняют сообщения и попадают под лимиты Telegram
+THROTTLED_PREFIXES = ("send", "edit", "copy", "forward")
+
+# ========== ТОКЕН-БАКЕТ ==========
+class TokenBucket:
+    """Бюджет rate токенов в секунду с запасом capacity.
+
+    reserve() забирает токен даже в долг и возвращает, сколько ждать его
+    появления, — так очередь к одному бакету выстраивается без блокировок.
+    """
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now):
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def wait_time(self, now):
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, now, seconds):
+        """Флуд-контроль: ближайшие seconds секунд токенов не будет"""
+        self._refill(now)
+        # Следующий reserve() уйдёт в минус ровно на seconds секунд ожидания
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+# ========== ПЛАНИРОВЩИК ИСХОДЯЩИХ ЗАПРОСОВ ==========
+class Outbox(BaseRateLimiter):
+    """Единственная точка выхода к Bot API.
+
+    Подключается к Application как rate limiter, поэтому через него проходит
+    каждый запрос бота. Сообщения ограничиваются глобальным бюджетом и бюджетом
+    на чат; когда глобальный бюджет исчерпан, ожидающие запросы выпускаются по
+    приоритету. На RetryAfter чат ставится на паузу и запрос повторяется.
+    """
+
+    def __init__(self, global_rate=30.0, chat_rate=1.0, chat_burst=3, max_retries=3, backoff=1.0,
+                 metrics=NULL_METRICS):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.metrics = metrics
+        metrics.describe("bot_api_requests_total", "counter", "Запросы к Bot API по методу и исходу")
+        metrics.describe("bot_api_latency_seconds", "histogram", "Время ответа Bot API по методу")
+        metrics.describe("outbox_wait_seconds", "histogram", "Ожидание бюджета перед отправкой")
+
+        # Запас не меньше одного токена: у шарда доля глобального бюджета бывает меньше 1 в секунду
+        self._global = TokenBucket(global_rate, max(1.0, global_rate))
+        self._chats = {}
+        self._prune_at = 100_000
+        self._waiters = []
+        self._seq = itertools.count()
+        self._releaser = None
+
+        self.requests = 0
+        self.delayed = 0
+        self.flood_waits = 0
+        self.failed = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        if self._releaser is not None:
+            self._releaser.cancel()
+            self._releaser = None
+        for _, _, waiter in self._waiters:
+            if not waiter.done():
+                waiter.cancel()
+        self._waiters.clear()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        self.requests += 1
+        chat_id = data.get("chat_id")
+        if isinstance(rate_limit_args, int):
+            priority = rate_limit_args
+        elif endpoint == "answerCallbackQuery":
+            priority = PRIORITY_ANSWER
+        else:
+            priority = PRIORITY_SCENE
+        throttled = endpoint.startswith(THROTTLED_PREFIXES)
+
+        metrics = self.metrics
+        method = (("method", endpoint),)
+        attempt = 0
+        while True:
+            if throttled:
+                queued = time.perf_counter()
+                await self._acquire(chat_id, priority)
+                metrics.observe("outbox_wait_seconds", time.perf_counter() - queued)
+            started = time.perf_counter()
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                metrics.inc("bot_api_requests_total", method + (("result", "retry_after"),))
+                attempt += 1
+                self.flood_waits += 1
+                if attempt > self.max_retries:
+                    self.failed += 1
+                    raise
+                delay = max(float(e.retry_after), self.backoff * 2 ** (attempt - 1))
+                logging.warning(f"Флуд-контроль на {endpoint} (чат {chat_id}): ждём {delay:.1f} с")
+                if throttled and chat_id is not None:
+                    # Следующие запросы в этот чат тоже подождут, а не получат ещё один 429
+                    self._chat_bucket(chat_id).pause(time.monotonic(), delay)
+                else:
+                    await asyncio.sleep(delay)
+            except Exception:
+                metrics.inc("bot_api_requests_total", method + (("result", "error"),))
+                raise
+            else:
+                metrics.inc("bot_api_requests_total", method + (("result", "ok"),))
+                metrics.observe("bot_api_latency_seconds", time.perf_counter() - started, method)
+                return result
+
+    async def _acquire(self, chat_id, priority):
+        if chat_id is not None:
+            wait = self._chat_bucket(chat_id).reserve(time.monotonic())
+            if wait > 0:
+                self.delayed += 1
+                await asyncio.sleep(wait)
+
+        if not self._waiters and self._global.wait_time(time.monotonic()) == 0:
+            self._global.take()
+            return
+
+        self.delayed += 1
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+        if self._releaser is None or self._releaser.done():
+            self._releaser = asyncio.create_task(self._release_loop())
+        await waiter
+
+    async def _release_loop(self):
+        # Выпускаем ждущих по одному по мере появления глобальных токенов
+        while self._waiters:
+            wait = self._global.wait_time(time.monotonic())
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                self._global.take()
+                waiter.set_result(None)
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self._prune_at:
+                self._prune_chats()
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _prune_chats(self):
+        # Полный бакет ничем не отличается от нового — его можно забыть
+        now = time.monotonic()
+        for chat_id in [c for c, bucket in self._chats.items() if bucket.is_full(now)]:
+            del self._chats[chat_id]
+        self._prune_at = max(100_000, 2 * len(self._chats))
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "delayed": self.delayed,
+            "flood_waits": self.flood_waits,
+            "failed": self.failed,
+            "queued": len(self._waiters),
+        }
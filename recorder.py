@@ -0,0 +1,180 @@
+"""Запись входящих обновлений Telegram для воспроизведения (benchmarks/replay.py).
+
+Бот с RECORD_PATH кладёт каждое обновление в буфер (в режиме вебхука — тело
+запроса как пришло, при опросе — заново собранный JSON), фоновая задача дописывает
+накопленное в файл пачками: пачка — zlib-сжатый список (время, JSON обновления)
+с длиной и crc32, как записи журнала. Однотипные обновления сжимаются в разы,
+запись на горячем пути — одно добавление в список.
+
+Сводка по записи:
+
+    python recorder.py updates.rec
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import struct
+import marshal
+import asyncio
+import logging
+import argparse
+from collections import Counter
+
+MAGIC = b"SSGU"
+VERSION = 1
+_FILE_HEADER = struct.Struct("<4sH")    # сигнатура, версия
+_CHUNK = struct.Struct("<II")           # длина сжатой пачки, crc32 пачки
+
+# ========== ЗАПИСЬ ==========
+class Recorder:
+    enabled = True
+
+    def __init__(self, path, flush_interval=5.0, chunk_size=1000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.chunk_size = chunk_size
+        self._pending = []
+        self._full = None
+        self._task = None
+
+        self.recorded = 0
+        self.chunks = 0
+        self.bytes_written = 0
+
+    def record_raw(self, data):
+        """С горячего пути: тело обновления в JSON — только добавление в буфер"""
+        self._pending.append((time.time(), bytes(data)))
+        self.recorded += 1
+        if len(self._pending) >= self.chunk_size and self._full is not None:
+            self._full.set()
+
+    async def handle(self, update, context):
+        # Обработчик группы -1 для режима опроса: исходного JSON там уже нет,
+        # собираем его из Update (заметно дороже, чем record_raw)
+        self.record_raw(json.dumps(update.to_dict(), ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    async def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._full = asyncio.Event()
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Ошибка записи обновлений: {e}")
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        chunk = zlib.compress(marshal.dumps(batch), 6)
+        await asyncio.get_running_loop().run_in_executor(None, self._write, chunk)
+        self.chunks += 1
+        self.bytes_written += _CHUNK.size + len(chunk)
+
+    def _write(self, chunk):
+        with open(self.path, "ab") as f:
+            if f.tell() == 0:
+                f.write(_FILE_HEADER.pack(MAGIC, VERSION))
+            f.write(_CHUNK.pack(len(chunk), zlib.crc32(chunk)) + chunk)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+class NullRecorder:
+    """Запись выключена"""
+
+    enabled = False
+    recorded = chunks = bytes_written = 0
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+NULL_RECORDER = NullRecorder()
+
+# ========== ЧТЕНИЕ ==========
+def read_updates(path):
+    """(время, обновление как dict) по порядку. Оборванная или битая пачка
+    в конце — запись, которую не успели дописать: чтение на ней останавливается"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < _FILE_HEADER.size:
+        return
+    magic, version = _FILE_HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path}: неизвестный формат")
+    pos = _FILE_HEADER.size
+    while pos + _CHUNK.size <= len(data):
+        size, crc = _CHUNK.unpack_from(data, pos)
+        chunk = data[pos + _CHUNK.size:pos + _CHUNK.size + size]
+        if len(chunk) < size or zlib.crc32(chunk) != crc:
+            logging.warning(f"{path}: битая пачка, позиция {pos} — дальше не читаем")
+            return
+        for timestamp, update in marshal.loads(zlib.decompress(chunk)):
+            yield timestamp, json.loads(update)
+        pos += _CHUNK.size + size
+
+# ========== СВОДКА ==========
+def summary(path):
+    kinds, actions, users = Counter(), Counter(), set()
+    first = last = None
+    for timestamp, update in read_updates(path):
+        first = timestamp if first is None else first
+        last = timestamp
+        if "callback_query" in update:
+            kinds["callback_query"] += 1
+            actions[update["callback_query"].get("data")] += 1
+            users.add(update["callback_query"]["from"]["id"])
+        elif "message" in update:
+            kinds["message"] += 1
+            users.add(update["message"].get("from", update["message"]["chat"])["id"])
+        else:
+            kinds["other"] += 1
+    if first is None:
+        return f"В {path} нет обновлений"
+    lines = [
+        f"Обновлений: {sum(kinds.values())} ({dict(kinds)}), игроков: {len(users)}",
+        f"Период: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(first))} — "
+        f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(last))}",
+        f"Размер: {os.path.getsize(path)} байт",
+        "Нажатия:",
+    ]
+    lines.extend(f"  {action:<22} {n:>9}" for action, n in actions.most_common())
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", nargs="?", default=os.environ.get("RECORD_PATH", "updates.rec"))
+    args = parser.parse_args()
+    try:
+        text = summary(args.path)
+    except (OSError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
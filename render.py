@@ -0,0 +1,346 @@
+from urllib.parse import quote, urlencode
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+import achievements
+
+# Клавиатуры и шаблоны собираются один раз при импорте. Объекты PTB неизменяемы,
+# поэтому одну разметку безопасно отдавать во все сообщения, а в шаблоны на
+# каждый запрос подставляются только время, статы и имя.
+
+def _keyboard(*rows):
+    return InlineKeyboardMarkup([[InlineKeyboardButton(text, callback_data=data)] for text, data in rows])
+
+def _levels(high, mid, low):
+    # Подпись для значений 0..10; всё, что выше 10, подписывается как 10
+    return tuple(high if value >= 7 else mid if value >= 4 else low for value in range(11))
+
+def level(labels, value):
+    return labels[value] if value <= 10 else labels[10]
+
+# ========== ВЕРСИИ КНОПОК ==========
+# callback_data = "<номер хода игрока, 2 hex>:<действие>". Номер — GameState.seq
+# по модулю 256: кнопка, показанная до последнего хода, устаревает и отклоняется
+# до любой работы. Метка занимает 3 байта из 64, которые Telegram даёт на
+# callback_data, поэтому id хода в сценарии — не длиннее 61 байта (content.py)
+SEQ_MODULO = 256
+CALLBACK_LIMIT = 64
+
+def pack_callback(seq, action):
+    return f"{seq:02x}:{action}"
+
+def unpack_callback(data):
+    """→ (номер или None, действие). Без метки — кнопки, разосланные до
+    появления номеров: их принимаем как раньше, без проверки"""
+    if data is None:
+        return None, None
+    head, sep, action = data.partition(":")
+    if not sep or len(head) != 2:
+        return None, data
+    try:
+        return int(head, 16), action
+    except ValueError:
+        return None, data
+
+def _stamp_row(row, seq):
+    return tuple(
+        InlineKeyboardButton(button.text, callback_data=pack_callback(seq, button.callback_data))
+        if button.callback_data is not None else button
+        for button in row
+    )
+
+# Помеченные клавиатуры: id разметки → (разметка, варианты по номеру). Разметки
+# без ссылок живут всё время работы (статические и клавиатуры сценария), и
+# на каждую набирается не больше SEQ_MODULO вариантов; разметки со ссылками
+# (поделиться, канал) свои на каждый показ и собираются заново
+_stamped = {}
+STAMP_CACHE_KEYBOARDS = 512
+
+def stamp(keyboard, seq):
+    """Клавиатура с номером хода в каждой кнопке; PTB-объекты неизменяемы, поэтому
+    готовые варианты раздаются всем игрокам с тем же номером"""
+    if keyboard is None:
+        return None
+    rows = keyboard.inline_keyboard
+    if any(button.url is not None for row in rows for button in row):
+        return InlineKeyboardMarkup(tuple(_stamp_row(row, seq) for row in rows))
+    entry = _stamped.get(id(keyboard))
+    if entry is None or entry[0] is not keyboard:
+        if len(_stamped) >= STAMP_CACHE_KEYBOARDS:
+            # Перезагрузки сценария оставляют старые разметки — начинаем кэш заново
+            _stamped.clear()
+        entry = _stamped[id(keyboard)] = (keyboard, [None] * SEQ_MODULO)
+    variants = entry[1]
+    stamped = variants[seq]
+    if stamped is None:
+        stamped = variants[seq] = InlineKeyboardMarkup(tuple(_stamp_row(row, seq) for row in rows))
+    return stamped
+
+# ========== СТАТИЧЕСКИЕ КЛАВИАТУРЫ ==========
+START_DAY_KEYBOARD = _keyboard(("🚀 Начать день!", "start_day"))
+CONTINUE_KEYBOARD = _keyboard(("✨ Продолжить", "continue_after_event"))
+GATE_KEYBOARD = _keyboard(("🔍 Проверить подписку", "check_subscription"))
+
+STATISTICS_KEYBOARD = _keyboard(
+    ("🏆 Мои достижения", "show_achievements"),
+    ("🏅 Рейтинг игроков", "show_top"),
+    ("📤 Поделиться результатом", "share_progress"),
+    ("🔄 Следующий день", "next_day"),
+    ("🔄 Начать заново", "restart"),
+)
+ACHIEVEMENTS_KEYBOARD = _keyboard(
+    ("📊 Назад к статистике", "show_stats"),
+    ("📤 Поделиться прогрессом", "share_progress"),
+)
+LEADERBOARD_KEYBOARD = _keyboard(
+    ("📊 Назад к статистике", "show_stats"),
+)
+
+# Нижние кнопки под результатом дня; над ними — ссылка «Поделиться» со счётом
+RESULT_ROWS = (
+    (InlineKeyboardButton("🔄 Следующий день", callback_data="next_day"),),
+    (InlineKeyboardButton("🔄 Начать заново", callback_data="restart"),),
+)
+
+BOT_URL = "https://t.me/SurvivalStudentGameBot"
+
+def share_url(state, achievement_count):
+    """Ссылка t.me/share: текст с обычными пробелами и переводами строк,
+    закодированный целиком (пробел — %20, а не +) — иначе часть клиентов
+    обрывает его на первом пробеле"""
+    text = SHARE_TEXT.format(
+        day=state.day, score=state.total_score, energy=state.energy, career=state.career,
+        family=state.family, skills=state.skills, achievements=achievement_count,
+    )
+    return "https://t.me/share/url?" + urlencode({"url": BOT_URL, "text": text}, quote_via=quote)
+
+def share_keyboard(share_url):
+    return InlineKeyboardMarkup(((InlineKeyboardButton("📤 Поделиться результатом", url=share_url),),) + RESULT_ROWS)
+
+HINT_ROW = (InlineKeyboardButton("💡 Подсказка", callback_data="hint"),)
+
+def with_hint(keyboard):
+    """Та же клавиатура с кнопкой подсказки последней строкой"""
+    return InlineKeyboardMarkup(tuple(keyboard.inline_keyboard) + (HINT_ROW,))
+
+def subscribe_keyboard(channel_username):
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("🔍 Проверить подписку", callback_data="check_subscription")],
+        [InlineKeyboardButton("📺 Перейти в канал", url=f"https://t.me/{channel_username[1:]}")]
+    ])
+
+# ========== ШАБЛОНЫ ТЕКСТОВ ==========
+WELCOME = (
+    "🎮 ГОНКА ДО УНИВЕРА: ИСКУССТВО ЖИЗНЕННОГО БАЛАНСА\n\n"
+    "Привет, {name}! 👋\n\n"
+    "Ты — современный супергерой: студент вечернего отделения, работник, партнер и родитель троих детей!\n\n"
+    "ТВОЯ МИССИЯ:\n"
+    "🕒 Успеть на пару к 18:40\n"
+    "👨‍👩‍👧‍👦 Сохранить семью счастливой\n"
+    "💼 Не потерять работу\n"
+    "⚡ Не выгореть от усталости\n\n"
+    "ОСОБЕННОСТИ:\n"
+    "👉 Случайные события и кризисы\n"
+    "👉 Система прокачки навыков\n"
+    "👉 Достижения и рейтинг\n"
+    "👉 Многодневная кампания\n\n"
+    "📢 Для старта подпишись на канал автора:\n{channel}"
+)
+
+NOT_SUBSCRIBED = (
+    "❌ Вы еще не подписаны на канал\n\n"
+    "Подпишитесь на канал и нажмите кнопку проверки:\n"
+    "{channel}"
+)
+
+DAY_DESCRIPTIONS = {
+    "normal": "📅 ОБЫЧНЫЙ ДЕНЬ\nСтандартные вызовы и задачи",
+    "career_crisis": "💥 КРИЗИС НА РАБОТЕ\nЗадачи сложнее, но больше карьерного опыта",
+    "family_crisis": "👨‍👩‍👧‍👦 СЕМЕЙНЫЙ КРИЗИС\nСемья требует больше внимания и заботы",
+    "lucky_day": "🍀 УДАЧНЫЙ ДЕНЬ\nВыше шанс позитивных событий и бонусов",
+    "energy_drain": "😫 ДЕНЬ УСТАЛОСТИ\nЭнергия тратится быстрее, нужна осторожность",
+    "skill_focus": "🔧 ДЕНЬ НАВЫКОВ\nОтличная возможность прокачать умения",
+}
+
+# Описание типа дня вшито в шаблон заранее — по шаблону на каждый тип
+DAY_START = {
+    day_type: (
+        "🎮 ГОНКА ДО УНИВЕРА: День {day} 🎮\n\n"
+        f"🌟 {description}\n\n"
+        "🕒 Сейчас {time}\n"
+        "📚 Пары начинаются в 18:40\n\n"
+        "⚡ Твои ресурсы:\n"
+        "Энергия: {energy}/10\n"
+        "Карьера: {career}/10\n"
+        "Семья: {family}/10\n"
+        "Навыки: {skills}/10\n\n"
+        "Готов к новым вызовам?"
+    )
+    for day_type, description in DAY_DESCRIPTIONS.items()
+}
+
+STATISTICS_TEXT = (
+    "📊 ДЕТАЛЬНАЯ СТАТИСТИКА ДНЯ {day}\n\n"
+    "💼 Карьера: {career}/10 - {career_level}\n"
+    "👨‍👩‍👧‍👦 Семья: {family}/10 - {family_level}\n"
+    "⚡ Энергия: {energy}/10 - {energy_level}\n"
+    "🔧 Навыки: {skills}/10 - {skills_level}\n\n"
+    "⭐ ОБЩИЙ СЧЁТ: {score}\n"
+    "📅 ДНЕЙ ЗАВЕРШЕНО: {days_completed}\n"
+    "🏆 ДОСТИЖЕНИЙ: {achievements}\n\n"
+    "Стремись к балансу во всех сферах! 🎯"
+)
+CAREER_LEVELS = _levels("Отлично", "Хорошо", "Проблемы")
+FAMILY_LEVELS = _levels("Счастлива", "Довольна", "Обижена")
+ENERGY_LEVELS = _levels("Полон сил", "Нормально", "Устал")
+SKILLS_LEVELS = _levels("Мастер", "Развивается", "Новичок")
+
+STALE_BUTTON = "⌛ Эта кнопка устарела — жми кнопки в последнем сообщении"
+SHARE_PROMPT = "🎮 Поделись своим успехом!\n\nПусть друзья узнают, как ты круто балансируешь жизнь!"
+SHARE_TEXT = (
+    "Я играю в «Гонку до Универа»! День {day}, счёт {score}\n"
+    "⚡ Энергия {energy}, 💼 Карьера {career}, 👨‍👩‍👧 Семья {family}, 📚 Навыки {skills}\n"
+    "🏆 Достижений: {achievements}\n"
+    "Присоединяйся!"
+)
+
+HINT_TEXT = "💡 Лучший ход: {choice}\nВ среднем {success:.1f}/5 целей к концу дня"
+HINT_UNAVAILABLE = "💡 Здесь подсказка не нужна — выбирать не из чего"
+
+# ========== РЕЙТИНГ ==========
+LEADERBOARD_SIZE = 10
+LEADERBOARD_PLACES = ("🥇", "🥈", "🥉")
+LEADERBOARD_EMPTY = "Пока никто не завершил день"
+LEADERBOARD_MINE = "👉 Ты: {rank}-е место из {total}, счёт {score}"
+LEADERBOARD_NOT_RANKED = "👉 Тебя здесь пока нет — заверши день!"
+
+# ========== ИТОГИ ДНЯ ==========
+# Строка на каждую цель: [0] — провал, [1] — успех
+RESULT_LINES = (
+    ("❌ Время: Опоздал", "✅ Время: Успел на пару"),
+    ("❌ Работа: Проблемы на работе", "✅ Работа: Карьера в порядке"),
+    ("❌ Семья: Семья обижена", "✅ Семья: Семья счастлива"),
+    ("❌ Энергия: Нужен отдых", "✅ Энергия: Силы есть"),
+    ("❌ Навыки: Можно лучше", "✅ Навыки: Развиваешься"),
+)
+
+MOTIVATIONAL_PHRASES = {
+    5: "🏆 LEGENDARY BALANCE!\nТы — бог многозадачности! Этот результат стоит показать всем!",
+    4: "🔥 ПОЧТИ ИДЕАЛ!\nОтличный баланс! Друзья будут завидовать твоим навыкам!",
+    3: "💪 СОЛИДНЫЙ РЕЗУЛЬТАТ!\nТы держишь всё под контролем! Продолжай в том же духе!",
+    2: "📈 ЕСТЬ КУДА РАСТИ!\nНеплохо, но можно лучше! Завтра будет новый шанс!",
+    1: "🌱 НАЧАЛО ПУТИ!\nБаланс — это искусство! С каждой попыткой будет получаться лучше!",
+    0: "🔄 УЧЕБНЫЙ ДЕНЬ!\nЗавтра будет новый шанс проявить себя!",
+}
+
+# Экран достижений зависит только от маски показываемых достижений —
+# текст собирается один раз на маску (их не больше 4096) и дальше берётся готовым
+_ACHIEVEMENT_SCREENS = {}
+
+# ========== ФУНКЦИИ РЕНДЕРА ==========
+def day_start_text(state, time):
+    return DAY_START[state.day_type].format(
+        day=state.day, time=time,
+        energy=state.energy, career=state.career, family=state.family, skills=state.skills,
+    )
+
+def statistics_text(state):
+    return STATISTICS_TEXT.format(
+        day=state.day,
+        career=state.career, career_level=level(CAREER_LEVELS, state.career),
+        family=state.family, family_level=level(FAMILY_LEVELS, state.family),
+        energy=state.energy, energy_level=level(ENERGY_LEVELS, state.energy),
+        skills=state.skills, skills_level=level(SKILLS_LEVELS, state.skills),
+        score=state.total_score,
+        days_completed=state.days_completed,
+        achievements=achievements.count(state.achievements),
+    )
+
+def achievements_text(mask):
+    mask &= achievements.DISPLAY_MASK
+    text = _ACHIEVEMENT_SCREENS.get(mask)
+    if text is None:
+        parts = ["🏆 ТВОИ ДОСТИЖЕНИЯ\n\n"]
+        for achievement in achievements.DISPLAY_ORDER:
+            if mask & achievement.bit:
+                parts.append(f"✅ {achievement.title}\n")
+            else:
+                parts.append(f"🔒 {achievement.title} - {achievement.condition}\n")
+        parts.append(f"\n🎯 Прогресс: {achievements.count(mask)}/{len(achievements.DISPLAY_ORDER)} достижений")
+        text = _ACHIEVEMENT_SCREENS[mask] = "".join(parts)
+    return text
+
+EVENT_EFFECT_LINES = (
+    ("career", "💼 Карьера {:+d}\n"),
+    ("family", "👨‍👩‍👧‍👦 Семья {:+d}\n"),
+    ("energy", "⚡ Энергия {:+d}\n"),
+)
+
+def _event_template(event, text):
+    effects = event.effects
+    head = f"🎲 СЛУЧАЙНОЕ СОБЫТИЕ!\n\n{text}"
+    stats = "".join(line.format(effects[stat]) for stat, line in EVENT_EFFECT_LINES if effects.get(stat))
+    has_time = "minutes" in effects
+    if has_time or stats:
+        head += "\nЭффекты:\n"
+    return head, has_time, stats
+
+def event_text(outcome, template, old_time, new_time):
+    """template — заготовка события из event_templates()"""
+    head, has_time, stats = template
+    text = head + (f"⏰ Время: {old_time} → {new_time}\n" if has_time else "") + stats
+
+    if outcome.new_achievement:
+        text += f"\n🏆 Получено достижение: {outcome.new_achievement.name}"
+    return text
+
+# ========== СЦЕНЫ ИЗ СЦЕНАРИЯ ==========
+# Тексты сцен, подписи кнопок и тексты событий живут в content/scenario.json.
+# Разметка и заготовки собираются один раз на загруженный сценарий и
+# заменяются вместе с ним при перезагрузке.
+def scene_keyboards(scenario, hints=False):
+    """Сцена → клавиатура; с hints — кнопка подсказки там, где есть выбор"""
+    keyboards = {}
+    for scene, actions in scenario.scene_actions.items():
+        keyboard = _keyboard(*((scenario.buttons[action], action) for action in actions))
+        keyboards[scene] = with_hint(keyboard) if hints and len(actions) > 1 else keyboard
+    return keyboards
+
+def event_templates(scenario):
+    """id события → заготовка текста: строки эффектов не меняются от показа к показу"""
+    return {
+        compiled.event.id: _event_template(compiled.event, scenario.event_texts[compiled.event.id])
+        for compiled in scenario.events.events
+    }
+
+def result_text(result, time, total_score):
+    if result.late:
+        text = f"🕒 {time} - ❌ ОПОЗДАЛ НА ПАРУ!\n\n"
+    else:
+        text = f"🕒 {time} - ✅ УСПЕЛ НА ПАРУ!\n\n"
+    text += "📊 ИТОГИ ДНЯ:\n\n"
+    text += "\n".join(line[score] for line, score in zip(RESULT_LINES, result.scores)) + "\n\n"
+    text += MOTIVATIONAL_PHRASES.get(result.total_success, "🎯 Интересный результат!")
+    text += f"\n\n🎯 Успешных целей: {result.total_success}/5"
+    text += f"\n⭐ Общий счёт: {total_score}"
+    text += f"\n🏆 Достижений: {result.achievement_count}/{len(achievements.DISPLAY_ORDER)}"
+    return text
+
+def _leaderboard_section(title, top, standing):
+    lines = [title]
+    for place, (name, score) in enumerate(top, 1):
+        mark = LEADERBOARD_PLACES[place - 1] if place <= len(LEADERBOARD_PLACES) else f"{place}."
+        lines.append(f"{mark} {name} — {score}")
+    if not top:
+        lines.append(LEADERBOARD_EMPTY)
+    if standing is None:
+        lines.append(LEADERBOARD_NOT_RANKED)
+    else:
+        rank, score, total = standing
+        lines.append(LEADERBOARD_MINE.format(rank=rank, total=total, score=score))
+    return "\n".join(lines)
+
+def leaderboard_text(top_all, standing_all, top_today, standing_today):
+    """top_* — [(имя, счёт)], standing_* — (место, счёт, всего) или None"""
+    return "🏅 РЕЙТИНГ ИГРОКОВ\n\n" + "\n\n".join((
+        _leaderboard_section("⭐ За всё время:", top_all, standing_all),
+        _leaderboard_section("📅 Сегодня:", top_today, standing_today),
+    ))
@@ -0,0 +1,399 @@
+"""Шардированный режим: один приёмник вебхука и N процессов бота на одной машине.
+
+Диспетчер принимает вебхук Telegram, достаёт из обновления только user_id и
+пересылает тело как есть процессу shard_of(user_id, N). Все обновления игрока
+приходят в один и тот же процесс, поэтому его состояние, очередь нажатий и
+отсев двойных тапов остаются локальными — межпроцессных блокировок нет.
+Общее для всех шардов — рейтинг — живёт в диспетчере: тот же упорядоченный
+индекс leaderboard.Leaderboard, сохранённый в своей базе SQLite. Шарды шлют
+в него счета пачками и спрашивают экран рейтинга по внутреннему порту.
+
+    SHARDS=4 WEBHOOK_URL=https://example.com python shards.py
+"""
+import os
+import sys
+import hmac
+import json
+import signal
+import asyncio
+import logging
+from urllib.parse import urlsplit
+
+from webhook import HttpServer, HttpConnection
+from leaderboard import Leaderboard
+from storage import SQLiteTableStore
+
+# ========== КОНФИГУРАЦИЯ ==========
+BOT_TOKEN = os.environ.get("BOT_TOKEN", "your_telegram_bot_token")
+BOT_API_BASE_URL = os.environ.get("BOT_API_BASE_URL", "")
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+SHARDS = int(os.environ.get("SHARDS", "0")) or os.cpu_count() or 1
+SHARD_PORT_BASE = int(os.environ.get("SHARD_PORT_BASE", str(WEBHOOK_PORT + 1)))
+SHARD_RESTART_DELAY = float(os.environ.get("SHARD_RESTART_DELAY", "1.0"))
+LEADERBOARD_DB_PATH = os.environ.get("LEADERBOARD_DB_PATH", "leaderboard.db")
+HINTS_ENABLED = os.environ.get("HINTS_ENABLED", "0") == "1"
+SOLVER_TABLE_PATH = os.environ.get("SOLVER_TABLE_PATH", "solver_table.bin")
+STATE_FLUSH_INTERVAL = float(os.environ.get("STATE_FLUSH_INTERVAL", "1.0"))
+
+BOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+
+# ========== МАРШРУТИЗАЦИЯ ==========
+_GOLDEN = 0x9E3779B97F4A7C15
+_MASK = (1 << 64) - 1
+
+def shard_of(user_id, shards):
+    """Номер шарда игрока. Фибоначчиево хеширование перемешивает соседние
+    user_id, так что шарды нагружены ровно и при последовательных id"""
+    return ((user_id * _GOLDEN) & _MASK) * shards >> 64
+
+def update_user_id(update):
+    """user_id автора обновления из разобранного JSON; для обновлений без
+    автора (посты каналов) — id чата, иначе 0"""
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        author = value.get("from")
+        if isinstance(author, dict) and "id" in author:
+            return author["id"]
+        chat = value.get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return 0
+
+def shard_path(path, index):
+    """Свой файл для каждого шарда: states.db → states-2.db"""
+    root, ext = os.path.splitext(path)
+    return f"{root}-{index}{ext}"
+
+def worker_env(index, base=None):
+    """Окружение процесса-шарда: локальный вебхук, свои файлы, общий рейтинг.
+
+    Всё, что шард пишет, у него своё, включая кэш сценария (и его .tmp) и
+    запись обновлений. Общий файл один — таблица подсказок: её готовит
+    диспетчер до запуска шардов, а шарды только читают.
+
+    Лимит Telegram на сообщения — на весь бот, а не на процесс, поэтому
+    глобальный бюджет исходящих (и его запас — он равен темпу) делится
+    между шардами поровну. Бюджет на чат не делится: чат игрока живёт в
+    одном шарде.
+    """
+    env = dict(os.environ if base is None else base)
+    record_path = env.get("RECORD_PATH", "")
+    global_rate = float(env.get("OUTBOX_GLOBAL_RATE", "30"))
+    env.update({
+        "BOT_MODE": "webhook",
+        "WEBHOOK_LISTEN": "127.0.0.1",
+        "WEBHOOK_PORT": str(SHARD_PORT_BASE + 1 + index),
+        "WEBHOOK_PATH": WEBHOOK_PATH,
+        # Вебхук у Telegram регистрирует диспетчер, секрет тоже проверяет он
+        "WEBHOOK_URL": "",
+        "WEBHOOK_SECRET": "",
+        "SHARD_INDEX": str(index),
+        "SHARD_COUNT": str(SHARDS),
+        "LEADERBOARD_URL": f"http://127.0.0.1:{SHARD_PORT_BASE}",
+        "STATE_DB_PATH": shard_path(env.get("STATE_DB_PATH", "states.db"), index),
+        "JOURNAL_DIR": os.path.join(env.get("JOURNAL_DIR", "journal"), f"shard-{index}"),
+        "ANALYTICS_DIR": os.path.join(env.get("ANALYTICS_DIR", "analytics"), f"shard-{index}"),
+        "CONTENT_CACHE_PATH": shard_path(env.get("CONTENT_CACHE_PATH", "scenario.cache"), index),
+        "RECORD_PATH": shard_path(record_path, index) if record_path else "",
+        "OUTBOX_GLOBAL_RATE": str(global_rate / SHARDS),
+    })
+    metrics_port = int(env.get("METRICS_PORT", "0"))
+    if metrics_port:
+        env["METRICS_PORT"] = str(metrics_port + index)
+    return env
+
+# ========== РЕЙТИНГ ШАРДА ==========
+class RemoteLeaderboard:
+    """Рейтинг, который живёт в диспетчере.
+
+    record() только дописывает счёт в буфер — он уходит одной пачкой раз в
+    flush_interval. view() сначала отправляет буфер: запросы идут по одному
+    соединению по порядку, поэтому игрок видит в рейтинге свой последний день.
+    """
+
+    def __init__(self, url, flush_interval=0.2):
+        parts = urlsplit(url)
+        self._link = HttpConnection(parts.hostname, parts.port)
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._task = None
+        self.players = 0
+        self.players_today = 0
+        self.errors = 0
+
+    def record(self, user_id, name, score):
+        self._pending.append((user_id, name, score))
+
+    def counts(self):
+        """Размеры рейтинга на момент последнего запроса view()"""
+        return self.players, self.players_today
+
+    async def view(self, user_id, n):
+        await self.flush()
+        try:
+            status, body = await self._link.request(
+                "POST", "/leaderboard/view", json.dumps({"user_id": user_id, "n": n}).encode("utf-8"),
+            )
+            if status != 200:
+                raise ConnectionError(f"диспетчер ответил {status}")
+        except ConnectionError as e:
+            self.errors += 1
+            logging.error(f"Рейтинг недоступен: {e}")
+            return [], None, [], None
+        data = json.loads(body)
+        self.players, self.players_today = data["players"], data["today"]
+        return (
+            [tuple(row) for row in data["top"]], _standing(data["standing"]),
+            [tuple(row) for row in data["top_daily"]], _standing(data["standing_daily"]),
+        )
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        try:
+            status, _ = await self._link.request("POST", "/leaderboard/record", json.dumps(batch).encode("utf-8"))
+            if status != 200:
+                raise ConnectionError(f"диспетчер ответил {status}")
+        except ConnectionError as e:
+            self.errors += 1
+            # Счета не теряем: уйдут со следующей пачкой
+            self._pending[:0] = batch
+            logging.error(f"Не удалось отправить счета в рейтинг: {e}")
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        await self._link.close()
+
+def _standing(value):
+    return None if value is None else tuple(value)
+
+# ========== ТАБЛИЦА ПОДСКАЗОК ==========
+def prepare_solver_table(path=SOLVER_TABLE_PATH):
+    """Считает и сохраняет таблицу подсказок, если её нет или она для других
+    правил. Зовёт диспетчер до запуска шардов: так файл пишет один процесс"""
+    from solver import Solver
+
+    solver = Solver()
+    if solver.load(path):
+        return
+    solver.precompute(days=1)
+    try:
+        solver.save(path)
+    except OSError as e:
+        logging.error(f"Не удалось сохранить таблицу подсказок: {e}")
+
+# ========== ДИСПЕТЧЕР ==========
+class Worker:
+    """Процесс-шард: запускается заново, если упал"""
+
+    def __init__(self, index):
+        self.index = index
+        self.port = SHARD_PORT_BASE + 1 + index
+        self.link = HttpConnection("127.0.0.1", self.port)
+        self.process = None
+        self.restarts = 0
+        self._stopping = False
+
+    async def run(self):
+        while True:
+            # Своя сессия: Ctrl+C в терминале получает только диспетчер и гасит шарды по порядку
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable, BOT_PATH, env=worker_env(self.index), start_new_session=True,
+            )
+            code = await self.process.wait()
+            if self._stopping:
+                return
+            self.restarts += 1
+            logging.error(f"Шард {self.index} завершился с кодом {code}, перезапуск через {SHARD_RESTART_DELAY} с")
+            await asyncio.sleep(SHARD_RESTART_DELAY)
+
+    async def wait_ready(self, timeout=60.0):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", self.port)
+                writer.close()
+                return
+            except OSError:
+                if loop.time() > deadline:
+                    raise RuntimeError(f"Шард {self.index} не поднялся за {timeout} с")
+                await asyncio.sleep(0.1)
+
+    def signal(self, sig):
+        if self.process is not None and self.process.returncode is None:
+            self.process.send_signal(sig)
+
+    async def stop(self):
+        self._stopping = True
+        # Сначала закрываем своё соединение, чтобы шард не ждал его при остановке
+        await self.link.close()
+        self.signal(signal.SIGTERM)
+        if self.process is not None:
+            await self.process.wait()
+
+
+class Dispatcher:
+    """Приёмник вебхука, маршрутизатор обновлений по шардам и общий рейтинг"""
+
+    def __init__(self, shards=SHARDS):
+        self.workers = [Worker(i) for i in range(shards)]
+        self.leaderboard = Leaderboard()
+        self.store = SQLiteTableStore(LEADERBOARD_DB_PATH, flush_interval=STATE_FLUSH_INTERVAL)
+        self.store.attach_table(self.leaderboard)
+        self.public = HttpServer(self._route_public, WEBHOOK_LISTEN, WEBHOOK_PORT)
+        self.internal = HttpServer(self._route_internal, "127.0.0.1", SHARD_PORT_BASE)
+        self.forwarded = 0
+        self.rejected = 0
+        self.unavailable = 0
+        self._tasks = []
+
+    # ---------- Вебхук ----------
+    async def _route_public(self, method, target, headers, body):
+        path = target.split("?", 1)[0]
+        if path == "/health":
+            if method != "GET":
+                return 405, "text/plain", b"method not allowed"
+            info = self.health()
+            status = 200 if info["status"] == "ok" else 503
+            return status, "application/json", json.dumps(info).encode("utf-8")
+        if path != WEBHOOK_PATH:
+            return 404, "text/plain", b"not found"
+        if method != "POST":
+            return 405, "text/plain", b"method not allowed"
+        if WEBHOOK_SECRET and not hmac.compare_digest(headers.get("x-telegram-bot-api-secret-token", ""), WEBHOOK_SECRET):
+            self.rejected += 1
+            return 403, "text/plain", b"forbidden"
+        try:
+            user_id = update_user_id(json.loads(body))
+        except (ValueError, AttributeError, TypeError) as e:
+            self.rejected += 1
+            logging.error(f"Некорректное обновление в вебхуке: {e}")
+            return 400, "text/plain", b"bad update"
+
+        worker = self.workers[shard_of(user_id, len(self.workers))]
+        try:
+            status, payload = await worker.link.request("POST", WEBHOOK_PATH, body)
+        except ConnectionError as e:
+            # Шард перезапускается — Telegram повторит доставку сам
+            self.unavailable += 1
+            logging.error(f"Шард {worker.index} недоступен: {e}")
+            return 503, "text/plain", b"shard unavailable"
+        self.forwarded += 1
+        return status, "text/plain", payload
+
+    def health(self):
+        alive = sum(1 for w in self.workers if w.process is not None and w.process.returncode is None)
+        return {
+            "status": "ok" if alive == len(self.workers) else "degraded",
+            "shards": len(self.workers),
+            "alive": alive,
+            "restarts": sum(w.restarts for w in self.workers),
+            "forwarded": self.forwarded,
+            "unavailable": self.unavailable,
+            "leaderboard": len(self.leaderboard),
+        }
+
+    # ---------- Общий рейтинг ----------
+    async def _route_internal(self, method, target, headers, body):
+        if method != "POST":
+            return 405, "text/plain", b"method not allowed"
+        if target == "/leaderboard/record":
+            for user_id, name, score in json.loads(body):
+                self.leaderboard.record(user_id, name, score)
+            return 200, "text/plain", b"ok"
+        if target == "/leaderboard/view":
+            request = json.loads(body)
+            top, standing, top_daily, standing_daily = self.leaderboard.view(request["user_id"], request["n"])
+            players, today = self.leaderboard.counts()
+            return 200, "application/json", json.dumps({
+                "top": top, "standing": standing, "top_daily": top_daily, "standing_daily": standing_daily,
+                "players": players, "today": today,
+            }).encode("utf-8")
+        return 404, "text/plain", b"not found"
+
+    # ---------- Жизненный цикл ----------
+    async def start(self):
+        await self.store.start()
+        if HINTS_ENABLED:
+            prepare_solver_table()
+        # Рейтинг должен отвечать раньше, чем шарды начнут играть
+        await self.internal.start()
+        self._tasks = [asyncio.create_task(worker.run()) for worker in self.workers]
+        await asyncio.gather(*(worker.wait_ready() for worker in self.workers))
+        await self.public.start()
+        logging.info(f"Диспетчер слушает {WEBHOOK_LISTEN}:{self.public.port}{WEBHOOK_PATH}, шардов: {len(self.workers)}")
+
+    def reload(self):
+        """SIGHUP диспетчеру — перезагрузка сценария во всех шардах"""
+        for worker in self.workers:
+            worker.signal(signal.SIGHUP)
+
+    async def stop(self):
+        await self.public.stop()
+        # Шарды перед выходом досылают счета — внутренний порт закрываем после них
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.internal.stop()
+        await self.store.close()
+
+
+async def set_webhook():
+    from telegram import Bot, Update
+
+    bot = Bot(BOT_TOKEN, base_url=BOT_API_BASE_URL or "https://api.telegram.org/bot")
+    async with bot:
+        await bot.set_webhook(
+            url=WEBHOOK_URL + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=Update.ALL_TYPES,
+        )
+
+async def run_dispatcher(stop_event=None):
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+    dispatcher = Dispatcher()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, dispatcher.reload)
+    except (NotImplementedError, RuntimeError, AttributeError):
+        pass
+    await dispatcher.start()
+    try:
+        if WEBHOOK_URL:
+            await set_webhook()
+        await stop_event.wait()
+    finally:
+        await dispatcher.stop()
+
+def main():
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    asyncio.run(run_dispatcher())
+
+
+if __name__ == "__main__":
+    main()
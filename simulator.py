@@ -0,0 +1,389 @@
+"""Монте-Карло симулятор баланса «Гонки до Универа».
+
+Играет сразу миллионы партий: состояние всех партий лежит в массивах NumPy,
+ход применяется ко всем партиям в сцене одной векторной операцией. Ходы и
+события берутся из сценария content/scenario.json (или CONTENT_PATH), правила
+дня — из engine, поэтому правка сценария сразу видна в симуляции.
+
+Политики выбора:
+  random — на каждой сцене случайная кнопка, тип дня как в игре;
+  matrix — полная матрица: каждый путь (комбинация кнопок) × каждый тип дня
+           поровну, путь у партии один на все дни.
+
+    python simulator.py --games 1000000 --days 1 --policy matrix
+    python simulator.py --games 200000 --days 5 --reference 20000
+
+--reference N прогоняет N партий чистым движком engine.play_day без NumPy —
+распределения должны совпасть с векторной версией в пределах шума.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from types import SimpleNamespace
+
+import numpy as np
+
+from game_state import GameState, DAY_TYPES
+from achievements import BY_ID
+from content import DEFAULT_PATH, load_scenario
+from engine import (
+    STAT_BOUNDS, LUCKY_DAY_EVENT_CHANCE, DAY_START, LATE_AFTER, GOAL_THRESHOLDS, HIGH_STAT,
+    STAT_POINTS, DAY_BONUS, ACHIEVEMENT_BONUS, HIGH_STAT_BONUS, ACHIEVEMENT_RULES, DayResult,
+    CRISIS_DAY_TYPES, DAY_MARK_BITS, STREAK_MAX, play_day, begin_next_day,
+)
+
+SCENARIO = load_scenario(os.environ.get("CONTENT_PATH", DEFAULT_PATH))
+TRANSITIONS = SCENARIO.transitions
+SCENE_ACTIONS = SCENARIO.scene_actions
+EVENT_CATALOGUE = SCENARIO.events
+EVENTS = tuple(compiled.event for compiled in EVENT_CATALOGUE.events)
+
+STATS = tuple(STAT_BOUNDS)
+LUCKY_DAY = DAY_TYPES.index("lucky_day")
+CRISIS_CODES = np.array([DAY_TYPES.index(t) for t in CRISIS_DAY_TYPES])
+MAX_SCORE = 4096
+
+# ========== ТАБЛИЦЫ ХОДОВ В ВИДЕ МАССИВОВ ==========
+SIM_SCENES = tuple(SCENE_ACTIONS) + ("final",)
+SCENE_INDEX = {scene: i for i, scene in enumerate(SIM_SCENES)}
+FINAL = SCENE_INDEX["final"]
+
+class SceneTable:
+    """Ходы одной сцены: по элементу массива на кнопку"""
+
+    def __init__(self, actions):
+        transitions = [TRANSITIONS[a] for a in actions]
+        self.actions = actions
+        self.minutes = np.array([t.effects.get("minutes", 0) for t in transitions])
+        self.deltas = {stat: np.array([t.effects.get(stat, 0) for t in transitions]) for stat in STATS}
+        self.next_scene = np.array([SCENE_INDEX[t.next_scene] for t in transitions])
+        self.marks = np.array([t.marks for t in transitions])
+        self.event_chance = np.array([
+            -1.0 if t.event_chance is None else t.event_chance for t in transitions
+        ])
+
+SCENE_TABLES = [SceneTable(SCENE_ACTIONS[scene]) for scene in SIM_SCENES[:-1]]
+
+# Сцены с настоящим выбором задают «путь» — число в смешанной системе счисления
+CHOICE_SCENES = [i for i, table in enumerate(SCENE_TABLES) if len(table.actions) > 1]
+PATH_RADIX = {}
+_radix = 1
+for _i in CHOICE_SCENES:
+    PATH_RADIX[_i] = _radix
+    _radix *= len(SCENE_TABLES[_i].actions)
+PATH_COUNT = _radix
+
+EVENT_MINUTES = np.array([e.effects.get("minutes", 0) for e in EVENTS])
+EVENT_DELTAS = {stat: np.array([e.effects.get(stat, 0) for e in EVENTS]) for stat in STATS}
+EVENT_SEEN_BITS = np.array([c.bit for c in EVENT_CATALOGUE.events])
+ALL_EVENTS_SEEN = EVENT_CATALOGUE.all_seen
+# Веса событий: строка на тип дня
+EVENT_WEIGHTS = np.array([EVENT_CATALOGUE.weights[day_type] for day_type in DAY_TYPES], dtype=np.float64)
+EVENT_ACHIEVEMENT_BITS = np.array([BY_ID[e.achievement].bit if e.achievement else 0 for e in EVENTS])
+
+def path_name(path):
+    return " → ".join(
+        SCENE_TABLES[i].actions[(path // PATH_RADIX[i]) % len(SCENE_TABLES[i].actions)]
+        for i in CHOICE_SCENES
+    )
+
+def popcount(values):
+    values = values.astype(np.uint32)
+    count = np.zeros(values.shape, dtype=np.int64)
+    while values.any():
+        count += values & 1
+        values >>= 1
+    return count
+
+# ========== ПАРТИИ В МАССИВАХ ==========
+class Batch:
+    """Состояния n партий, по массиву на поле GameState"""
+
+    def __init__(self, n, rng, policy, first_game=0, day_type=None):
+        self.n = n
+        self.rng = rng
+        self.policy = policy
+        self.time = np.full(n, DAY_START, dtype=np.int64)
+        initial = GameState()
+        self.stats = {stat: np.full(n, getattr(initial, stat), dtype=np.int64) for stat in STATS}
+        self.days_completed = np.zeros(n, dtype=np.int64)
+        self.achievements = np.zeros(n, dtype=np.int64)
+        self.events_seen = np.zeros(n, dtype=np.int64)
+        self.day_type = np.zeros(n, dtype=np.int64)
+        self.day_marks = np.zeros(n, dtype=np.int64)
+        self.on_time_streak = np.zeros(n, dtype=np.int64)
+        self.partner_streak = np.zeros(n, dtype=np.int64)
+        self.help_streak = np.zeros(n, dtype=np.int64)
+
+        games = np.arange(first_game, first_game + n)
+        self.path = games % PATH_COUNT
+        if day_type is not None:
+            self.fixed_day_type = np.full(n, DAY_TYPES.index(day_type))
+        elif policy == "matrix":
+            self.fixed_day_type = (games // PATH_COUNT) % len(DAY_TYPES)
+        else:
+            self.fixed_day_type = None
+
+    def generate_day_type(self):
+        if self.fixed_day_type is not None:
+            self.day_type = self.fixed_day_type.copy()
+            return
+        rng = self.rng
+        crisis = (self.days_completed >= 3) & (rng.random(self.n) < 0.6)
+        self.day_type = np.where(
+            crisis,
+            CRISIS_CODES[rng.integers(0, len(CRISIS_CODES), self.n)],
+            rng.integers(0, len(DAY_TYPES), self.n),
+        )
+
+    def _apply(self, idx, minutes, deltas):
+        self.time[idx] += minutes
+        for stat, (low, high) in STAT_BOUNDS.items():
+            value = np.maximum(low, self.stats[stat][idx] + deltas[stat])
+            if high is not None:
+                value = np.minimum(high, value)
+            self.stats[stat][idx] = value
+
+    def play_day(self):
+        self.generate_day_type()
+        scene = np.full(self.n, SCENE_INDEX[TRANSITIONS["start_day"].next_scene])
+        while True:
+            active = scene != FINAL
+            if not active.any():
+                break
+            for s, table in enumerate(SCENE_TABLES):
+                idx = np.flatnonzero(scene == s)
+                if not len(idx):
+                    continue
+                choices = len(table.actions)
+                if choices == 1:
+                    action = np.zeros(len(idx), dtype=np.int64)
+                elif self.policy == "matrix":
+                    action = (self.path[idx] // PATH_RADIX[s]) % choices
+                else:
+                    action = self.rng.integers(0, choices, len(idx))
+
+                self._apply(idx, table.minutes[action], {stat: d[action] for stat, d in table.deltas.items()})
+                self.day_marks[idx] |= table.marks[action]
+                self._roll_events(idx, table.event_chance[action])
+                scene[idx] = table.next_scene[action]
+        return self.finish_day()
+
+    def _roll_events(self, idx, chance):
+        has_roll = chance >= 0
+        chance = np.where(self.day_type[idx] == LUCKY_DAY, LUCKY_DAY_EVENT_CHANCE, chance)
+        happened = has_roll & (self.rng.random(len(idx)) <= chance)
+        idx = idx[happened]
+        if not len(idx):
+            return
+
+        # По весам среди ещё не виденных в цикле; когда видены все — цикл заново
+        seen = self.events_seen[idx]
+        seen = np.where(seen & ALL_EVENTS_SEEN == ALL_EVENTS_SEEN, 0, seen)
+        day_weights = EVENT_WEIGHTS[self.day_type[idx]]
+        weights = day_weights * ((seen[:, None] & EVENT_SEEN_BITS[None, :]) == 0)
+        exhausted = weights.sum(axis=1) == 0
+        seen[exhausted] = 0
+        weights[exhausted] = day_weights[exhausted]
+        cumulative = np.cumsum(weights, axis=1)
+        pick = self.rng.random(len(idx)) * cumulative[:, -1]
+        event = np.argmax(cumulative > pick[:, None], axis=1)
+
+        self.events_seen[idx] = seen | EVENT_SEEN_BITS[event]
+        self._apply(idx, EVENT_MINUTES[event], {stat: d[event] for stat, d in EVENT_DELTAS.items()})
+        self.achievements[idx] |= EVENT_ACHIEVEMENT_BITS[event]
+
+    def finish_day(self):
+        self.days_completed += 1
+        stats = [self.stats[s] for s in STATS]
+        score = sum(stats) * STAT_POINTS + self.days_completed * DAY_BONUS
+        score += popcount(self.achievements) * ACHIEVEMENT_BONUS
+        for value in stats:
+            score += np.where(value >= HIGH_STAT, HIGH_STAT_BONUS, 0)
+
+        late = self.time > LATE_AFTER
+        scores = (~late,) + tuple(self.stats[s] >= GOAL_THRESHOLDS[s] for s in STATS)
+        success = sum(goal.astype(np.int64) for goal in scores)
+
+        offended = (self.day_marks & DAY_MARK_BITS["offended_partner"]) != 0
+        hired = (self.day_marks & DAY_MARK_BITS["hired_help"]) != 0
+        self.on_time_streak = np.where(late, 0, np.minimum(STREAK_MAX, self.on_time_streak + 1))
+        self.partner_streak = np.where(offended, 0, np.minimum(STREAK_MAX, self.partner_streak + 1))
+        self.help_streak = np.where(hired, np.minimum(STREAK_MAX, self.help_streak + 1), 0)
+        self.day_marks[:] = 0
+
+        # Правила достижений — те же объекты, что у движка: поля партий
+        # подставляются массивами, и каждое условие считается сразу для всех
+        games = SimpleNamespace(
+            hours=self.time // 60, minutes=self.time % 60, on_time_streak=self.on_time_streak,
+            partner_streak=self.partner_streak, help_streak=self.help_streak, **self.stats,
+        )
+        day = DayResult(late, scores, success, None)
+        for rule in ACHIEVEMENT_RULES.rules:
+            self.achievements |= np.where(rule.check(games, day), BY_ID[rule.achievement].bit, 0)
+        return success, score, late
+
+    def begin_next_day(self):
+        self.time[:] = DAY_START
+        for stat in ("career", "family", "skills"):
+            self.stats[stat] = np.maximum(0, self.stats[stat] - 1)
+        self.stats["energy"] = np.minimum(10, self.stats["energy"] + 2)
+
+# ========== СВОДКА ==========
+class Summary:
+    """Гистограммы по всем партиям: копятся по пачкам, память не зависит от числа игр"""
+
+    def __init__(self, days):
+        self.days = days
+        self.games = 0
+        self.success = np.zeros((days, 6), dtype=np.int64)
+        self.late = np.zeros(days, dtype=np.int64)
+        self.score = np.zeros(MAX_SCORE, dtype=np.int64)
+        self.day_type_games = np.zeros(len(DAY_TYPES), dtype=np.int64)
+        self.day_type_late = np.zeros(len(DAY_TYPES), dtype=np.int64)
+        self.day_type_success = np.zeros(len(DAY_TYPES), dtype=np.int64)
+        self.path_games = np.zeros(PATH_COUNT, dtype=np.int64)
+        self.path_success = np.zeros(PATH_COUNT, dtype=np.int64)
+        self.path_late = np.zeros(PATH_COUNT, dtype=np.int64)
+
+    def add_day(self, day, day_type, path, success, score, late):
+        self.success[day] += np.bincount(success, minlength=6)
+        self.late[day] += late.sum()
+        self.day_type_games += np.bincount(day_type, minlength=len(DAY_TYPES))
+        self.day_type_late += np.bincount(day_type, weights=late, minlength=len(DAY_TYPES)).astype(np.int64)
+        self.day_type_success += np.bincount(day_type, weights=success, minlength=len(DAY_TYPES)).astype(np.int64)
+        if path is not None:
+            self.path_games += np.bincount(path, minlength=PATH_COUNT)
+            self.path_success += np.bincount(path, weights=success, minlength=PATH_COUNT).astype(np.int64)
+            self.path_late += np.bincount(path, weights=late, minlength=PATH_COUNT).astype(np.int64)
+        if day == self.days - 1:
+            self.games += len(score)
+            self.score += np.bincount(np.minimum(score, MAX_SCORE - 1), minlength=MAX_SCORE)
+
+    def score_percentile(self, q):
+        cumulative = np.cumsum(self.score)
+        return int(np.searchsorted(cumulative, q / 100 * cumulative[-1]))
+
+    def to_dict(self):
+        values = np.arange(MAX_SCORE)
+        result = {
+            "games": int(self.games),
+            "days": self.days,
+            "success_distribution": [
+                {"day": day + 1, "counts": self.success[day].tolist(),
+                 "late_rate": float(self.late[day] / max(1, self.success[day].sum()))}
+                for day in range(self.days)
+            ],
+            "final_score": {
+                "mean": float((self.score * values).sum() / max(1, self.games)),
+                "p5": self.score_percentile(5),
+                "p50": self.score_percentile(50),
+                "p95": self.score_percentile(95),
+                "max": int(np.flatnonzero(self.score).max()) if self.games else 0,
+            },
+            "day_types": {
+                name: {
+                    "days": int(self.day_type_games[i]),
+                    "late_rate": float(self.day_type_late[i] / max(1, self.day_type_games[i])),
+                    "mean_success": float(self.day_type_success[i] / max(1, self.day_type_games[i])),
+                }
+                for i, name in enumerate(DAY_TYPES)
+            },
+        }
+        if self.path_games.any():
+            mean = self.path_success / np.maximum(1, self.path_games)
+            order = np.argsort(-mean, kind="stable")
+            result["paths"] = [
+                {"path": path_name(p), "mean_success": float(mean[p]),
+                 "late_rate": float(self.path_late[p] / max(1, self.path_games[p]))}
+                for p in order
+            ]
+        return result
+
+def simulate(games, days=1, policy="random", seed=0, day_type=None, batch_size=1_000_000):
+    rng = np.random.default_rng(seed)
+    summary = Summary(days)
+    for first in range(0, games, batch_size):
+        batch = Batch(min(batch_size, games - first), rng, policy, first, day_type)
+        for day in range(days):
+            if day:
+                batch.begin_next_day()
+            success, score, late = batch.play_day()
+            path = batch.path if policy == "matrix" else None
+            summary.add_day(day, batch.day_type, path, success, score, late)
+    return summary
+
+# ========== ЭТАЛОН НА ЧИСТОМ ДВИЖКЕ ==========
+def simulate_reference(games, days=1, seed=0, day_type=None):
+    """Те же партии через engine.play_day, по одной — медленно, но без NumPy"""
+    rng = random.Random(seed)
+    summary = Summary(days)
+    choose = lambda state, scene, actions: rng.choice(actions)
+    for _ in range(games):
+        state = GameState()
+        for day in range(days):
+            if day:
+                begin_next_day(state)
+            result = play_day(state, choose, SCENARIO, rng, day_type)
+            code = np.array([DAY_TYPES.index(state.day_type)])
+            summary.add_day(day, code, None, np.array([result.total_success]),
+                            np.array([state.total_score]), np.array([result.late]))
+    return summary
+
+# ========== ЗАПУСК ==========
+def print_summary(title, data, top=5):
+    print(f"\n=== {title}: {data['games']} партий × {data['days']} дн. ===")
+    for row in data["success_distribution"]:
+        total = max(1, sum(row["counts"]))
+        shares = " ".join(f"{k}:{c / total:6.1%}" for k, c in enumerate(row["counts"]))
+        print(f"День {row['day']}: целей {shares} | опоздания {row['late_rate']:.1%}")
+    score = data["final_score"]
+    print(f"Итоговый счёт: среднее {score['mean']:.1f}, p5 {score['p5']}, p50 {score['p50']}, "
+          f"p95 {score['p95']}, максимум {score['max']}")
+    print("Тип дня         дней   опоздания  целей в среднем")
+    for name, row in data["day_types"].items():
+        print(f"{name:<14} {row['days']:>8} {row['late_rate']:>10.1%} {row['mean_success']:>10.2f}")
+    if "paths" in data:
+        print("Лучшие пути:")
+        for row in data["paths"][:top]:
+            print(f"  {row['mean_success']:.2f} целей, опоздания {row['late_rate']:.1%}: {row['path']}")
+        print("Худшие пути:")
+        for row in data["paths"][-top:]:
+            print(f"  {row['mean_success']:.2f} целей, опоздания {row['late_rate']:.1%}: {row['path']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--policy", choices=("random", "matrix"), default="random")
+    parser.add_argument("--day-type", choices=DAY_TYPES, help="играть только этот тип дня")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=1_000_000)
+    parser.add_argument("--reference", type=int, default=0, help="сколько партий сверить с engine.play_day")
+    parser.add_argument("--json", action="store_true", help="вывести сводку в JSON")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    summary = simulate(args.games, args.days, args.policy, args.seed, args.day_type, args.batch_size)
+    elapsed = time.perf_counter() - started
+    result = {"simulation": summary.to_dict(), "seconds": round(elapsed, 3)}
+    if args.reference:
+        if args.policy != "random":
+            parser.error("--reference сверяет только политику random")
+        result["reference"] = simulate_reference(args.reference, args.days, args.seed, args.day_type).to_dict()
+
+    if args.json:
+        json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+    print_summary("NumPy", result["simulation"])
+    print(f"Время: {elapsed:.2f} с ({args.games * args.days / elapsed:,.0f} дней/с)")
+    if args.reference:
+        print_summary("Чистый движок", result["reference"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""Оптимальная стратегия дня: поиск по дереву решений с запоминанием.
+
+День — маленькое дерево: работа → семья → партнёр → транспорт, после каждого
+хода — случайное событие с известной вероятностью. Для состояния
+(сцена, время, карьера, семья, энергия, навыки, виденные события, тип дня)
+считается ожидаемое число целей в итогах дня (как в final_scene) и лучший
+ход; при равенстве целей — больший ожидаемый счёт за показатели.
+
+Таблица считается лениво и кэшируется на диск:
+
+    python solver.py --days 1              # посчитать и сохранить таблицу
+    python solver.py --report              # какие ходы не бывают лучшими
+    python solver.py --report --strict     # код выхода 1, если такие есть
+
+Правила берутся из сценария content/scenario.json (или CONTENT_PATH). В таблице
+отпечаток правил: после правки ходов или событий старый кэш не загрузится
+и будет пересчитан; правка одних текстов таблицу не сбрасывает.
+"""
+import os
+import sys
+import zlib
+import marshal
+import hashlib
+import argparse
+
+from game_state import GameState, DAY_TYPES
+from content import DEFAULT_PATH, load_scenario
+from engine import (
+    STAT_BOUNDS, GOAL_THRESHOLDS, HIGH_STAT, LATE_AFTER, STAT_POINTS, HIGH_STAT_BONUS,
+    DEFAULT_EVENT_CHANCE, LUCKY_DAY_EVENT_CHANCE, event_chance, begin_next_day,
+)
+
+# Бот включает подсказки, только если у его сценария тот же RULES_KEY
+SCENARIO = load_scenario(os.environ.get("CONTENT_PATH", DEFAULT_PATH))
+RULES_KEY = SCENARIO.rules_key
+TRANSITIONS = SCENARIO.transitions
+SCENE_ACTIONS = SCENARIO.scene_actions
+EVENT_CATALOGUE = SCENARIO.events
+EVENTS = tuple(compiled.event for compiled in EVENT_CATALOGUE.events)
+
+STATS = tuple(STAT_BOUNDS)
+TABLE_VERSION = 2
+EPSILON = 1e-9
+
+# Ключ состояния: (сцена, минуты от полуночи, карьера, семья, энергия, навыки,
+# биты виденных событий, группа типа дня)
+SCENE_CODES = {scene: code for code, scene in enumerate(tuple(SCENE_ACTIONS) + ("final",))}
+SCENE_NAMES = {code: scene for scene, code in SCENE_CODES.items()}
+FINAL = SCENE_CODES["final"]
+
+# Тип дня влияет на день только шансом и весами событий. Типы с одинаковыми
+# шансами и весами решаются один раз: в ключе — первый такой тип дня
+_CHANCES = sorted({t.event_chance for t in TRANSITIONS.values() if t.event_chance is not None})
+_PROFILES = [
+    (tuple(event_chance(day_type, c) for c in _CHANCES), EVENT_CATALOGUE.weights[day_type])
+    for day_type in DAY_TYPES
+]
+DAY_TYPE_GROUP = tuple(_PROFILES.index(profile) for profile in _PROFILES)
+
+# Навыки за день только растут: выше HIGH_STAT они больше не меняют ни целей,
+# ни бонусов, а счёт просто сдвигают на STAT_POINTS за очко. Тогда навыки в ключе можно
+# ограничить — на выбор хода это не влияет, а состояний становится меньше
+_SKILL_DELTAS = [t.effects.get("skills", 0) for t in TRANSITIONS.values()]
+_SKILL_DELTAS += [e.effects.get("skills", 0) for e in EVENTS]
+SKILLS_CAP = HIGH_STAT if min(_SKILL_DELTAS) >= 0 and GOAL_THRESHOLDS["skills"] <= HIGH_STAT else None
+
+def rules_fingerprint():
+    rules = (
+        RULES_KEY, sorted(STAT_BOUNDS.items()), sorted(GOAL_THRESHOLDS.items()),
+        HIGH_STAT, LATE_AFTER, STAT_POINTS, HIGH_STAT_BONUS, DEFAULT_EVENT_CHANCE, LUCKY_DAY_EVENT_CHANCE, DAY_TYPES, SKILLS_CAP,
+    )
+    return hashlib.sha1(repr(rules).encode("utf-8")).hexdigest()
+
+def _apply(key, effects):
+    scene, time, career, family, energy, skills, seen, day_type = key
+    values = [career, family, energy, skills]
+    for i, stat in enumerate(STATS):
+        delta = effects.get(stat)
+        if delta:
+            low, high = STAT_BOUNDS[stat]
+            value = max(low, values[i] + delta)
+            values[i] = value if high is None else min(high, value)
+    if SKILLS_CAP is not None:
+        values[3] = min(values[3], SKILLS_CAP)
+    return (scene, time + effects.get("minutes", 0), *values, seen, day_type)
+
+def _final_value(key):
+    _, time, *values, _, _ = key
+    success = (time <= LATE_AFTER) + sum(v >= GOAL_THRESHOLDS[stat] for stat, v in zip(STATS, values))
+    score = STAT_POINTS * sum(values) + HIGH_STAT_BONUS * sum(v >= HIGH_STAT for v in values)
+    return success, score
+
+# ========== РЕШАТЕЛЬ ==========
+class Solver:
+    """Таблица ключ → (ожидаемые цели, ожидаемый счёт, номер лучшего хода).
+
+    Загруженная с диска таблица не меняется; всё, что досчитано на ходу,
+    копится отдельно и сбрасывается, когда вырастает больше max_entries.
+    """
+
+    def __init__(self, max_entries=1_000_000):
+        self.max_entries = max_entries
+        self.base = {}
+        self.table = {}
+        self.fingerprint = rules_fingerprint()
+
+    def __len__(self):
+        return len(self.base) + len(self.table)
+
+    @staticmethod
+    def key(state, scene=None):
+        scene = scene or state.pending_scene
+        skills = state.skills if SKILLS_CAP is None else min(state.skills, SKILLS_CAP)
+        return (
+            SCENE_CODES[scene], state.hours * 60 + state.minutes,
+            state.career, state.family, state.energy, skills,
+            state.events_seen, DAY_TYPE_GROUP[DAY_TYPES.index(state.day_type)],
+        )
+
+    def value(self, key):
+        entry = self.base.get(key) or self.table.get(key)
+        if entry is None:
+            if len(self.table) >= self.max_entries:
+                self.table.clear()
+            entry = self._solve(key)
+        return entry
+
+    def _solve(self, key):
+        if key[0] == FINAL:
+            success, score = _final_value(key)
+            entry = (float(success), float(score), -1)
+        else:
+            q = self.q_values(key)
+            best = 0
+            for i in range(1, len(q)):
+                if _better(q[i], q[best]):
+                    best = i
+            entry = (q[best][0], q[best][1], best)
+        self.table[key] = entry
+        return entry
+
+    def q_values(self, key):
+        """Ожидаемые (цели, счёт) для каждого хода сцены, в порядке кнопок"""
+        scene = SCENE_NAMES[key[0]]
+        day_type = DAY_TYPES[key[7]]
+        result = []
+        for action in SCENE_ACTIONS[scene]:
+            transition = TRANSITIONS[action]
+            after = _apply((SCENE_CODES[transition.next_scene],) + key[1:], transition.effects)
+            success, score, _ = self.value(after)
+            if transition.event_chance is not None:
+                p = event_chance(day_type, transition.event_chance)
+                event_success = event_score = 0.0
+                for compiled, weight, seen in EVENT_CATALOGUE.distribution(day_type, after[6]):
+                    s, c, _ = self.value(_apply(after[:6] + (seen, after[7]), compiled.event.effects))
+                    event_success += weight * s
+                    event_score += weight * c
+                success = (1 - p) * success + p * event_success
+                score = (1 - p) * score + p * event_score
+            result.append((success, score))
+        return result
+
+    def best(self, state, scene=None):
+        """Лучший ход в текущей сцене игрока: (действие, ожидаемые цели, ожидаемый счёт)"""
+        scene = scene or state.pending_scene
+        if scene not in SCENE_ACTIONS:
+            return None
+        return self._answer(state, scene, self.value(self.key(state, scene)))
+
+    def lookup(self, state, scene=None):
+        """Как best, но без поиска: None, если состояния ещё нет в таблице.
+
+        Таблица на диске покрывает первый день; для следующих дней поиск
+        по дереву занимает ~10–15 мс, и бот делает его в отдельном потоке.
+        """
+        scene = scene or state.pending_scene
+        if scene not in SCENE_ACTIONS:
+            return None
+        key = self.key(state, scene)
+        entry = self.base.get(key) or self.table.get(key)
+        return None if entry is None else self._answer(state, scene, entry)
+
+    def _answer(self, state, scene, entry):
+        success, score, index = entry
+        if SKILLS_CAP is not None and state.skills > SKILLS_CAP:
+            score += STAT_POINTS * (state.skills - SKILLS_CAP)
+        return SCENE_ACTIONS[scene][index], success, score
+
+    # ---------- Предрасчёт и кэш на диске ----------
+    def precompute(self, days=1):
+        """Решает все состояния, достижимые из новой игры за days дней при любом типе дня"""
+        starts = {self.key(GameState(), "work")[1:7]}
+        solved = set()
+        for _ in range(days):
+            next_starts = set()
+            for start in starts - solved:
+                for code in sorted(set(DAY_TYPE_GROUP)):
+                    root = (SCENE_CODES["work"],) + start + (code,)
+                    self.value(root)
+                    next_starts |= self._day_ends(root)
+            solved |= starts
+            starts = next_starts
+        return len(self)
+
+    def _day_ends(self, root):
+        # Все итоговые состояния дня, достижимые из root, → начала следующего дня
+        ends = set()
+        frontier = {root}
+        seen_keys = set()
+        while frontier:
+            key = frontier.pop()
+            if key in seen_keys:
+                continue
+            seen_keys.add(key)
+            if key[0] == FINAL:
+                state = _state_from_key(key)
+                begin_next_day(state)
+                ends.add(self.key(state, "work")[1:7])
+                continue
+            for action in SCENE_ACTIONS[SCENE_NAMES[key[0]]]:
+                transition = TRANSITIONS[action]
+                after = _apply((SCENE_CODES[transition.next_scene],) + key[1:], transition.effects)
+                frontier.add(after)
+                if transition.event_chance is not None:
+                    day_type = DAY_TYPES[key[7]]
+                    for compiled, _, seen in EVENT_CATALOGUE.distribution(day_type, after[6]):
+                        frontier.add(_apply(after[:6] + (seen, after[7]), compiled.event.effects))
+        return ends
+
+    def save(self, path):
+        table = dict(self.base)
+        table.update(self.table)
+        payload = marshal.dumps((TABLE_VERSION, self.fingerprint, table))
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(zlib.compress(payload, 6))
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        """Загружает таблицу; False, если файла нет или он посчитан для других правил"""
+        try:
+            with open(path, "rb") as f:
+                version, fingerprint, table = marshal.loads(zlib.decompress(f.read()))
+        except (OSError, ValueError, EOFError, TypeError, zlib.error):
+            return False
+        if version != TABLE_VERSION or fingerprint != self.fingerprint:
+            return False
+        self.base = table
+        return True
+
+    # ---------- Доминируемые ходы ----------
+    def dominance_report(self):
+        """Для каждой сцены: как часто ход лучший и какими ходами он доминируется"""
+        report = {}
+        for key in list(self.base) + list(self.table):
+            if key[0] == FINAL:
+                continue
+            scene = SCENE_NAMES[key[0]]
+            actions = SCENE_ACTIONS[scene]
+            if len(actions) < 2:
+                continue
+            q = self.q_values(key)
+            info = report.setdefault(scene, {
+                "states": 0,
+                "optimal": dict.fromkeys(actions, 0),
+                # dominated[a][b]: b ни разу не хуже a и хоть раз лучше
+                "dominated": {a: {b: [True, False] for b in actions if b != a} for a in actions},
+            })
+            info["states"] += 1
+            best = max(range(len(q)), key=lambda i: (q[i][0], q[i][1]))
+            for i, action in enumerate(actions):
+                if not _better(q[best], q[i]):
+                    info["optimal"][action] += 1
+                for j, other in enumerate(actions):
+                    if i == j:
+                        continue
+                    flags = info["dominated"][action][other]
+                    if _better(q[i], q[j]):
+                        flags[0] = False
+                    elif _better(q[j], q[i]):
+                        flags[1] = True
+
+        for info in report.values():
+            info["dominated"] = {
+                action: [other for other, (never_worse, sometimes_better) in by.items()
+                         if never_worse and sometimes_better]
+                for action, by in info["dominated"].items()
+            }
+        return report
+
+def _better(a, b):
+    if a[0] > b[0] + EPSILON:
+        return True
+    return abs(a[0] - b[0]) <= EPSILON and a[1] > b[1] + EPSILON
+
+def _state_from_key(key):
+    state = GameState()
+    _, time, state.career, state.family, state.energy, state.skills, seen, code = key
+    state.hours, state.minutes = divmod(time, 60)
+    state.events_seen = seen
+    state.day_type = DAY_TYPES[code]
+    return state
+
+# ========== ЗАПУСК ==========
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--table", default=os.environ.get("SOLVER_TABLE_PATH", "solver_table.bin"))
+    parser.add_argument("--days", type=int, default=1, help="сколько первых дней посчитать заранее")
+    parser.add_argument("--report", action="store_true", help="показать ходы, которые не бывают лучшими")
+    parser.add_argument("--strict", action="store_true", help="с --report: код выхода 1 при доминируемых ходах")
+    args = parser.parse_args()
+
+    solver = Solver()
+    if solver.load(args.table):
+        print(f"Таблица загружена: {len(solver)} состояний")
+    else:
+        solver.precompute(args.days)
+        solver.save(args.table)
+        print(f"Таблица посчитана и сохранена в {args.table}: {len(solver)} состояний")
+
+    start = GameState()
+    start.pending_scene = "work"
+    for day_type in DAY_TYPES:
+        start.day_type = day_type
+        action, success, score = solver.best(start)
+        print(f"{day_type:<14} первый ход {action:<14} ожидаемые цели {success:.2f}, счёт за показатели {score:.0f}")
+
+    if not args.report:
+        return
+    problems = 0
+    for scene, info in solver.dominance_report().items():
+        print(f"\n{scene}: {info['states']} состояний")
+        for action, count in info["optimal"].items():
+            dominated_by = info["dominated"][action]
+            note = f", доминируется: {', '.join(dominated_by)}" if dominated_by else ""
+            if count == 0 or dominated_by:
+                problems += 1
+            print(f"  {action:<18} лучший в {count / info['states']:6.1%}{note}")
+    if args.strict and problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import os
+import sys
+import importlib
+
+import pytest
+
+# Модули бота лежат в корне репозитория, без пакета
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Бот читает настройки при импорте: память вместо базы, без кэша сценария на диске
+BOT_ENV = {
+    "BOT_TOKEN": "123456:TEST",
+    "STATE_BACKEND": "memory",
+    "CONTENT_CACHE_PATH": "",
+    "CARDS_ENABLED": "0",
+    "HINTS_ENABLED": "0",
+    "METRICS_ENABLED": "0",
+}
+
+
+@pytest.fixture(scope="session")
+def bot():
+    """Модуль bot, импортированный с BOT_ENV; окружение процесса после импорта прежнее"""
+    with pytest.MonkeyPatch.context() as patch:
+        for key in ("STATE_MAX_ENTRIES", "STATE_IDLE_TIMEOUT", "LEADERBOARD_URL", "RECORD_PATH"):
+            patch.delenv(key, raising=False)
+        for key, value in BOT_ENV.items():
+            patch.setenv(key, value)
+        sys.modules.pop("bot", None)
+        module = importlib.import_module("bot")
+    yield module
+    sys.modules.pop("bot", None)
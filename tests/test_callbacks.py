@@ -0,0 +1,116 @@
+import os
+import asyncio
+from types import SimpleNamespace
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+import render
+from render import pack_callback, unpack_callback, stamp, SEQ_MODULO
+
+
+def test_pack_unpack_round_trip():
+    for seq in (0, 1, 0xAB, SEQ_MODULO - 1):
+        for action in ("start_day", "show_top", "a" * 61):
+            data = pack_callback(seq, action)
+            assert unpack_callback(data) == (seq, action)
+            assert len(data.encode("utf-8")) <= 64
+
+
+def test_unstamped_data_is_accepted_as_is():
+    assert unpack_callback(None) == (None, None)
+    assert unpack_callback("start_day") == (None, "start_day")
+    assert unpack_callback("zz:start_day") == (None, "zz:start_day")
+    assert unpack_callback("abc:start_day") == (None, "abc:start_day")
+
+
+def test_stamp_marks_callback_buttons_only():
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("Дальше", callback_data="start_day")],
+        [InlineKeyboardButton("Канал", url="https://t.me/example")],
+    ])
+    stamped = stamp(keyboard, 7)
+    first, second = stamped.inline_keyboard
+    assert unpack_callback(first[0].callback_data) == (7, "start_day")
+    assert second[0].url == "https://t.me/example" and second[0].callback_data is None
+
+
+def test_stamped_keyboard_is_built_once_per_seq():
+    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("Дальше", callback_data="start_day")]])
+    stamped = stamp(keyboard, 7)
+    assert stamp(keyboard, 7) is stamped
+    assert stamp(keyboard, 8) is not stamped
+
+
+class FakeQuery:
+    """Нажатие кнопки: записывает всё, что бот с ним сделал"""
+
+    def __init__(self, user_id):
+        self.calls = []
+        self.from_user = SimpleNamespace(id=user_id)
+        self.message = SimpleNamespace(chat_id=user_id, message_id=1, reply_text=self._recorder("reply_text"))
+        self.answer = self._recorder("answer")
+        self.edit_message_text = self._recorder("edit_message_text")
+        self._bot = SimpleNamespace(
+            edit_message_reply_markup=self._recorder("edit_message_reply_markup"),
+            send_message=self._recorder("send_message"),
+        )
+
+    def _recorder(self, name):
+        async def call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+        return call
+
+    def get_bot(self):
+        return self._bot
+
+
+def press(bot, user_id, seq, action):
+    query = FakeQuery(user_id)
+    asyncio.run(bot.process_callback(None, None, query, user_id, action, seq))
+    return query
+
+
+def new_player(bot, user_id):
+    state = bot.new_game("Тест", seed=user_id, seq=40)
+    state.checked_subscription = True
+    bot.state_store.put(user_id, state)
+    return state
+
+
+def test_stale_button_changes_nothing(bot):
+    state = new_player(bot, 1001)
+    before = bot.dump_state(state)
+
+    query = press(bot, 1001, (state.seq - 1) % SEQ_MODULO, "start_day")
+    assert query.calls == [("answer", (render.STALE_BUTTON,), {})]
+    assert bot.dump_state(bot.state_store.get(1001)) == before
+
+
+def test_current_button_makes_the_move(bot):
+    state = new_player(bot, 1002)
+
+    query = press(bot, 1002, state.seq, "start_day")
+    assert state.seq == 41
+    assert state.pending_scene == "work"
+    assert ("answer", (), {}) in query.calls
+    # Кнопки новой сцены помечены уже новым номером хода
+    markup = next(kwargs["reply_markup"] for name, _, kwargs in query.calls if "reply_markup" in kwargs)
+    assert all(unpack_callback(button.callback_data)[0] == 41
+               for row in markup.inline_keyboard for button in row if button.callback_data)
+
+    # Второе нажатие той же клавиатуры — уже устаревшее
+    query = press(bot, 1002, 40, "start_day")
+    assert query.calls == [("answer", (render.STALE_BUTTON,), {})]
+    assert state.seq == 41
+
+
+def test_button_without_seq_is_not_checked(bot):
+    state = new_player(bot, 1003)
+
+    press(bot, 1003, None, "start_day")
+    assert state.seq == 41
+
+
+def test_bot_settings_do_not_leak_into_the_environment(bot):
+    assert bot.BOT_TOKEN == "123456:TEST"
+    assert os.environ.get("BOT_TOKEN") != "123456:TEST"
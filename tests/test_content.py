@@ -0,0 +1,112 @@
+import os
+import copy
+import json
+import marshal
+
+import pytest
+
+from content import (
+    DEFAULT_PATH, CACHE_VERSION, MAX_ACTION_BYTES, ContentError, load_scenario, read_source,
+)
+
+BASE = read_source(DEFAULT_PATH)
+
+
+def write(tmp_path, raw, name="scenario.json"):
+    path = tmp_path / name
+    path.write_text(json.dumps(raw, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+def broken(tmp_path, change):
+    raw = copy.deepcopy(BASE)
+    change(raw)
+    with pytest.raises(ContentError) as error:
+        load_scenario(write(tmp_path, raw))
+    return str(error.value)
+
+
+def first_scene(raw):
+    return next(iter(raw["scenes"]))
+
+
+def test_default_scenario_loads(tmp_path):
+    scenario = load_scenario(write(tmp_path, BASE))
+    assert "start_day" in scenario.transitions
+    assert scenario.scene_actions and scenario.events.events
+
+
+def test_unknown_scene_is_rejected(tmp_path):
+    def change(raw):
+        raw["scenes"]["party"] = copy.deepcopy(raw["scenes"][first_scene(raw)])
+    assert "неизвестная сцена" in broken(tmp_path, change)
+
+
+def test_action_leading_to_unknown_scene_is_rejected(tmp_path):
+    def change(raw):
+        raw["actions"]["start_day"]["next"] = "party"
+    assert "'party'" in broken(tmp_path, change)
+
+
+def test_unknown_event_is_rejected(tmp_path):
+    def change(raw):
+        raw["events"]["meteor"] = {"text": "Метеорит", "effects": {}}
+    assert "неизвестное событие" in broken(tmp_path, change)
+
+
+def test_long_action_id_is_rejected(tmp_path):
+    long_id = "a" * (MAX_ACTION_BYTES + 1)
+
+    def change(raw):
+        raw["actions"][long_id] = dict(raw["actions"]["start_day"])
+    assert f"длиннее {MAX_ACTION_BYTES} байт" in broken(tmp_path, change)
+
+    # Ограничение — в байтах: кириллица занимает по два
+    def change_cyrillic(raw):
+        raw["actions"]["ш" * (MAX_ACTION_BYTES // 2 + 1)] = dict(raw["actions"]["start_day"])
+    assert "длиннее" in broken(tmp_path, change_cyrillic)
+
+
+def test_colon_in_action_id_is_rejected(tmp_path):
+    def change(raw):
+        raw["actions"]["go:home"] = dict(raw["actions"]["start_day"])
+    assert "двоеточие" in broken(tmp_path, change)
+
+
+@pytest.mark.parametrize("text", ["Привет, {player}", "Сейчас {time", "{0}"])
+def test_bad_placeholder_is_rejected(tmp_path, text):
+    def change(raw):
+        raw["scenes"][first_scene(raw)]["texts"] = [text]
+    assert "ошибка подстановки" in broken(tmp_path, change)
+
+
+def test_cache_is_used_until_the_file_changes(tmp_path):
+    path = write(tmp_path, BASE)
+    cache_path = str(tmp_path / "scenario.cache")
+    scene = first_scene(BASE)
+    load_scenario(path, cache_path)
+    assert os.path.exists(cache_path)
+
+    # Пока файл тот же, сценарий собирается из кэша, а не из файла
+    with open(cache_path, "rb") as f:
+        version, source, stamp, data = marshal.loads(f.read())
+    assert version == CACHE_VERSION
+    data["scenes"][scene]["texts"] = ["из кэша"]
+    with open(cache_path, "wb") as f:
+        f.write(marshal.dumps((version, source, stamp, data)))
+    assert load_scenario(path, cache_path).scene_texts[scene] == ("из кэша",)
+
+    # Правка файла меняет (mtime_ns, size) — кэш устарел и не читается
+    raw = copy.deepcopy(BASE)
+    raw["scenes"][scene]["texts"] = ["новый текст"]
+    write(tmp_path, raw)
+    mtime = stamp[0] + 10**9
+    os.utime(path, ns=(mtime, mtime))
+    assert load_scenario(path, cache_path).scene_texts[scene] == ("новый текст",)
+
+    # Испорченный файл не прячется за старым кэшем
+    raw["actions"]["start_day"]["next"] = "party"
+    write(tmp_path, raw)
+    os.utime(path, ns=(mtime + 10**9, mtime + 10**9))
+    with pytest.raises(ContentError):
+        load_scenario(path, cache_path)
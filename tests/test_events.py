@@ -0,0 +1,113 @@
+import math
+import random
+from collections import Counter
+
+import pytest
+
+from engine import AliasTable, Event, EventCatalogue
+from game_state import EVENT_IDS, DAY_TYPES
+from content import DEFAULT_PATH, load_scenario, read_source
+
+SAMPLES = 100_000
+
+
+def assert_frequencies(counts, expected, samples):
+    """Частоты в пределах пяти стандартных отклонений от ожидаемых вероятностей"""
+    assert set(counts) <= {key for key, p in expected.items() if p > 0}
+    for key, p in expected.items():
+        tolerance = 5 * math.sqrt(p * (1 - p) / samples) + 1e-12
+        assert abs(counts[key] / samples - p) <= tolerance, (key, counts[key] / samples, p)
+
+
+@pytest.mark.parametrize("weights", [[1], [1, 1, 1], [5, 1, 0, 3], [0.1, 10, 2.5, 0, 7, 1]])
+def test_alias_table_encodes_the_weights_exactly(weights):
+    table = AliasTable(weights)
+    n, total = len(weights), sum(weights)
+    implied = [table.prob[i] / n for i in range(n)]
+    for i in range(n):
+        if table.alias[i] != i:
+            implied[table.alias[i]] += (1 - table.prob[i]) / n
+    assert implied == pytest.approx([w / total for w in weights])
+
+
+def test_alias_table_samples_by_weight():
+    weights = [5, 1, 0, 3, 0.5]
+    table = AliasTable(weights)
+    rng = random.Random(17)
+    counts = Counter(table.sample(rng) for _ in range(SAMPLES))
+    assert_frequencies(counts, {i: w / sum(weights) for i, w in enumerate(weights)}, SAMPLES)
+
+
+def test_alias_table_needs_a_positive_weight():
+    with pytest.raises(ValueError):
+        AliasTable([0, 0])
+    with pytest.raises(ValueError):
+        AliasTable([])
+
+
+def catalogue():
+    ids = EVENT_IDS[:4]
+    return EventCatalogue((
+        Event(ids[0], {}, None, 4),
+        Event(ids[1], {}, None, 1, {"lucky_day": 6}),
+        Event(ids[2], {}, None, 2, {"family_crisis": 0}),
+        Event(ids[3], {}, None, 0, {"career_crisis": 3}),
+    ))
+
+
+@pytest.mark.parametrize("day_type", DAY_TYPES)
+def test_pick_follows_the_day_weights(day_type):
+    events = catalogue()
+    weights = events.weights[day_type]
+    rng = random.Random(day_type)
+    counts = Counter(events.pick(day_type, 0, rng)[0].event.id for _ in range(SAMPLES))
+    expected = {c.event.id: w / sum(weights) for c, w in zip(events.events, weights)}
+    assert_frequencies(counts, expected, SAMPLES)
+
+
+@pytest.mark.parametrize("seen_events", [(0,), (0, 1), (1, 2), (0, 3)])
+def test_seen_events_are_excluded(seen_events):
+    events = catalogue()
+    seen = sum(events.events[i].bit for i in seen_events)
+    weights = events.weights["normal"]
+    available = {c.event.id: w for i, (c, w) in enumerate(zip(events.events, weights)) if i not in seen_events}
+    rng = random.Random(len(seen_events))
+
+    counts = Counter()
+    for _ in range(SAMPLES):
+        chosen, new_seen = events.pick("normal", seen, rng)
+        assert not seen & chosen.bit
+        assert new_seen == seen | chosen.bit
+        counts[chosen.event.id] += 1
+    # Среди невиденных — по тем же весам, в том числе когда перебросы кончились
+    total = sum(available.values())
+    assert_frequencies(counts, {event_id: w / total for event_id, w in available.items()}, SAMPLES)
+    # distribution() — ровно та же картина, что выдаёт pick
+    assert {c.event.id: p for c, p, _ in events.distribution("normal", seen)} == pytest.approx(
+        {event_id: w / total for event_id, w in available.items() if w > 0})
+
+
+def test_cycle_restarts_when_every_event_was_seen():
+    events = catalogue()
+    rng = random.Random(3)
+    seen = 0
+    picked = []
+    # Событие с нулевым весом в обычный день не выпадает, поэтому цикл — из трёх
+    for _ in range(9):
+        chosen, seen = events.pick("normal", seen, rng)
+        picked.append(chosen.event.id)
+    assert len(set(picked)) == 3
+    assert set(picked[:3]) == set(picked[3:6]) == set(picked[6:])
+
+
+def test_scenario_events_follow_the_file():
+    # Таблица весов собрана из weight/day_weights сценария без искажений
+    raw = read_source(DEFAULT_PATH)["events"]
+    events = load_scenario(DEFAULT_PATH).events
+    rng = random.Random(11)
+    for day_type in DAY_TYPES:
+        weights = {event_id: (spec.get("day_weights") or {}).get(day_type, spec.get("weight", 1))
+                   for event_id, spec in raw.items()}
+        total = sum(weights.values())
+        counts = Counter(events.pick(day_type, 0, rng)[0].event.id for _ in range(SAMPLES // 4))
+        assert_frequencies(counts, {e: w / total for e, w in weights.items()}, SAMPLES // 4)
@@ -0,0 +1,50 @@
+import pytest
+
+from game_state import GameState, SCENES, DAY_TYPES, dump_state, load_state
+
+
+def fields(state):
+    return {name: getattr(state, name) for name in GameState.__slots__}
+
+
+def test_new_state_round_trip():
+    state = GameState()
+    assert fields(load_state(dump_state(state))) == fields(state)
+
+
+def test_every_field_round_trips():
+    state = GameState()
+    state.career, state.family, state.energy, state.skills = 10, 0, 7, 300
+    state.hours, state.minutes = 18, 41
+    state.day, state.total_score, state.days_completed = 12, 1870, 11
+    state.day_type = DAY_TYPES[-1]
+    state.checked_subscription = True
+    state.current_scene = SCENES[-1]
+    state.pending_scene = "transport"
+    state.achievements = (1 << 13) - 1
+    state.events_seen = 0b1011
+    state.on_time_streak, state.partner_streak, state.help_streak = 255, 3, 1
+    state.day_marks = 0b11
+    state.player_name = "Мария 🎓"
+    state.rng = (1 << 64) - 1
+    state.seq = 255
+
+    loaded = load_state(dump_state(state))
+    assert fields(loaded) == fields(state)
+    assert loaded.day_type == DAY_TYPES[-1]
+    assert loaded.pending_scene == "transport"
+
+
+def test_long_name_is_cut_on_a_character_boundary():
+    state = GameState()
+    state.player_name = "я" * 200   # 400 байт в UTF-8
+    name = load_state(dump_state(state)).player_name
+    assert name == "я" * 127
+    assert len(name.encode("utf-8")) <= 255
+
+
+def test_unknown_version_is_rejected():
+    data = bytearray(dump_state(GameState()))
+    data[0] = 0xFF
+    with pytest.raises(ValueError):
+        load_state(bytes(data))
@@ -0,0 +1,301 @@
+import os
+import asyncio
+
+import pytest
+
+from game_state import GameState, dump_state, load_state
+from journal import read_frames, ACTION, encode_action, _FRAME
+from leaderboard import Leaderboard
+from storage import JournalStateStore
+
+
+# Повтор хода для тестов: то же, что делает ход вживую, только по зерну
+def replay(states, user_id, action, seed, payload):
+    if action == "start":
+        state = states[user_id] = GameState()
+        state.player_name = payload.decode("utf-8")
+        return True
+    state = states.get(user_id)
+    if state is None:
+        return False
+    state.total_score += seed % 100
+    state.seq = (state.seq + 1) % 256
+    return True
+
+
+def open_store(directory, **options):
+    store = JournalStateStore(str(directory), dump_state, load_state, replay, commit_interval=3600, fsync=False,
+                              **options)
+    leaderboard = Leaderboard()
+    store.attach_table(leaderboard)
+    return store, leaderboard
+
+
+def move(store, leaderboard, user_id, action, seed, payload=b""):
+    state = store.get(user_id)
+    states = {user_id: state} if state is not None else {}
+    assert replay(states, user_id, action, seed, payload)
+    state = states[user_id]
+    store.put(user_id, state)
+    store.record(user_id, action, seed, payload)
+    leaderboard.record(user_id, state.player_name, state.total_score)
+
+
+def play(store, leaderboard, players, moves, first_seed=0):
+    for user_id in players:
+        if store.get(user_id) is None:
+            move(store, leaderboard, user_id, "start", 0, f"игрок {user_id}".encode("utf-8"))
+    for i in range(moves):
+        for user_id in players:
+            move(store, leaderboard, user_id, "step", first_seed + i * 7 + user_id)
+
+
+async def crash(store):
+    """Всё принятое сброшено в журнал, но снимка при остановке нет"""
+    await store.flush()
+    store._commit_task.cancel()
+    store.journal.close()
+
+
+def snapshot_of(store):
+    return {user_id: dump_state(store.get(user_id)) for user_id in all_users(store)}
+
+
+def all_users(store):
+    users = set(store._states)
+    if store.journal.snapshot is not None:
+        users.update(store.journal.snapshot.ids)
+    return users
+
+
+def last_segment(directory):
+    names = sorted(n for n in os.listdir(directory) if n.startswith("journal-"))
+    return os.path.join(directory, names[-1])
+
+
+def test_recovery_after_crash_replays_the_journal(tmp_path):
+    async def run():
+        store, leaderboard = open_store(tmp_path)
+        await store.start()
+        play(store, leaderboard, range(1, 21), 5)
+        expected, scores = snapshot_of(store), leaderboard.top(50)
+        await crash(store)
+
+        recovered, recovered_board = open_store(tmp_path)
+        await recovered.start()
+        assert recovered.replayed == 20 + 20 * 5
+        assert snapshot_of(recovered) == expected
+        assert recovered_board.top(50) == scores
+        await recovered.close()
+    asyncio.run(run())
+
+
+def test_recovery_combines_snapshot_and_later_journal(tmp_path):
+    async def run():
+        store, leaderboard = open_store(tmp_path)
+        await store.start()
+        play(store, leaderboard, range(1, 11), 3)
+        await store._snapshot_now()
+        play(store, leaderboard, range(5, 16), 2, first_seed=1000)
+        expected = snapshot_of(store)
+        await crash(store)
+
+        recovered, _ = open_store(tmp_path)
+        await recovered.start()
+        # Из журнала повторены только ходы после снимка
+        assert recovered.replayed == 5 + 11 * 2
+        assert snapshot_of(recovered) == expected
+        await recovered.close()
+    asyncio.run(run())
+
+
+def test_clean_shutdown_needs_no_replay(tmp_path):
+    async def run():
+        store, leaderboard = open_store(tmp_path)
+        await store.start()
+        play(store, leaderboard, range(1, 6), 4)
+        expected = snapshot_of(store)
+        await store.close()
+
+        recovered, _ = open_store(tmp_path)
+        await recovered.start()
+        assert recovered.replayed == 0
+        # Состояния читаются из снимка только при обращении
+        assert recovered.cold == 5
+        assert snapshot_of(recovered) == expected
+        await recovered.close()
+    asyncio.run(run())
+
+
+class HalfWrite:
+    """Файл сегмента, на котором пачка обрывается посреди записи"""
+
+    def __init__(self, f, truncate=True):
+        self.f = f
+        self.can_truncate = truncate
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+    def write(self, data):
+        self.f.write(bytes(data[:len(data) // 2]))
+        raise OSError("нет места на диске")
+
+    def truncate(self, size):
+        if not self.can_truncate:
+            raise OSError("truncate не удался")
+        return self.f.truncate(size)
+
+
+def test_failed_batch_is_rolled_back_and_written_once(tmp_path):
+    async def run():
+        store, leaderboard = open_store(tmp_path)
+        await store.start()
+        play(store, leaderboard, range(1, 4), 2)
+        await store.flush()
+        play(store, leaderboard, range(1, 4), 2, first_seed=100)
+        pending = store.journal.pending
+
+        segment = store.journal._file
+        store.journal._file = HalfWrite(segment)
+        with pytest.raises(OSError):
+            await store.journal.commit()
+        # Недописанное срезано, пачка ждёт следующего сброса целиком
+        assert store.journal.pending == pending
+        assert not store.journal.torn
+        store.journal._file = segment
+        expected = snapshot_of(store)
+        await crash(store)
+
+        recovered, _ = open_store(tmp_path)
+        await recovered.start()
+        assert recovered.replayed == 3 + 3 * 4
+        assert snapshot_of(recovered) == expected
+        await recovered.close()
+    asyncio.run(run())
+
+
+def test_unrecoverable_tail_is_covered_by_the_next_snapshot(tmp_path):
+    async def run():
+        store, leaderboard = open_store(tmp_path)
+        await store.start()
+        play(store, leaderboard, range(1, 4), 2)
+
+        segment = store.journal._file
+        store.journal._file = HalfWrite(segment, truncate=False)
+        with pytest.raises(OSError):
+            await store.flush()
+        assert store.journal.torn
+        store.journal._file = segment
+        # Пока хвост под подозрением, в журнал не пишем: ходы ждут снимка
+        play(store, leaderboard, [1], 1, first_seed=50)
+        await store.flush()
+        await store._snapshot_now()
+        assert not store.journal.torn
+        expected = snapshot_of(store)
+        await crash(store)
+
+        recovered, _ = open_store(tmp_path)
+        await recovered.start()
+        assert recovered.replayed == 0
+        assert snapshot_of(recovered) == expected
+        await recovered.close()
+    asyncio.run(run())
+
+
+def test_torn_tail_keeps_every_complete_record(tmp_path):
+    async def run():
+        store, leaderboard = open_store(tmp_path)
+        await store.start()
+        play(store, leaderboard, range(1, 4), 3)
+        expected = snapshot_of(store)
+        await crash(store)
+
+        # Падение посреди записи: от следующей пачки на диск попала половина кадра
+        body = encode_action(1, 0.0, 99, "step")
+        frame = _FRAME.pack(len(body), 0, ACTION) + body
+        with open(last_segment(tmp_path), "ab") as f:
+            f.write(frame[:len(frame) // 2])
+
+        recovered, recovered_board = open_store(tmp_path)
+        await recovered.start()
+        assert snapshot_of(recovered) == expected
+        # Оборванный хвост ушёл вместе со старым сегментом; новые ходы пишутся дальше
+        play(recovered, recovered_board, [1], 1, first_seed=500)
+        expected = snapshot_of(recovered)
+        await crash(recovered)
+
+        again, _ = open_store(tmp_path)
+        await again.start()
+        assert snapshot_of(again) == expected
+        await again.close()
+    asyncio.run(run())
+
+
+def test_corrupted_record_stops_reading(tmp_path):
+    async def run():
+        store, leaderboard = open_store(tmp_path)
+        await store.start()
+        play(store, leaderboard, [1], 2)
+        await crash(store)
+
+        segment = last_segment(tmp_path)
+        records = len(list(read_frames(segment)))
+        with open(segment, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes((last[0] ^ 0xFF,)))
+        # Последняя запись не сходится с crc32 — читаются все, кроме неё
+        assert len(list(read_frames(segment))) == records - 1
+    asyncio.run(run())
+
+
+def test_resident_states_stay_under_the_cap(tmp_path):
+    async def run():
+        store, leaderboard = open_store(tmp_path, max_entries=10, evict_grace=0)
+        await store.start()
+        play(store, leaderboard, range(1, 41), 2)
+        # До снимка все изменены — их байтов на диске ещё нет
+        assert store.evict() == 0
+        await store._snapshot_now()
+        store.evict()
+        assert len(store._states) <= 10
+        expected = snapshot_of(store)
+
+        # Чтения поднимают игроков из снимка, вытеснение держит их число в пределах
+        for user_id in range(1, 41):
+            assert dump_state(store.get(user_id)) == expected[user_id]
+            store.evict()
+            assert len(store._states) <= 10
+        assert len(store) == 40 and store.cold == 40 - len(store._states)
+
+        # Походившие после снимка остаются в памяти до следующего
+        play(store, leaderboard, range(1, 16), 1, first_seed=300)
+        store.evict()
+        assert set(range(1, 16)) <= set(store._states)
+        expected = snapshot_of(store)
+        await store._snapshot_now()
+        store.evict()
+        assert len(store._states) <= 10
+        assert snapshot_of(store) == expected
+        await crash(store)
+
+        recovered, _ = open_store(tmp_path)
+        await recovered.start()
+        assert snapshot_of(recovered) == expected
+        await recovered.close()
+    asyncio.run(run())
+
+
+def test_recently_used_states_are_not_evicted(tmp_path):
+    async def run():
+        store, leaderboard = open_store(tmp_path, max_entries=2, idle_timeout=3600, evict_grace=30)
+        await store.start()
+        play(store, leaderboard, range(1, 6), 1)
+        await store._snapshot_now()
+        # Все тронуты только что — объект может быть ещё в руках у обработчика
+        assert store.evict() == 0
+        assert len(store._states) == 5
+        await store.close()
+    asyncio.run(run())
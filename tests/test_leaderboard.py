@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+from leaderboard import Board, Leaderboard, USER_ID_MASK, _key, _unkey, current_day
+
+DAY = 86400
+
+
+@pytest.mark.parametrize("score", [-7, -1, 0, 1, 2**31, 2**62])
+@pytest.mark.parametrize("user_id", [0, 1, 2**32, 2**63, USER_ID_MASK])
+def test_packed_key_round_trip(score, user_id):
+    assert _unkey(_key(score, user_id)) == (score, user_id)
+
+
+def test_packed_key_order_matches_tuple_order():
+    # Упакованное целое сортируется как (-счёт, user_id): счёт по убыванию, при равенстве — меньший id
+    rng = random.Random(1)
+    pairs = [(rng.choice([0, 1, 5, 2**40, -3]), rng.choice([0, 7, 2**53, USER_ID_MASK])) for _ in range(500)]
+    assert sorted(pairs, key=lambda p: _key(*p)) == sorted(pairs, key=lambda p: (-p[0], p[1]))
+
+
+def test_top_and_rank_with_ties():
+    board = Board({10: 500, 3: 500, 7: 900, 1: 100})
+    assert board.top(10) == [(7, 900), (3, 500), (10, 500), (1, 100)]
+    assert [board.rank(user_id) for user_id in (7, 3, 10, 1)] == [(1, 900), (2, 500), (3, 500), (4, 100)]
+    assert board.rank(99) is None
+
+
+def test_rank_after_resubmit():
+    board = Board()
+    for user_id, score in ((1, 300), (2, 200), (3, 100)):
+        board.submit(user_id, score)
+    # Худший счёт не портит лучший
+    assert not board.submit(1, 50)
+    assert board.rank(1) == (1, 300)
+    # Лучший счёт переносит игрока, старый ключ не остаётся в индексе
+    assert board.submit(3, 301)
+    assert board.rank(3) == (1, 301) and board.rank(1) == (2, 300)
+    assert len(board.index) == len(board) == 3
+    assert board.top(2) == [(3, 301), (1, 300)]
+
+
+def test_daily_board_rolls_over_at_utc_midnight():
+    now = [10 * DAY + DAY - 1]   # 23:59:59 UTC
+    board = Leaderboard(clock=lambda: now[0])
+    board.record(1, "Аня", 400)
+    board.record(2, "Боря", 300)
+    assert board.top(5, daily=True) == [("Аня", 400), ("Боря", 300)]
+
+    now[0] += 1   # 00:00:00 следующих суток
+    board.record(2, "Боря", 250)
+    assert board.top(5, daily=True) == [("Боря", 250)]
+    assert board.top(5) == [("Аня", 400), ("Боря", 300)]
+    assert board.standing(1, daily=True) is None
+    assert board.standing(2, daily=True) == (1, 250, 1)
+    assert board.counts() == (2, 1)
+
+
+def test_saved_rows_keep_only_todays_daily_scores():
+    now = [20 * DAY + 100]
+    board = Leaderboard(clock=lambda: now[0])
+    board.record(1, "Аня", 400)
+    now[0] += DAY
+    board.record(2, "Боря", 300)
+    rows = {row[0]: row for row in board.collect()}
+    assert rows[2] == (2, "Боря", 300, current_day(now[0]), 300)
+    assert board.collect() == []
+
+    # Строка со вчерашним днём попадает только в общий рейтинг
+    loaded = Leaderboard(clock=lambda: now[0])
+    loaded.load([(1, "Аня", 400, current_day(now[0]) - 1, 400), rows[2]])
+    assert loaded.top(5) == [("Аня", 400), ("Боря", 300)]
+    assert loaded.top(5, daily=True) == [("Боря", 300)]
@@ -0,0 +1,140 @@
+import heapq
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import RetryAfter
+
+import outbox
+from outbox import Outbox, TokenBucket, PRIORITY_ECHO
+
+
+class FakeClock:
+    """Виртуальное время: сон не ждёт, а двигает часы к ближайшему пробуждению"""
+
+    def __init__(self):
+        self.now = 0.0
+        self._sleepers = []
+        self._seq = itertools.count()
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._sleepers, (self.now + max(0.0, seconds), next(self._seq), waiter))
+        await waiter
+
+    async def run(self, main):
+        task = asyncio.create_task(main)
+        while not task.done():
+            # Даём всем готовым задачам дойти до сна, потом переводим часы
+            for _ in range(50):
+                await asyncio.sleep(0)
+            if task.done() or not self._sleepers:
+                continue
+            # Недостача токена в пределах округления даёт сон короче шага float —
+            # такие часы сдвигаем на наносекунду, иначе время не пойдёт
+            deadline = self._sleepers[0][0]
+            self.now = deadline if deadline > self.now else self.now + 1e-9
+            while self._sleepers and self._sleepers[0][0] <= self.now:
+                waiter = heapq.heappop(self._sleepers)[2]
+                if not waiter.done():
+                    waiter.set_result(None)
+        return task.result()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(outbox, "time", SimpleNamespace(monotonic=clock.monotonic, perf_counter=clock.monotonic))
+    monkeypatch.setattr(outbox, "asyncio", SimpleNamespace(
+        sleep=clock.sleep, get_running_loop=asyncio.get_running_loop, create_task=asyncio.create_task,
+    ))
+    return clock
+
+
+def send(box, clock, sent, chat_id, endpoint="sendMessage", priority=None, label=None):
+    async def callback():
+        sent.append((clock.now, label if label is not None else chat_id))
+        return True
+    return box.process_request(callback, (), {}, endpoint, {"chat_id": chat_id}, priority)
+
+
+def test_token_bucket_pause_delays_the_next_token():
+    bucket = TokenBucket(1.0, 3)
+    bucket.updated = 0.0
+    assert bucket.reserve(0.0) == 0
+    bucket.pause(0.0, 5.0)
+    assert bucket.reserve(0.0) == pytest.approx(5.0)
+
+
+def test_global_rate_holds_across_chats(clock):
+    box = Outbox(global_rate=10, chat_rate=100, chat_burst=100)
+    sent = []
+
+    async def main():
+        await asyncio.gather(*(send(box, clock, sent, chat_id) for chat_id in range(50)))
+        await box.shutdown()
+    asyncio.run(clock.run(main()))
+
+    times = sorted(t for t, _ in sent)
+    assert len(times) == 50
+    # Запас — 10 сообщений сразу, дальше не больше 10 в секунду, хотя чаты все разные
+    for i, t in enumerate(times):
+        assert t >= (i + 1 - 10) / 10 - 1e-9
+    assert times[-1] == pytest.approx(4.0)
+
+
+def test_answers_and_scenes_go_before_bulk_sends(clock):
+    box = Outbox(global_rate=1, chat_rate=100, chat_burst=100)
+    sent = []
+
+    async def main():
+        # Первый запрос забирает единственный токен, остальные ждут в очереди
+        await send(box, clock, sent, 0, label="first")
+        queued = [asyncio.create_task(send(box, clock, sent, 100 + i, priority=PRIORITY_ECHO, label="echo"))
+                  for i in range(3)]
+        await asyncio.sleep(0)
+        queued.append(asyncio.create_task(send(box, clock, sent, 1, "editMessageText", label="scene")))
+        await asyncio.sleep(0)
+        queued.append(asyncio.create_task(send(box, clock, sent, 2, "answerCallbackQuery", label="answer")))
+        await asyncio.gather(*queued)
+        await box.shutdown()
+    asyncio.run(clock.run(main()))
+
+    # Ответ на нажатие не расходует бюджет сообщений и уходит сразу,
+    # сцена обгоняет эхо, поставленное в очередь раньше неё
+    assert sent == [(0.0, "first"), (0.0, "answer"), (1.0, "scene"),
+                    (2.0, "echo"), (3.0, "echo"), (4.0, "echo")]
+
+
+def test_retry_after_pauses_only_the_affected_chat(clock):
+    box = Outbox(global_rate=100, chat_rate=10, chat_burst=10, backoff=0.1)
+    sent = []
+    attempts = []
+
+    async def flooded():
+        attempts.append(clock.now)
+        if len(attempts) == 1:
+            raise RetryAfter(5)
+        sent.append((clock.now, "A"))
+        return True
+
+    async def main():
+        first = asyncio.create_task(box.process_request(flooded, (), {}, "sendMessage", {"chat_id": "A"}, None))
+        await clock.sleep(0.5)
+        later = send(box, clock, sent, "A", label="A-later")
+        other = send(box, clock, sent, "B")
+        await asyncio.gather(first, later, other)
+        await box.shutdown()
+    asyncio.run(clock.run(main()))
+
+    sent = dict((label, t) for t, label in sent)
+    # Чат A молчит 5 секунд после 429: и повтор, и новый запрос ждут паузу
+    assert attempts[1] >= 5.0
+    assert sent["A-later"] >= 5.0
+    # Соседний чат паузу не замечает
+    assert sent["B"] == pytest.approx(0.5)
+    assert box.flood_waits == 1 and box.failed == 0
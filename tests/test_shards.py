@@ -0,0 +1,30 @@
+import shards
+from shards import worker_env, shard_path
+
+
+def test_worker_env_splits_the_global_budget(monkeypatch):
+    monkeypatch.setattr(shards, "SHARDS", 4)
+    base = {"OUTBOX_GLOBAL_RATE": "30", "OUTBOX_CHAT_RATE": "1", "STATE_DB_PATH": "data/states.db"}
+    envs = [worker_env(i, base) for i in range(4)]
+
+    # Вместе шарды шлют не больше, чем разрешено всему боту
+    assert sum(float(env["OUTBOX_GLOBAL_RATE"]) for env in envs) == 30
+    # Чат живёт в одном шарде — его бюджет не делится
+    assert all(env["OUTBOX_CHAT_RATE"] == "1" for env in envs)
+    assert [env["STATE_DB_PATH"] for env in envs] == [shard_path("data/states.db", i) for i in range(4)]
+    assert len({env["WEBHOOK_PORT"] for env in envs}) == 4
+    assert all(env["SHARD_COUNT"] == "4" for env in envs)
+    # Окружение диспетчера не меняется
+    assert base["OUTBOX_GLOBAL_RATE"] == "30"
+
+
+def test_worker_env_uses_the_default_budget(monkeypatch):
+    monkeypatch.setattr(shards, "SHARDS", 3)
+    assert float(worker_env(0, {})["OUTBOX_GLOBAL_RATE"]) == 10
+
+
+def test_shard_of_is_stable_and_in_range():
+    owners = [shards.shard_of(user_id, 4) for user_id in range(1, 4001)]
+    assert owners == [shards.shard_of(user_id, 4) for user_id in range(1, 4001)]
+    assert set(owners) == {0, 1, 2, 3}
+    assert all(850 < owners.count(shard) < 1150 for shard in range(4))
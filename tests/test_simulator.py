@@ -0,0 +1,73 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import simulator  # noqa: E402
+from simulator import Batch, SCENE_INDEX, PATH_COUNT, PATH_RADIX, STATS  # noqa: E402
+from engine import play_day, begin_next_day  # noqa: E402
+from game_state import GameState, DAY_TYPES  # noqa: E402
+
+DAYS = 5
+
+
+class NoEvents:
+    """rng движка, у которого бросок события всегда мимо"""
+
+    def random(self):
+        return 1.0
+
+
+def path_choice(path):
+    def choose(state, scene, actions):
+        s = SCENE_INDEX[scene]
+        if len(actions) == 1:
+            return actions[0]
+        return actions[(path // PATH_RADIX[s]) % len(actions)]
+    return choose
+
+
+def test_matrix_games_match_the_engine(monkeypatch):
+    # Без событий ход партии задан путём и типом дня — сверяем каждую партию точно
+    monkeypatch.setattr(Batch, "_roll_events", lambda self, idx, chance: None)
+    games = PATH_COUNT * len(DAY_TYPES)
+    batch = Batch(games, np.random.default_rng(0), "matrix")
+    days = []
+    for day in range(DAYS):
+        if day:
+            batch.begin_next_day()
+        success, score, late = batch.play_day()
+        days.append((success.copy(), score.copy(), late.copy(), batch.achievements.copy(),
+                     {stat: batch.stats[stat].copy() for stat in STATS}))
+
+    for g in range(games):
+        path, day_type = g % PATH_COUNT, DAY_TYPES[(g // PATH_COUNT) % len(DAY_TYPES)]
+        state, choose = GameState(), path_choice(path)
+        for day, (success, score, late, achievements, stats) in enumerate(days):
+            if day:
+                begin_next_day(state)
+            result = play_day(state, choose, simulator.SCENARIO, NoEvents(), day_type)
+            where = f"партия {g}, день {day + 1}: {simulator.path_name(path)}, {day_type}"
+            assert result.total_success == success[g], where
+            assert result.late == late[g], where
+            assert state.total_score == score[g], where
+            assert state.achievements == achievements[g], where
+            assert {stat: getattr(state, stat) for stat in STATS} == {s: v[g] for s, v in stats.items()}, where
+
+
+def test_random_policy_matches_the_reference():
+    # С событиями партии расходятся по броскам — сверяем распределения
+    games = 4000
+    numpy_run = simulator.simulate(games, days=2, seed=1).to_dict()
+    reference = simulator.simulate_reference(games, days=2, seed=1).to_dict()
+
+    def mean_success(data, day):
+        counts = data["success_distribution"][day]["counts"]
+        return sum(k * c for k, c in enumerate(counts)) / sum(counts)
+
+    for day in range(2):
+        assert abs(mean_success(numpy_run, day) - mean_success(reference, day)) < 0.15
+        assert abs(numpy_run["success_distribution"][day]["late_rate"]
+                   - reference["success_distribution"][day]["late_rate"]) < 0.05
+    assert abs(numpy_run["final_score"]["mean"] - reference["final_score"]["mean"]) \
+        < 0.05 * reference["final_score"]["mean"]
+
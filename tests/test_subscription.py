@@ -0,0 +1,122 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+
+class FakeBot:
+    """get_chat_member с подсчётом вызовов; ответ задаётся статусом или исключением"""
+
+    def __init__(self, status="member"):
+        self.status = status
+        self.calls = 0
+        self.gate = None
+
+    async def get_chat_member(self, chat_id, user_id):
+        self.calls += 1
+        if self.gate is not None:
+            await self.gate.wait()
+        if isinstance(self.status, Exception):
+            raise self.status
+        return SimpleNamespace(status=self.status)
+
+
+@pytest.fixture
+def clock(bot, monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(bot, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def cache(bot):
+    return bot.SubscriptionCache(positive_ttl=600, negative_ttl=5, max_size=100)
+
+
+def test_positive_answer_lives_for_the_positive_ttl(cache, clock):
+    api = FakeBot("member")
+
+    async def main():
+        assert await cache.get(1, api)
+        clock.now += 599
+        assert await cache.get(1, api)
+        assert api.calls == 1
+        clock.now += 2
+        assert await cache.get(1, api)
+        assert api.calls == 2
+    asyncio.run(main())
+    assert cache.hits == 1 and cache.misses == 2
+
+
+def test_negative_answer_expires_quickly(cache, clock):
+    api = FakeBot("left")
+
+    async def main():
+        assert not await cache.get(1, api)
+        clock.now += 4
+        assert not await cache.get(1, api)
+        assert api.calls == 1
+        # Подписался — через negative_ttl бот это увидит
+        api.status = "member"
+        clock.now += 2
+        assert await cache.get(1, api)
+        assert api.calls == 2
+    asyncio.run(main())
+
+
+def test_concurrent_lookups_share_one_call(cache, clock):
+    api = FakeBot("administrator")
+
+    async def main():
+        api.gate = asyncio.Event()
+        cache.prefetch(1, api)
+        waiting = [asyncio.create_task(cache.get(1, api)) for _ in range(5)]
+        await asyncio.sleep(0)
+        api.gate.set()
+        assert await asyncio.gather(*waiting) == [True] * 5
+        assert api.calls == 1
+        assert cache.coalesced == 5
+        assert not cache._inflight
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_lookup(cache, clock):
+    api = FakeBot("member")
+
+    async def main():
+        api.gate = asyncio.Event()
+        first = asyncio.create_task(cache.get(1, api))
+        second = asyncio.create_task(cache.get(1, api))
+        await asyncio.sleep(0)
+        first.cancel()
+        api.gate.set()
+        assert await second
+        assert api.calls == 1
+        assert cache.cached(1) is True
+    asyncio.run(main())
+
+
+def test_failed_lookup_is_not_cached(cache, clock):
+    api = FakeBot(ConnectionError("Telegram недоступен"))
+
+    async def main():
+        assert not await cache.get(1, api)
+        assert cache.cached(1) is None
+        api.status = "creator"
+        assert await cache.get(1, api)
+        assert api.calls == 2
+    asyncio.run(main())
+    assert cache.errors == 1
+
+
+def test_cache_size_is_bounded(bot, clock):
+    cache = bot.SubscriptionCache(positive_ttl=600, negative_ttl=5, max_size=3)
+    api = FakeBot("member")
+
+    async def main():
+        for user_id in range(10):
+            await cache.get(user_id, api)
+    asyncio.run(main())
+    assert cache.stats()["size"] == 3
+    # Вытесняются самые старые записи
+    assert [cache.cached(user_id) for user_id in (0, 9)] == [None, True]
@@ -0,0 +1,145 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import userlocks
+from userlocks import UserLocks, ClickDeduplicator, InFlight
+
+
+def test_lock_map_is_empty_after_concurrent_holders():
+    locks = UserLocks()
+    inside = []
+    order = []
+
+    async def click(user_id, n):
+        async with locks.hold(user_id):
+            inside.append(user_id)
+            # Одного игрока в замке держит не больше одного обработчика
+            assert inside.count(user_id) == 1
+            await asyncio.sleep(0)
+            order.append((user_id, n))
+            inside.remove(user_id)
+
+    async def main():
+        await asyncio.gather(*(click(user_id, n) for n in range(5) for user_id in (1, 2, 3)))
+        assert len(locks) == 0
+    asyncio.run(main())
+
+    # Нажатия одного игрока идут в порядке поступления
+    assert [n for user_id, n in order if user_id == 1] == list(range(5))
+    assert locks.contended > 0
+
+
+def test_cancelled_waiter_does_not_leak_its_lock():
+    locks = UserLocks()
+
+    async def main():
+        release = asyncio.Event()
+
+        async def holder():
+            async with locks.hold(7):
+                await release.wait()
+
+        async def waiter():
+            async with locks.hold(7):
+                pass
+
+        first = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        second = asyncio.create_task(waiter())
+        await asyncio.sleep(0)
+        second.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await second
+        release.set()
+        await first
+        assert len(locks) == 0
+    asyncio.run(main())
+
+
+def test_duplicate_click_is_dropped_only_inside_the_ttl(monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(userlocks, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    clicks = ClickDeduplicator(ttl=2.0)
+    # Ключ сообщения — (message_id, edit_date): правка сообщения даёт новую версию
+    message = (55, 1700000000)
+
+    assert not clicks.is_duplicate(1, message, "01:start_day")
+    clock.now += 1.5
+    assert clicks.is_duplicate(1, message, "01:start_day")
+    # Другая кнопка, другая версия сообщения и другой игрок — не повторы
+    assert not clicks.is_duplicate(1, message, "01:work_quality")
+    assert not clicks.is_duplicate(1, (55, 1700000005), "01:start_day")
+    assert not clicks.is_duplicate(2, message, "01:start_day")
+    clock.now += 0.6
+    # Окно первого нажатия истекло — то же нажатие принимается снова
+    assert not clicks.is_duplicate(1, message, "01:start_day")
+    assert clicks.dropped == 1
+
+
+def test_deduplicator_forgets_expired_and_excess_clicks(monkeypatch):
+    clock = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(userlocks, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    clicks = ClickDeduplicator(ttl=1.0, max_size=3)
+    for message_id in range(5):
+        clicks.is_duplicate(1, message_id, "x")
+    assert len(clicks) == 3
+    clock.now = 5.0
+    clicks.is_duplicate(1, 99, "x")
+    assert len(clicks) == 1
+
+
+def test_drain_waits_for_handlers_and_spawned_tasks(bot, monkeypatch):
+    in_flight = InFlight()
+    monkeypatch.setattr(bot, "in_flight", in_flight)
+    done = []
+
+    async def main():
+        application = SimpleNamespace(update_queue=asyncio.Queue())
+
+        async def card():
+            await asyncio.sleep(0.02)
+            done.append("card")
+
+        async def handler():
+            with in_flight.track():
+                await asyncio.sleep(0.01)
+                # Фоновая задача появляется уже во время остановки
+                in_flight.spawn(card)
+                done.append("handler")
+
+        asyncio.create_task(handler())
+        await asyncio.sleep(0)
+        assert await bot.drain(application, timeout=5)
+        assert len(in_flight) == 0
+    asyncio.run(main())
+    assert done == ["handler", "card"]
+
+
+def test_drain_cancels_what_does_not_finish_in_time(bot, monkeypatch):
+    in_flight = InFlight()
+    monkeypatch.setattr(bot, "in_flight", in_flight)
+
+    async def main():
+        application = SimpleNamespace(update_queue=asyncio.Queue())
+        await application.update_queue.put("не начатое обновление")
+
+        async def stuck():
+            with in_flight.track():
+                await asyncio.sleep(3600)
+
+        task = asyncio.create_task(stuck())
+        await asyncio.sleep(0)
+        assert not await bot.drain(application, timeout=0.05)
+        # Прерванный обработчик завершается тихо, очередь вычищена
+        await task
+        assert not task.cancelled()
+        assert in_flight.cancelled == 1
+        assert application.update_queue.empty()
+
+        # После cancel_all новые обработчики прерываются до первого шага
+        late = asyncio.create_task(stuck())
+        await late
+        assert in_flight.cancelled == 2
+    asyncio.run(main())
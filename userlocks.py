@@ -0,0 +1,163 @@
+import time
+import asyncio
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# ========== ПООЧЕРЕДНАЯ ОБРАБОТКА ОДНОГО ИГРОКА ==========
+class UserLocks:
+    """Замок на каждого игрока: обновления одного игрока идут строго по
+    очереди, разные игроки обрабатываются параллельно.
+
+    Замок живёт, пока его кто-то держит или ждёт, — память не растёт с
+    числом игроков, заходивших когда-либо.
+    """
+
+    def __init__(self):
+        self._locks = {}   # user_id -> [asyncio.Lock, сколько держат или ждут]
+        self.contended = 0
+
+    def __len__(self):
+        return len(self._locks)
+
+    def hold(self, user_id):
+        return _UserLockGuard(self, user_id)
+
+    async def _acquire(self, user_id):
+        entry = self._locks.get(user_id)
+        if entry is None:
+            entry = self._locks[user_id] = [asyncio.Lock(), 0]
+        elif entry[0].locked():
+            self.contended += 1
+        entry[1] += 1
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._forget(user_id, entry)
+            raise
+
+    def _release(self, user_id):
+        entry = self._locks[user_id]
+        entry[0].release()
+        self._forget(user_id, entry)
+
+    def _forget(self, user_id, entry):
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._locks[user_id]
+
+
+class _UserLockGuard:
+    __slots__ = ("_locks", "_user_id")
+
+    def __init__(self, locks, user_id):
+        self._locks = locks
+        self._user_id = user_id
+
+    async def __aenter__(self):
+        await self._locks._acquire(self._user_id)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._locks._release(self._user_id)
+
+# ========== ПОДАВЛЕНИЕ ПОВТОРНЫХ НАЖАТИЙ ==========
+class ClickDeduplicator:
+    """Помнит недавние нажатия (игрок, сообщение, кнопка) ttl секунд.
+
+    Повтор того же нажатия в этом окне — двойной тап или повторная доставка
+    — отбрасывается до того, как тронуть состояние или Bot API.
+    """
+
+    def __init__(self, ttl=2.0, max_size=100000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._seen = OrderedDict()   # ключ -> момент истечения, по возрастанию
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._seen)
+
+    def is_duplicate(self, user_id, message_id, data):
+        """True, если такое нажатие уже было недавно; иначе запоминает его"""
+        now = time.monotonic()
+        self._expire(now)
+        key = (user_id, message_id, data)
+        if key in self._seen:
+            self.dropped += 1
+            return True
+        self._seen[key] = now + self.ttl
+        if len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+        return False
+
+    def _expire(self, now):
+        # ttl у всех записей одинаковый, поэтому просроченные всегда в начале
+        seen = self._seen
+        while seen:
+            key, expires = next(iter(seen.items()))
+            if expires > now:
+                break
+            del seen[key]
+
+# ========== ОБРАБОТЧИКИ В РАБОТЕ ==========
+class InFlight:
+    """Нажатия, которые обрабатываются прямо сейчас.
+
+    При остановке бот ждёт, пока они закончатся, а по истечении срока
+    прерывает оставшиеся через cancel_all(). Прерванный обработчик
+    завершается тихо: для Application обновление обработано, и его
+    остановка не ждёт зависший вызов. Новые обработчики после cancel_all()
+    прерываются на первом же await — до того, как тронуть состояние.
+    """
+
+    def __init__(self):
+        self._tasks = set()
+        self._cancelling = False
+        self.cancelled = 0
+
+    def __len__(self):
+        return len(self._tasks)
+
+    @contextmanager
+    def track(self):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        if self._cancelling:
+            task.cancel()
+        try:
+            yield
+        except asyncio.CancelledError:
+            if not self._cancelling:
+                raise
+            self.cancelled += 1
+            # Отмена погашена здесь — снимаем её и с задачи
+            if hasattr(task, "uncancel"):
+                task.uncancel()
+        finally:
+            self._tasks.discard(task)
+
+    def spawn(self, func, *args):
+        """Запускает func(*args) отдельной задачей, не дожидаясь её.
+
+        Для работы, которую нажатию незачем ждать под замком игрока
+        (например, картинка после текста сцены): остановка ждёт такую
+        задачу наравне с обработчиками и прерывает её так же.
+        """
+        async def run():
+            with self.track():
+                await func(*args)
+
+        task = asyncio.create_task(run())
+        # Учтена сразу, а не с первого шага задачи — иначе drain её не увидит
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def wait(self):
+        """Ждёт, пока не закончатся все учтённые задачи, включая новые"""
+        while self._tasks:
+            await asyncio.wait(list(self._tasks))
+
+    def cancel_all(self):
+        self._cancelling = True
+        for task in list(self._tasks):
+            task.cancel()
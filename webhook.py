@@ -0,0 +1,247 @@
+import json
+import hmac
+import asyncio
+import logging
+from collections import deque
+
+from telegram import Update
+
+MAX_BODY_SIZE = 1024 * 1024
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+# ========== МИНИМАЛЬНЫЙ HTTP-СЕРВЕР ==========
+class HttpServer:
+    """HTTP/1.1 поверх asyncio без внешних зависимостей.
+
+    Понимает ровно то, что нужно вебхуку и локальным стендам: запросы с
+    Content-Length и keep-alive. handler(method, path, headers, body)
+    возвращает (статус, content-type, тело в байтах).
+    """
+
+    def __init__(self, handler, host="127.0.0.1", port=8080):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self._server = None
+        self._connections = set()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve_connection, self.host, self.port)
+        # Порт 0 — значит, ОС выбрала свободный порт; запоминаем настоящий
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        # Закрытие сервера не трогает открытые keep-alive соединения — закрываем их сами
+        for writer in list(self._connections):
+            writer.close()
+
+    async def _serve_connection(self, reader, writer):
+        self._connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode("latin-1").split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_SIZE:
+                    await self._respond(writer, 413, "text/plain", b"too large", keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                try:
+                    status, content_type, payload = await self.handler(method, target, headers, body)
+                except Exception as e:
+                    logging.error(f"Ошибка обработки HTTP-запроса {method} {target}: {e}")
+                    status, content_type, payload = 500, "text/plain", b"error"
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, content_type, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, content_type, payload, keep_alive):
+        head = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + payload)
+        await writer.drain()
+
+# ========== КЛИЕНТ ДЛЯ ЛОКАЛЬНЫХ СЛУЖБ ==========
+class HttpConnection:
+    """Одно keep-alive соединение к HttpServer с конвейером запросов.
+
+    Запросы пишутся в сокет сразу, не дожидаясь ответов на предыдущие;
+    HttpServer отвечает на них по порядку, и ответы разбираются одной
+    задачей-читателем. Так сотни параллельных пересылок идут по одному
+    соединению без очереди на каждый ответ. При обрыве все ждущие запросы
+    получают ConnectionError, следующий запрос переподключается.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._writer = None
+        self._reader_task = None
+        self._waiters = deque()
+        self._lock = None
+
+    async def _connect(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._writer is not None:
+                return
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError as e:
+                raise ConnectionError(f"{self.host}:{self.port} недоступен: {e}") from e
+            self._writer = writer
+            self._reader_task = asyncio.create_task(self._read_responses(reader, writer))
+
+    async def request(self, method, path, body=b"", content_type="application/json"):
+        """→ (статус, тело ответа)"""
+        if self._writer is None:
+            await self._connect()
+        writer = self._writer
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+            f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            # Обрыв увидит и читатель — он и завершит waiter ошибкой
+            pass
+        return await waiter
+
+    async def _read_responses(self, reader, writer):
+        error = ConnectionError(f"{self.host}:{self.port}: соединение закрыто")
+        try:
+            while True:
+                status_line = await reader.readline()
+                if not status_line:
+                    break
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode("latin-1").split(":", 1)
+                    if name.strip().lower() == "content-length":
+                        length = int(value)
+                payload = await reader.readexactly(length) if length else b""
+                waiter = self._waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result((int(status_line.split()[1]), payload))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, IndexError) as e:
+            error = ConnectionError(f"{self.host}:{self.port}: {e!r}")
+        finally:
+            if self._writer is writer:
+                self._writer = None
+            writer.close()
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if not waiter.done():
+                    waiter.set_exception(error)
+
+    async def close(self):
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.close()
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+
+# ========== ВЕБХУК TELEGRAM ==========
+class WebhookServer(HttpServer):
+    """Принимает обновления от Telegram и кладёт их в очередь Application.
+
+    Ответ 200 уходит сразу после постановки в очередь — обработку ведёт сам
+    Application, параллельно до concurrent_updates обновлений.
+    GET /health отдаёт JSON для балансировщика. recorder (recorder.Recorder)
+    получает тело каждого принятого обновления как есть — без повторной сериализации.
+    """
+
+    def __init__(self, application, host, port, path, secret_token=None, health=None, recorder=None):
+        super().__init__(self._route, host, port)
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token
+        self.health = health
+        self.recorder = recorder
+        # Бот останавливается: новые обновления не берём, балансировщику — 503
+        self.draining = False
+        self.accepted = 0
+        self.rejected = 0
+
+    async def _route(self, method, target, headers, body):
+        path = target.split("?", 1)[0]
+        if path == "/health":
+            if method != "GET":
+                return 405, "text/plain", b"method not allowed"
+            info = self.health() if self.health else {"status": "ok"}
+            if self.draining:
+                info = dict(info, status="draining")
+            status = 200 if info.get("status") == "ok" else 503
+            return status, "application/json", json.dumps(info).encode("utf-8")
+
+        if path != self.path:
+            return 404, "text/plain", b"not found"
+        if method != "POST":
+            return 405, "text/plain", b"method not allowed"
+        if self.draining:
+            return 503, "text/plain", b"shutting down"
+        if self.secret_token:
+            received = headers.get("x-telegram-bot-api-secret-token", "")
+            if not hmac.compare_digest(received, self.secret_token):
+                self.rejected += 1
+                return 403, "text/plain", b"forbidden"
+
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            self.rejected += 1
+            logging.error(f"Некорректное обновление в вебхуке: {e}")
+            return 400, "text/plain", b"bad update"
+
+        if self.recorder is not None:
+            self.recorder.record_raw(body)
+        await self.application.update_queue.put(update)
+        self.accepted += 1
+        return 200, "text/plain", b"ok"